@@ -0,0 +1,67 @@
+"""Пропускная способность эмбеддингов запросов с микробатчингом и без: python benchmarks/bench_embedding_batching.py
+
+Движок моделируется задержкой: постоянная часть вызова (HTTP-запрос или
+накладные расходы модели) плюс время на каждый текст. Вызовы выполняются
+по одному, как у локальной модели, занимающей все ядра CPU.
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import embeddings  # noqa: E402
+
+CALL_MS = 40
+PER_TEXT_MS = 1
+REQUESTS_PER_THREAD = 20
+
+
+class SimulatedBackend(embeddings.StubEmbeddingBackend):
+    name = 'simulated'
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self._busy = threading.Lock()
+
+    def encode(self, texts):
+        texts = embeddings._as_texts(texts)
+        with self._busy:
+            self.calls += 1
+            time.sleep((CALL_MS + PER_TEXT_MS * len(texts)) / 1000)
+        return super().encode(texts)
+
+
+def run(threads, batching):
+    backend = SimulatedBackend()
+    embeddings.set_backend(backend)
+    embeddings.EMBEDDING_BATCH_WAIT_MS = 5 if batching else 0
+    embeddings.batcher = embeddings.EmbeddingBatcher(lambda texts: backend.encode(texts), max_wait_ms=5)
+
+    def worker(n):
+        for i in range(REQUESTS_PER_THREAD):
+            embeddings.embed(f"запрос {n} {i}")
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return threads * REQUESTS_PER_THREAD / elapsed, backend.calls, embeddings.batcher
+
+
+def main():
+    print(f"{'потоков':>8} {'без батчей, зап/с':>18} {'с батчами, зап/с':>17} {'вызовов движка':>15} {'средний батч':>13}")
+    for threads in (1, 4, 16, 64):
+        plain, _, _ = run(threads, batching=False)
+        batched, calls, batcher = run(threads, batching=True)
+        print(f"{threads:>8} {plain:>18.0f} {batched:>17.0f} {calls:>15} {batcher.batch_sizes.snapshot()['mean']:>13.1f}")
+    print("\nгистограмма ожидания в очереди, мс (64 потока):", batcher.wait_ms.snapshot()['buckets'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Время импорта модулей сервиса: python benchmarks/bench_import_time.py
+
+Каждый модуль импортируется в отдельном процессе с python -X importtime,
+сеть в нем запрещена. Импорт должен укладываться в IMPORT_TIME_BUDGET_MS,
+не ходить в сеть и не загружать torch, sentence_transformers и pandas:
+модель, датасет и эмбеддинги загружаются при старте сервера (warm_up()),
+а не при импорте. При нарушении скрипт завершается с кодом 1, поэтому его
+можно запускать как проверку на регрессию.
+"""
+import os
+import re
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['route_explainer', 'bot', 'telegram_bot']
+FORBIDDEN = ['torch', 'sentence_transformers', 'pandas']
+RUNS = 5
+IMPORT_TIME_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', 1000))
+
+PROBE = """
+import socket, sys
+def _no_network(*args, **kwargs):
+    raise RuntimeError("сетевой запрос при импорте")
+socket.socket.connect = _no_network
+socket.create_connection = _no_network
+import {module}
+print(','.join(name for name in {forbidden!r} if name in sys.modules))
+"""
+
+_LINE = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+def import_time(module):
+    """Время импорта module в мс (по -X importtime) и тяжелые модули, загруженные вместе с ним"""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module, forbidden=FORBIDDEN)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"импорт {module} завершился ошибкой:\n{process.stderr[-2000:]}")
+    # Строки идут в порядке завершения импорта: зависимости модуля (отступ на уровень
+    # глубже) печатаются перед ним самим
+    children = []
+    for line in process.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        microseconds, depth, name = int(match.group(1)), len(match.group(2)), match.group(3)
+        if depth == 1 and name == module:
+            break
+        if depth == 1:
+            children = []
+        elif depth == 3:
+            children.append((name, microseconds))
+    heavy = [name for name in process.stdout.strip().split(',') if name]
+    return microseconds / 1000, heavy, sorted(children, key=lambda item: -item[1])[:4]
+
+
+def main():
+    failed = False
+    print(f"{'модуль':>16} {'медиана, мс':>12}  крупнейшие зависимости")
+    for module in MODULES:
+        runs = [import_time(module) for _ in range(RUNS)]
+        median = np.median([elapsed for elapsed, _, _ in runs])
+        _, heavy, top = runs[-1]
+        print(f"{module:>16} {median:>12.0f}  {', '.join(f'{name} {ms / 1000:.0f}' for name, ms in top)}")
+        if heavy:
+            print(f"  ❌ при импорте загружены: {', '.join(heavy)}")
+            failed = True
+        if median > IMPORT_TIME_BUDGET_MS:
+            print(f"  ❌ дольше бюджета {IMPORT_TIME_BUDGET_MS:.0f} мс")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Автомат и подстраховка LLMClient на заглушке модели: python benchmarks/bench_llm_resilience.py
+
+1. Модель отвечает 503 на все запросы: время запроса без автомата (все
+   повторы до отказа) и с ним (после размыкания — сразу запасной ответ),
+   затем модель восстанавливается и пробный запрос замыкает автомат.
+2. У 5% ответов дополнительная пауза: p50/p99 без подстраховки и с ней.
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from llm_client import LLMClient, LLMError  # noqa: E402
+from stub_llm_server import StubLLMServer  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "1. Кремль (Памятники, 40 мин)"}]
+
+
+def timed_chat(client):
+    started = time.perf_counter()
+    try:
+        client.chat(MESSAGES, max_retries=3)
+    except LLMError:
+        pass
+    return time.perf_counter() - started
+
+
+def breaker_run(server):
+    server.fail_rate, server.slow_rate = 1.0, 0
+    print(f"{'':>14} {'среднее, с':>11} {'обращений к модели':>19}")
+    for name, breaker in (('без автомата', CircuitBreaker(min_calls=10 ** 9)),
+                          ('с автоматом', CircuitBreaker(min_calls=5, open_for=1))):
+        client = LLMClient('stub', 'stub-model', api_url=server.url, backoff_base=0.1, breaker=breaker)
+        before = server.requests
+        elapsed = [timed_chat(client) for _ in range(30)]
+        print(f"{name:>14} {np.mean(elapsed):>11.3f} {server.requests - before:>19}")
+
+    server.fail_rate = 0
+    time.sleep(1)
+    print(f"\nпосле восстановления: {breaker.state} -> ", end='')
+    timed_chat(client)
+    print(breaker.state, client.stats()['breaker'])
+
+
+def hedge_run(server):
+    server.fail_rate, server.slow_rate, server.slow_delay = 0, 0.05, 1.0
+    print(f"\n{'':>18} {'p50, с':>7} {'p99, с':>7} {'обращений':>10}")
+    for name, quantile in (('без подстраховки', 0), ('с подстраховкой', 0.9)):
+        client = LLMClient('stub', 'stub-model', api_url=server.url, hedge_quantile=quantile)
+        with ThreadPoolExecutor(4) as pool:
+            list(pool.map(lambda _: timed_chat(client), range(40)))
+            before = server.requests
+            elapsed = list(pool.map(lambda _: timed_chat(client), range(400)))
+        print(f"{name:>18} {np.percentile(elapsed, 50):>7.2f} {np.percentile(elapsed, 99):>7.2f} "
+              f"{server.requests - before:>10}")
+    stats = client.stats()
+    print(f"\nзадержка подстраховки {stats['hedge_delay']} с, выиграл дубль {stats['hedge_win_rate']:.0%}")
+
+
+def main():
+    server = StubLLMServer(token_delay=0, first_token_delay=0.1).start()
+    breaker_run(server)
+    hedge_run(server)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Доля попаданий в кэш маршрутов на воспроизведенном логе запросов: python benchmarks/bench_route_cache_keys.py
+
+Лог синтетический: несколько популярных точек старта с разбросом в сотни
+метров и запросы с вариациями регистра и пробелов. Каждый запрос проходит
+конвейер до стадии explain, затем сравниваются прежний ключ кэша и ключ с
+ячейкой сетки. «Чужое» попадание — маршрут, впервые построенный для старта
+дальше WRONG_HIT_M от текущего.
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('EMBEDDING_BACKEND', 'stub')
+
+import hashlib  # noqa: E402
+
+import route_explainer as app  # noqa: E402
+from geo import M_PER_DEG, haversine_m  # noqa: E402
+
+REQUESTS = 400
+WRONG_HIT_M = 1500
+HOTSPOTS = [
+    (56.328437, 44.003111),  # Кремль
+    (56.321880, 44.000930),  # Большая Покровская
+    (56.320650, 43.946030),  # Московский вокзал
+    (56.331910, 44.025550),  # Верхне-Волжская набережная
+    (56.302060, 43.980960),  # Парк Швейцария
+]
+QUERIES = [
+    "Хочу прогуляться по парку и посмотреть памятники",
+    "Ищу хороший ресторан с кофе и десертами",
+    "Посетить музей и выставку искусства",
+    "Прогуляться по набережной Волги",
+    "Что-то историческое и архитектурное",
+]
+DURATIONS = [(1, 30), (2, 0), (3, 0)]
+SKIP_STAGES = {'explain', 'serialize'}
+
+
+def legacy_cache_key(places, user_interests, total_duration):
+    """Ключ до учета начальной точки и нормализации запроса"""
+    places_hash = hashlib.md5(
+        ''.join(sorted([p.get('name', '') + str(p.get('category_id', '')) for p in places])).encode()
+    ).hexdigest()[:8]
+    interests_hash = hashlib.md5(str(sorted(user_interests)).encode()).hexdigest()[:6]
+    return f"{places_hash}_{interests_hash}_{total_duration}"
+
+
+def vary(query, rng):
+    variants = [query, query.lower(), query.upper(), f"  {query} ", query.replace(' ', '  ')]
+    return variants[rng.integers(len(variants))]
+
+
+def request_log(rng):
+    for _ in range(REQUESTS):
+        # Популярные точки посещаются чаще
+        lat, lon = HOTSPOTS[min(int(rng.exponential(1.2)), len(HOTSPOTS) - 1)]
+        lat += rng.normal(0, 150) / M_PER_DEG
+        lon += rng.normal(0, 150) / M_PER_DEG / np.cos(np.radians(lat))
+        hours, minutes = DURATIONS[rng.integers(len(DURATIONS))]
+        query = QUERIES[min(int(rng.exponential(1.5)), len(QUERIES) - 1)]
+        yield {'query': vary(query, rng), 'hours': hours, 'minutes': minutes,
+               'startPoint': 'адрес', 'startCoord': [lat, lon]}
+
+
+def replay(log, key_fn):
+    first_start = {}
+    hits = wrong = 0
+    for ctx in log:
+        key = key_fn(ctx)
+        if key in first_start:
+            hits += 1
+            if haversine_m(*first_start[key], *ctx.start) > WRONG_HIT_M:
+                wrong += 1
+        else:
+            first_start[key] = ctx.start
+    return hits / len(log), wrong / len(log), len(first_start)
+
+
+def main():
+    rng = np.random.default_rng(7)
+    stages = [stage for stage in app.ROUTE_STAGES if stage[0] not in SKIP_STAGES]
+    log = []
+    for data in request_log(rng):
+        ctx = app.RouteContext(data)
+        app.run_route_pipeline(ctx, stages)
+        log.append(ctx)
+
+    rows = [('прежний ключ', lambda ctx: legacy_cache_key(ctx.places_for_explainer, [ctx.query], ctx.total_minutes))]
+    for cell_m in (250, 500, 1000, 2000):
+        def key_fn(ctx, cell_m=cell_m):
+            app.ROUTE_CACHE_CELL_M = cell_m
+            return app.get_route_explainer()._generate_cache_key(
+                ctx.places_for_explainer, [ctx.query], ctx.total_minutes, ctx.start_point, ctx.start
+            )
+        rows.append((f"ячейка {cell_m} м", key_fn))
+
+    print(f"\n{'ключ':>16} {'попадания':>10} {'чужие':>7} {'записей':>8}")
+    for name, key_fn in rows:
+        hit_rate, wrong_rate, entries = replay(log, key_fn)
+        print(f"{name:>16} {hit_rate:>10.1%} {wrong_rate:>7.1%} {entries:>8}")
+
+
+if __name__ == "__main__":
+    main()
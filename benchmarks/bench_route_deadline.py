@@ -0,0 +1,68 @@
+"""Задержка /generate_route с бюджетом deadline_ms и без него: python benchmarks/bench_route_deadline.py
+
+Модель заменена медленной заглушкой stub_llm_server. С бюджетом ответ
+приходит с запасными текстами и pending=true, а повторный запрос после
+фоновой генерации получает маршрут модели из кэша.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('EMBEDDING_BACKEND', 'stub')
+
+from stub_llm_server import StubLLMServer  # noqa: E402
+
+server = StubLLMServer(token_delay=0.005, first_token_delay=1.5).start()
+os.environ['LLM_API_URL'] = server.url
+os.environ.setdefault('HF_API_TOKEN', 'stub')
+
+import route_explainer as app  # noqa: E402
+
+QUERIES = [
+    "Хочу прогуляться по парку и посмотреть памятники",
+    "Ищу хороший ресторан с кофе и десертами",
+    "Посетить музей и выставку искусства",
+]
+BODY = {'hours': 2, 'minutes': 0, 'startCoord': [56.328437, 44.003111], 'startPoint': 'Кремль'}
+DEADLINE_MS = 300
+
+
+def timed_post(client, body):
+    started = time.perf_counter()
+    response = client.post('/generate_route', json=body)
+    return time.perf_counter() - started, response.get_json()
+
+
+def main():
+    client = app.flask_app.test_client()
+    unbounded, bounded, repeated = [], [], []
+    for query in QUERIES:
+        app.get_route_explainer()._cache.clear()
+        elapsed, _ = timed_post(client, {**BODY, 'query': query})
+        unbounded.append(elapsed)
+
+        app.get_route_explainer()._cache.clear()
+        body = {**BODY, 'query': query, 'deadline_ms': DEADLINE_MS}
+        elapsed, result = timed_post(client, body)
+        bounded.append(elapsed)
+        assert result['pending']
+
+        # Ждем фоновую генерацию и повторяем запрос
+        time.sleep(3)
+        elapsed, result = timed_post(client, body)
+        repeated.append(elapsed)
+        assert not result['pending']
+
+    print(f"\n{'':>32} {'медиана, с':>11}")
+    print(f"{'без бюджета':>32} {np.median(unbounded):>11.2f}")
+    print(f"{f'deadline_ms={DEADLINE_MS}':>32} {np.median(bounded):>11.2f}")
+    print(f"{'повтор после фоновой генерации':>32} {np.median(repeated):>11.2f}")
+    print("\nroute_budget:", app.get_route_explainer().budget_stats(), "| обращений к модели:", server.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Микробенчмарк выбора и порядка мест: python benchmarks/bench_route_order.py
+
+Первая таблица — стадия select целиком (select_places, не больше MAX_STOPS
+мест), вторая — только порядок обхода solve_open_path на больших числах
+остановок, где видно, во что обходятся 2-opt и Or-opt.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo import haversine_matrix  # noqa: E402
+from route_planner import _nearest_neighbour, select_places, solve_open_path  # noqa: E402
+
+START = (56.326887, 44.005986)
+BUDGET_MINUTES = 360
+REPEATS = 50
+
+
+def path_length(lat, lon, order, start):
+    lat = np.append(start[0], np.asarray(lat)[order])
+    lon = np.append(start[1], np.asarray(lon)[order])
+    dist = haversine_matrix(lat, lon)
+    return dist[np.arange(len(lat) - 1), np.arange(1, len(lat))].sum()
+
+
+def main():
+    rng = np.random.default_rng(42)
+    print(f"{'кандидатов':>10} {'p50, мс':>9} {'max, мс':>9} {'мест':>5} {'путь, км':>9} {'по удалению, км':>16}")
+    # 30 — MAX_CANDIDATES в route_explainer, столько кандидатов получает стадия select
+    for n in (5, 10, 20, 30, 50):
+        lat = START[0] + rng.normal(0, 0.01, n)
+        lon = START[1] + rng.normal(0, 0.02, n)
+        scores = rng.uniform(0, 1, n)
+        durations = rng.choice([15, 30, 40, 60], n)
+
+        timings = []
+        for _ in range(REPEATS):
+            started = time.perf_counter()
+            selection = select_places(lat, lon, scores, durations, BUDGET_MINUTES, START)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        # Прежнее поведение фронтенда: те же места по удалению от старта
+        order = selection['order']
+        from_start = haversine_matrix(np.append(START[0], lat), np.append(START[1], lon))[0, 1:]
+        by_distance = order[np.argsort(from_start[order], kind='stable')]
+        print(f"{n:>10} {np.median(timings):>9.2f} {np.max(timings):>9.2f} {len(order):>5} "
+              f"{selection['legs'].sum() / 1000:>9.2f} {path_length(lat, lon, by_distance, START) / 1000:>16.2f}")
+
+    bench_open_path(rng)
+
+
+
+def bench_open_path(rng):
+    print(f"\n{'остановок':>10} {'p50, мс':>9} {'max, мс':>9} {'путь, км':>9} {'сосед, км':>10} {'по удалению, км':>16}")
+    for n in (10, 20, 50, 100):
+        lat = np.append(START[0], START[0] + rng.normal(0, 0.01, n))
+        lon = np.append(START[1], START[1] + rng.normal(0, 0.02, n))
+        dist = haversine_matrix(lat, lon)
+
+        timings = []
+        for _ in range(REPEATS):
+            started = time.perf_counter()
+            path = solve_open_path(dist)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        def length(order):
+            return dist[order[:-1], order[1:]].sum() / 1000
+
+        by_distance = np.argsort(dist[0], kind='stable')
+        print(f"{n:>10} {np.median(timings):>9.2f} {np.max(timings):>9.2f} {length(path):>9.2f} "
+              f"{length(_nearest_neighbour(dist)):>10.2f} {length(by_distance):>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Нагрузочный тест /generate_route: dev-сервер Flask против gunicorn: python benchmarks/bench_serving.py [секунд]
+
+Оба сервера запускаются отдельными процессами с моделью-заглушкой
+stub_llm_server и одинаковым набором запросов (после первого прохода
+ответы модели берутся из кэша, поэтому меряется сам сервис: эмбеддинги,
+поиск мест, выбор маршрута). Число процессов gunicorn — GUNICORN_WORKERS.
+"""
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_llm_server import StubLLMServer  # noqa: E402
+
+CLIENTS = 32
+QUERIES = [
+    "Хочу прогуляться по парку и посмотреть памятники",
+    "Ищу хороший ресторан с кофе и десертами",
+    "Посетить музей и выставку искусства",
+    "Архитектура и исторические здания",
+    "Набережная и красивые виды",
+    "Театр вечером",
+    "Кофейня и пекарня",
+    "Мозаики и монументальное искусство",
+]
+BODY = {'hours': 2, 'minutes': 0, 'startCoord': [56.328437, 44.003111], 'startPoint': 'Кремль'}
+
+DEV_SERVER = ("import os, route_explainer as app; app.warm_up(); "
+              "app.flask_app.run(host='127.0.0.1', port=int(os.environ['PORT']), debug=False)")
+
+
+def start(command, port, env):
+    process = subprocess.Popen(command, cwd=ROOT, env={**env, 'PORT': str(port)},
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        try:
+            httpx.get(f"{url}/stats", timeout=1)
+            return process, url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"сервер {' '.join(command)} не запустился")
+
+
+def load(url, seconds):
+    deadline = time.monotonic() + seconds
+    latencies = []
+
+    def client(n):
+        with httpx.Client(timeout=60) as http:
+            i = n
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                response = http.post(f"{url}/generate_route", json={**BODY, 'query': QUERIES[i % len(QUERIES)]})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+                i += 1
+
+    # Первый проход заполняет кэши всех процессов
+    with ThreadPoolExecutor(CLIENTS) as pool:
+        for query in QUERIES * 4:
+            pool.submit(httpx.post, f"{url}/generate_route", json={**BODY, 'query': query}, timeout=60)
+    started = time.monotonic()
+    with ThreadPoolExecutor(CLIENTS) as pool:
+        list(pool.map(client, range(CLIENTS)))
+    return len(latencies) / (time.monotonic() - started), np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 15
+    llm = StubLLMServer(token_delay=0, first_token_delay=0.05).start()
+    env = {**os.environ, 'LLM_API_URL': llm.url, 'HF_API_TOKEN': os.getenv('HF_API_TOKEN', 'stub'),
+           'EMBEDDING_BACKEND': os.getenv('EMBEDDING_BACKEND', 'stub')}
+    servers = [
+        ('flask dev', [sys.executable, '-c', DEV_SERVER]),
+        (f"gunicorn x{os.getenv('GUNICORN_WORKERS', 2)}",
+         [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']),
+    ]
+
+    print(f"{'':>14} {'зап/с':>7} {'p50, мс':>8} {'p99, мс':>8}")
+    for port, (name, command) in enumerate(servers, 18081):
+        process, url = start(command, port, env)
+        try:
+            rps, p50, p99 = load(url, seconds)
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+        print(f"{name:>14} {rps:>7.0f} {p50 * 1000:>8.0f} {p99 * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Время до первого места в /generate_route/stream против полного /generate_route: python benchmarks/bench_stream_route.py
+
+Модель заменена заглушкой stub_llm_server с задержкой на каждый токен.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('EMBEDDING_BACKEND', 'stub')
+
+from stub_llm_server import StubLLMServer  # noqa: E402
+
+server = StubLLMServer(token_delay=0.02, first_token_delay=0.3).start()
+os.environ['LLM_API_URL'] = server.url
+os.environ.setdefault('HF_API_TOKEN', 'stub')
+
+import route_explainer as app  # noqa: E402
+
+QUERIES = [
+    "Хочу прогуляться по парку и посмотреть памятники",
+    "Ищу хороший ресторан с кофе и десертами",
+    "Посетить музей и выставку искусства",
+]
+BODY = {'hours': 2, 'minutes': 0, 'startCoord': [56.328437, 44.003111], 'startPoint': 'Кремль'}
+
+
+def main():
+    client = app.flask_app.test_client()
+    blocking, first_route, first_place, done = [], [], [], []
+    for query in QUERIES:
+        app.get_route_explainer()._cache.clear()
+        started = time.perf_counter()
+        client.post('/generate_route', json={**BODY, 'query': query})
+        blocking.append(time.perf_counter() - started)
+
+        app.get_route_explainer()._cache.clear()
+        started = time.perf_counter()
+        response = client.post('/generate_route/stream', json={**BODY, 'query': query}, buffered=False)
+        for chunk in response.response:
+            event = chunk.decode('utf-8').split('\n', 1)[0]
+            elapsed = time.perf_counter() - started
+            if event == 'event: route':
+                first_route.append(elapsed)
+            elif event == 'event: place' and len(first_place) < len(first_route):
+                first_place.append(elapsed)
+            elif event == 'event: done':
+                done.append(elapsed)
+        response.close()
+
+    print(f"\n{'':>28} {'медиана, с':>11}")
+    print(f"{'/generate_route, ответ':>28} {np.median(blocking):>11.2f}")
+    print(f"{'stream: места и порядок':>28} {np.median(first_route):>11.2f}")
+    print(f"{'stream: первое объяснение':>28} {np.median(first_place):>11.2f}")
+    print(f"{'stream: полный ответ':>28} {np.median(done):>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
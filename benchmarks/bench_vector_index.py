@@ -0,0 +1,69 @@
+"""Полнота и время запроса IVF против точного поиска: python benchmarks/bench_vector_index.py [n ...]
+
+По умолчанию 10 000 и 100 000 векторов; 1 000 000 требует около 6 ГБ памяти (векторы хранят оба индекса).
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import ExactVectorIndex, IVFFlatIndex  # noqa: E402
+
+DIM = 384
+K = 10
+QUERIES = 200
+N_PROBES = (1, 4, 8, 16, 32, 64)
+
+
+def synthetic_vectors(n, rng, n_topics=None, chunk=100_000):
+    """Смесь гауссиан вокруг случайных «тем»: похоже на эмбеддинги текстов разных категорий"""
+    n_topics = n_topics or max(16, int(np.sqrt(n)))
+    topics = rng.standard_normal((n_topics, DIM), dtype=np.float32)
+    vectors = np.empty((n, DIM), dtype=np.float32)
+    for begin in range(0, n, chunk):
+        size = min(chunk, n - begin)
+        vectors[begin:begin + size] = topics[rng.integers(0, n_topics, size)]
+        vectors[begin:begin + size] += 0.8 * rng.standard_normal((size, DIM), dtype=np.float32)
+    return vectors, topics
+
+
+def timed_search(index, queries, **kwargs):
+    results, timings = [], []
+    for query in queries:
+        started = time.perf_counter()
+        rows, _ = index.search(query, K, **kwargs)
+        timings.append((time.perf_counter() - started) * 1000)
+        results.append(rows)
+    return results, np.median(timings), np.percentile(timings, 95)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    rng = np.random.default_rng(42)
+    for n in sizes:
+        vectors, topics = synthetic_vectors(n, rng)
+        queries = topics[rng.integers(0, len(topics), QUERIES)]
+        queries = queries + 0.8 * rng.standard_normal(queries.shape, dtype=np.float32)
+
+        exact = ExactVectorIndex(vectors)
+        started = time.perf_counter()
+        ivf = IVFFlatIndex.train(vectors)
+        build_s = time.perf_counter() - started
+        del vectors
+
+        truth, exact_p50, exact_p95 = timed_search(exact, queries)
+        print(f"\nn={n}, dim={DIM}, списков IVF={len(ivf.centroids)}, обучение {build_s:.1f} с")
+        print(f"{'поиск':>12} {'recall@10':>10} {'p50, мс':>9} {'p95, мс':>9}")
+        print(f"{'точный':>12} {1.0:>10.3f} {exact_p50:>9.2f} {exact_p95:>9.2f}")
+        for n_probe in N_PROBES:
+            found, p50, p95 = timed_search(ivf, queries, n_probe=n_probe)
+            recall = np.mean([len(np.intersect1d(a, b)) / K for a, b in zip(found, truth)])
+            print(f"{f'n_probe={n_probe}':>12} {recall:>10.3f} {p50:>9.2f} {p95:>9.2f}")
+        del exact, ivf
+
+
+if __name__ == "__main__":
+    main()
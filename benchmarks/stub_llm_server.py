@@ -0,0 +1,122 @@
+"""Заглушка chat completions API для локальной проверки: python benchmarks/stub_llm_server.py [порт]
+
+Отвечает маршрутом по местам из промпта, как это сделала бы модель, и
+поддерживает stream=True (SSE по одному токену). Задержки и ошибки
+задаются переменными окружения или атрибутами StubLLMServer:
+STUB_LLM_TOKEN_DELAY — пауза между токенами, STUB_LLM_FIRST_TOKEN_DELAY —
+до первого токена, STUB_LLM_FAIL_RATE — доля ответов 503,
+STUB_LLM_SLOW_RATE — доля запросов с дополнительной паузой STUB_LLM_SLOW_DELAY
+(хвост задержек).
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_PLACE_LINE = re.compile(r'^\d+\. (.+?) \((.+?)(?:, (\d+) мин)?\)$', re.MULTILINE)
+_TOKEN = re.compile(r'\s*\S{1,4}')
+
+
+def canned_route(prompt):
+    """Ответ модели в формате промпта RouteExplainer по перечисленным в нем местам"""
+    places = [
+        {
+            "name": name,
+            "order": i,
+            "duration": int(minutes or 30),
+            "reason": f"выбрано потому что это {category.lower()}, подходящее под ваши интересы",
+        }
+        for i, (name, category, minutes) in enumerate(_PLACE_LINE.findall(prompt), 1)
+    ]
+    route = {
+        "places": places,
+        "route_name": "Прогулка по Нижнему Новгороду",
+        "total_duration": sum(place["duration"] for place in places),
+        "timeline": "неспешная прогулка с остановками",
+        "explanation": "маршрут собран из мест, ближе всего подходящих к вашему запросу",
+    }
+    return "Вот маршрут:\n" + json.dumps(route, ensure_ascii=False, indent=1)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        server.requests += 1
+        time.sleep(server.first_token_delay)
+        if random.random() < server.slow_rate:
+            time.sleep(server.slow_delay)
+        if random.random() < server.fail_rate:
+            self._send_json(503, {"error": "Model is loading"})
+            return
+
+        text = canned_route(payload["messages"][-1]["content"])
+        if not payload.get("stream"):
+            time.sleep(server.token_delay * len(_TOKEN.findall(text)))
+            self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": text}}]})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for token in _TOKEN.findall(text):
+                time.sleep(server.token_delay)
+                self._write_chunk(f"data: {json.dumps({'choices': [{'delta': {'content': token}}]}, ensure_ascii=False)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            server.disconnects += 1
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, token_delay=None, first_token_delay=None, fail_rate=None, slow_rate=None,
+                 slow_delay=None):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.token_delay = token_delay if token_delay is not None else float(os.getenv('STUB_LLM_TOKEN_DELAY', 0.02))
+        self.first_token_delay = (first_token_delay if first_token_delay is not None
+                                  else float(os.getenv('STUB_LLM_FIRST_TOKEN_DELAY', 0.3)))
+        self.fail_rate = fail_rate if fail_rate is not None else float(os.getenv('STUB_LLM_FAIL_RATE', 0))
+        self.slow_rate = slow_rate if slow_rate is not None else float(os.getenv('STUB_LLM_SLOW_RATE', 0))
+        self.slow_delay = slow_delay if slow_delay is not None else float(os.getenv('STUB_LLM_SLOW_DELAY', 2))
+        self.requests = 0
+        self.disconnects = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/chat/completions"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    server = StubLLMServer(int(sys.argv[1]) if len(sys.argv) > 1 else 8001)
+    print(f"LLM_API_URL={server.url}")
+    server.serve_forever()
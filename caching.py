@@ -0,0 +1,406 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Где хранятся готовые маршруты: memory (в процессе), sqlite (файл, общий для
+# процессов и переживает перезапуск) или redis (общий для нескольких машин)
+ROUTE_CACHE_BACKEND = os.getenv('ROUTE_CACHE_BACKEND', 'memory')
+ROUTE_CACHE_PATH = os.getenv('ROUTE_CACHE_PATH', 'route_cache.sqlite3')
+ROUTE_CACHE_URL = os.getenv('ROUTE_CACHE_URL', 'redis://localhost:6379/0')
+# Кэш готовых маршрутов: число записей, объем в байтах и время жизни в секундах
+ROUTE_CACHE_SIZE = int(os.getenv('ROUTE_CACHE_SIZE', 512))
+ROUTE_CACHE_MAX_BYTES = int(os.getenv('ROUTE_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+ROUTE_CACHE_TTL = float(os.getenv('ROUTE_CACHE_TTL', 6 * 3600))
+# Размер ячейки сетки, по которой в ключе кэша огрубляется начальная точка, метры
+ROUTE_CACHE_CELL_M = float(os.getenv('ROUTE_CACHE_CELL_M', 500))
+# Число записей в файле SQLite: он общий для воркеров и может быть больше кэша в памяти
+ROUTE_CACHE_SHARED_SIZE = int(os.getenv('ROUTE_CACHE_SHARED_SIZE', 20000))
+
+_MISSING = object()
+
+
+def json_size(value):
+    """Размер значения в байтах после сериализации в JSON (UTF-8)"""
+    return len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с ограничением числа записей и временем жизни.
+
+    При переполнении вытесняется давно не использованная запись, записи
+    старше ttl секунд считаются отсутствующими. Если задан maxbytes,
+    суммарный размер записей (по функции sizeof) тоже ограничен. Счетчики
+    попаданий, промахов и вытеснений доступны через stats().
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._clock = clock
+        self._data = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value, size = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires_at = self._clock() + self.ttl if self.ttl is not None else None
+        size = self._sizeof(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if self.maxbytes is not None and size > self.maxbytes:
+                # Запись больше всего кэша не сохраняем, чтобы не вытеснить все остальное
+                return
+            self._data[key] = (expires_at, value, size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self._bytes > self.maxbytes):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'bytes': self._bytes,
+                'maxbytes': self.maxbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def dumps(value):
+    """Компактный блоб для внешнего хранилища: JSON без пробелов, сжатый zlib"""
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def loads(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одинаковым ключом в один.
+
+    Первый вызвавший выполняет fn, остальные ждут его результат. Ошибка
+    передается всем ожидающим и нигде не запоминается: следующий вызов
+    после завершения выполнит fn заново.
+
+    Когда fn нужно выполнить в другом потоке, begin() сообщает, стал ли
+    вызвавший первым: только первый запускает run(), остальные ждут
+    полученный future и не занимают потоки.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def begin(self, key):
+        """(future, leader): leader=True, если вызвавший первый и должен выполнить run(key, future, fn)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def get(self, key):
+        """future текущего вызова с ключом key или None, если такого нет"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+            return future
+
+    def run(self, key, future, fn):
+        """Выполняет fn за первого вызвавшего и передает результат или ошибку в future"""
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def do(self, key, fn):
+        future, leader = self.begin(key)
+        if leader:
+            return self.run(key, future, fn)
+        return future.result()
+
+    def stats(self):
+        with self._lock:
+            calls = self.leaders + self.coalesced
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'coalesced_rate': round(self.coalesced / calls, 4) if calls else 0.0,
+            }
+
+
+class _Counters:
+    def __init__(self):
+        self._counter_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, hit):
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _hit_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SQLiteCache(_Counters):
+    """Кэш в файле SQLite, общий для всех процессов на машине.
+
+    База работает в режиме WAL, поэтому чтения не блокируются записью
+    других воркеров. Значения хранятся сжатыми блобами (dumps); записи с
+    истекшим сроком удаляются при чтении и при периодической очистке,
+    сверх maxsize удаляются самые старые. Конструктор файл не трогает:
+    соединение и таблица создаются при первом обращении, свои в каждом
+    потоке и процессе.
+    """
+
+    _PRUNE_EVERY = 64
+
+    def __init__(self, path=ROUTE_CACHE_PATH, maxsize=None, ttl=None, table='cache'):
+        super().__init__()
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # В одном файле может быть несколько независимых кэшей, у каждого своя таблица
+        self.table = table
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connect(self):
+        # sqlite3-соединение нельзя разделять между потоками, у каждого свое. Кэш может быть
+        # создан в мастере gunicorn до fork (preload_app), а соединение, унаследованное через
+        # fork, SQLite использовать запрещает: после fork открывается новое
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                    "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, created_at REAL NOT NULL)"
+                )
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_created_at ON {self.table} (created_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        conn = self._connect()
+        row = conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[1] is not None and row[1] <= time.time():
+            with conn:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ? AND expires_at <= ?", (key, time.time()))
+            row = None
+        self._count(row is not None)
+        return loads(row[0]) if row is not None else default
+
+    def set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, dumps(value), expires_at, now)
+            )
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self._PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Удаляет истекшие записи и самые старые сверх maxsize"""
+        conn = self._connect()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),))
+            if self.maxsize is not None:
+                conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN ("
+                    f"SELECT key FROM {self.table} ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,)
+                )
+
+    def __len__(self):
+        return self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+    def stats(self):
+        size, total_bytes = self._connect().execute(
+            f"SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM {self.table}"
+        ).fetchone()
+        return {'backend': 'sqlite', 'size': size, 'maxsize': self.maxsize, 'ttl': self.ttl,
+                'bytes': total_bytes, **self._hit_stats()}
+
+
+class RedisCache(_Counters):
+    """Кэш в Redis или совместимом сервере, общий для нескольких машин.
+
+    Нужен пакет redis (в requirements не входит). Срок жизни записей
+    выставляет сам сервер (SET ... EX), вытеснением управляет его maxmemory-policy.
+    """
+
+    def __init__(self, url=ROUTE_CACHE_URL, ttl=None, prefix='route:', client=None):
+        super().__init__()
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key, default=None):
+        blob = self._client.get(self.prefix + key)
+        self._count(blob is not None)
+        return loads(blob) if blob is not None else default
+
+    def set(self, key, value):
+        ttl = int(self.ttl) if self.ttl is not None else None
+        self._client.set(self.prefix + key, dumps(value), ex=ttl)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+    def stats(self):
+        return {'backend': 'redis', 'ttl': self.ttl, **self._hit_stats()}
+
+
+class TieredCache:
+    """Локальный TTLCache перед общим хранилищем.
+
+    Повторные запросы в том же процессе не ходят в хранилище; промах
+    локального кэша читает общее хранилище и запоминает результат локально.
+    Ошибки общего хранилища не ломают запрос, а считаются промахом.
+    """
+
+    def __init__(self, local, shared):
+        self.local = local
+        self.shared = shared
+        self.shared_errors = 0
+
+    def get(self, key, default=None):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        try:
+            value = self.shared.get(key, _MISSING)
+        except Exception as e:
+            self.shared_errors += 1
+            print(f"⚠️ Общий кэш недоступен: {e}")
+            return default
+        if value is _MISSING:
+            return default
+        self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        try:
+            self.shared.set(key, value)
+        except Exception as e:
+            self.shared_errors += 1
+            print(f"⚠️ Не удалось записать в общий кэш: {e}")
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def stats(self):
+        try:
+            shared = self.shared.stats()
+        except Exception as e:
+            shared = {'error': str(e)}
+        return {'local': self.local.stats(), 'shared': shared, 'shared_errors': self.shared_errors}
+
+
+def create_route_cache(backend=ROUTE_CACHE_BACKEND):
+    """Кэш готовых маршрутов, выбранный через ROUTE_CACHE_BACKEND"""
+    local = TTLCache(
+        maxsize=ROUTE_CACHE_SIZE, ttl=ROUTE_CACHE_TTL,
+        maxbytes=ROUTE_CACHE_MAX_BYTES, sizeof=json_size
+    )
+    if backend == 'memory':
+        return local
+    if backend == 'sqlite':
+        shared = SQLiteCache(ROUTE_CACHE_PATH, maxsize=ROUTE_CACHE_SHARED_SIZE, ttl=ROUTE_CACHE_TTL)
+    elif backend == 'redis':
+        shared = RedisCache(ROUTE_CACHE_URL, ttl=ROUTE_CACHE_TTL)
+    else:
+        raise ValueError(f"Неизвестный ROUTE_CACHE_BACKEND: {backend!r}, допустимо: memory, sqlite, redis")
+    return TieredCache(local, shared)
@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from collections import deque
+
+# Окно последних вызовов, по которому считаются доли ошибок и медленных ответов
+LLM_BREAKER_WINDOW = int(os.getenv('LLM_BREAKER_WINDOW', 20))
+# Раньше этого числа вызовов в окне автомат не размыкается
+LLM_BREAKER_MIN_CALLS = int(os.getenv('LLM_BREAKER_MIN_CALLS', 10))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv('LLM_BREAKER_FAILURE_RATE', 0.5))
+# Успешный ответ дольше LLM_BREAKER_SLOW секунд считается медленным
+LLM_BREAKER_SLOW = float(os.getenv('LLM_BREAKER_SLOW', 30))
+LLM_BREAKER_SLOW_RATE = float(os.getenv('LLM_BREAKER_SLOW_RATE', 0.5))
+# Сколько секунд автомат разомкнут до пробных запросов и сколько проб пропускается одновременно
+LLM_BREAKER_OPEN_FOR = float(os.getenv('LLM_BREAKER_OPEN_FOR', 30))
+LLM_BREAKER_PROBES = int(os.getenv('LLM_BREAKER_PROBES', 1))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Автомат, отсекающий вызовы к деградировавшему сервису.
+
+    В состоянии closed вызовы проходят, их исходы копятся в окне из window
+    последних. Когда в окне не меньше min_calls исходов и доля ошибок
+    достигла failure_rate или доля медленных (дольше slow секунд) —
+    slow_rate, автомат размыкается (open) и allow() возвращает False.
+    Через open_for секунд он переходит в half_open и пропускает до probes
+    пробных вызовов: успешная быстрая проба замыкает автомат, неудачная
+    или медленная снова размыкает.
+
+    Вызывающий после allow() == True сообщает исход через record_success(),
+    record_failure() или release(), если исход ничего не говорит о
+    сервисе (вызов отменен или не дошел до него).
+    """
+
+    def __init__(self, window=LLM_BREAKER_WINDOW, min_calls=LLM_BREAKER_MIN_CALLS,
+                 failure_rate=LLM_BREAKER_FAILURE_RATE, slow=LLM_BREAKER_SLOW, slow_rate=LLM_BREAKER_SLOW_RATE,
+                 open_for=LLM_BREAKER_OPEN_FOR, probes=LLM_BREAKER_PROBES, clock=time.monotonic):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow = slow
+        self.slow_rate = slow_rate
+        self.open_for = open_for
+        self.probes = probes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # (ошибка, медленный)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probing = 0
+        self.opened = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._advance()
+            return self._state
+
+    def _advance(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_for:
+            self._state = HALF_OPEN
+            self._probing = 0
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._outcomes.clear()
+        self.opened += 1
+
+    def allow(self):
+        with self._lock:
+            self._advance()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probing < self.probes:
+                self._probing += 1
+                return True
+            self.short_circuited += 1
+            return False
+
+    def _record(self, failed, slow):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = max(self._probing - 1, 0)
+                if failed or slow:
+                    self._open()
+                else:
+                    self._state = CLOSED
+                return
+            if self._state == OPEN:
+                # Вызов начался до размыкания, его исход уже ничего не меняет
+                return
+            self._outcomes.append((failed, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+            failures = sum(failed for failed, _ in self._outcomes) / len(self._outcomes)
+            slows = sum(slow for _, slow in self._outcomes) / len(self._outcomes)
+            if failures >= self.failure_rate or slows >= self.slow_rate:
+                self._open()
+
+    def record_success(self, elapsed):
+        self._record(False, elapsed > self.slow)
+
+    def record_failure(self):
+        self._record(True, False)
+
+    def release(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = max(self._probing - 1, 0)
+
+    def stats(self):
+        with self._lock:
+            self._advance()
+            calls = len(self._outcomes)
+            return {
+                'state': self._state,
+                'opened': self.opened,
+                'short_circuited': self.short_circuited,
+                'window_calls': calls,
+                'failure_rate': round(sum(f for f, _ in self._outcomes) / calls, 4) if calls else 0.0,
+                'slow_rate': round(sum(s for _, s in self._outcomes) / calls, 4) if calls else 0.0,
+            }
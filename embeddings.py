@@ -0,0 +1,434 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import numpy as np
+import requests
+
+from caching import TTLCache
+from metrics import Histogram
+
+# Какой движок считает эмбеддинги: remote (HF Inference API), local (модель в процессе)
+# или stub (детерминированная заглушка без сети и моделей, для тестов и офлайна)
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'remote')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+# Потоки torch для локальной модели, 0 — оставить значение по умолчанию
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', 0))
+# Текстов в одном вызове движка при расчете фиксированных наборов и в батче локальной модели
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 32))
+EMBEDDING_TIMEOUT = float(os.getenv('EMBEDDING_TIMEOUT', 60))
+EMBEDDING_DIM = 384
+# Кэш эмбеддингов запросов: число записей и время жизни в секундах
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', 1024))
+EMBEDDING_CACHE_TTL = float(os.getenv('EMBEDDING_CACHE_TTL', 24 * 3600))
+# Микробатчинг запросов: сколько мс ждать попутчиков и сколько текстов максимум в одном вызове;
+# 0 мс — каждый запрос идет в движок сам
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv('EMBEDDING_BATCH_WAIT_MS', 5))
+EMBEDDING_BATCH_MAX = int(os.getenv('EMBEDDING_BATCH_MAX', 64))
+# Сколько секунд запрос ждет свой батч: он может стоять в очереди за предыдущим вызовом движка
+EMBEDDING_BATCH_TIMEOUT = float(os.getenv('EMBEDDING_BATCH_TIMEOUT', 2 * EMBEDDING_TIMEOUT))
+# Каталог с эмбеддингами фиксированных наборов текстов (категорий и мест), его заполняет шаг
+# сборки python vector_index.py; чего в нем нет, считается при первом обращении
+EMBEDDINGS_CACHE_DIR = os.getenv('EMBEDDINGS_CACHE_DIR', 'embeddings_cache')
+# Увеличивается при изменении формата файлов кэша
+EMBEDDINGS_CACHE_VERSION = 2
+
+
+def _as_texts(texts):
+    return [texts] if isinstance(texts, str) else list(texts)
+
+
+class RemoteEmbeddingBackend:
+    """Эмбеддинги через HF Inference API (одна HTTP-пара запрос/ответ на вызов)"""
+
+    name = 'remote'
+
+    def __init__(self, model_name=EMBEDDING_MODEL, api_token=None, timeout=EMBEDDING_TIMEOUT):
+        self.model_name = model_name
+        self.api_token = api_token if api_token is not None else os.getenv('HF_API_TOKEN')
+        self.api_url = f"https://router.huggingface.co/hf-inference/models/{model_name}"
+        self.timeout = timeout
+
+    def encode(self, texts):
+        if not self.api_token:
+            print("❌ Ошибка: HF_API_TOKEN не установлен")
+            return None
+
+        texts = _as_texts(texts)
+        try:
+            print(f"🔄 Отправляем запрос к Sentence Transformer API для {len(texts)} текстов")
+            response = requests.post(
+                self.api_url,
+                headers={"Authorization": f"Bearer {self.api_token}"},
+                json={"inputs": texts, "options": {"wait_for_model": True}},
+                timeout=self.timeout
+            )
+
+            if response.status_code != 200:
+                print(f"❌ Ошибка API: {response.status_code} - {response.text}")
+                return None
+
+            data = response.json()
+            print(f"✅ Успешно получены эмбеддинги")
+
+            # Разные форматы ответа API
+            if isinstance(data, list) and data:
+                if all(isinstance(item, list) for item in data):
+                    return np.asarray(data, dtype=np.float32)  # [[emb1], [emb2], ...]
+                elif all(isinstance(item, (int, float)) for item in data):
+                    return np.asarray([data], dtype=np.float32)  # Один эмбеддинг как плоский список
+                elif isinstance(data[0], dict) and "embedding" in data[0]:
+                    return np.asarray([item["embedding"] for item in data], dtype=np.float32)
+
+            print(f"⚠️ Неизвестный формат ответа: {type(data)}")
+            if isinstance(data, dict):
+                print(f"📊 Ключи в ответе: {data.keys()}")
+            return None
+
+        except Exception as e:
+            print(f"💥 Исключение при запросе эмбеддингов: {e}")
+            return None
+
+
+class LocalEmbeddingBackend:
+    """Эмбеддинги локальной моделью sentence-transformers на CPU.
+
+    Модель загружается один раз при первом обращении и разделяется всеми
+    потоками; encode работает батчами внутри torch.inference_mode.
+    """
+
+    name = 'local'
+
+    def __init__(self, model_name=EMBEDDING_MODEL, threads=EMBEDDING_THREADS, batch_size=EMBEDDING_BATCH_SIZE):
+        self.model_name = model_name
+        self.threads = threads
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import torch
+                    from sentence_transformers import SentenceTransformer
+
+                    if self.threads > 0:
+                        torch.set_num_threads(self.threads)
+                    print(f"🔄 Загружаем локальную модель эмбеддингов {self.model_name}...")
+                    self._model = SentenceTransformer(self.model_name, device='cpu')
+                    print("✅ Локальная модель эмбеддингов загружена")
+        return self._model
+
+    def encode(self, texts):
+        texts = _as_texts(texts)
+        try:
+            model = self._load()
+            import torch
+
+            with torch.inference_mode():
+                embeddings = model.encode(
+                    texts,
+                    batch_size=self.batch_size,
+                    convert_to_numpy=True,
+                    show_progress_bar=False,
+                )
+            return np.asarray(embeddings, dtype=np.float32)
+        except Exception as e:
+            print(f"💥 Ошибка локальной модели эмбеддингов: {e}")
+            return None
+
+
+class StubEmbeddingBackend:
+    """Детерминированная заглушка: хэширует символьные триграммы в вектор.
+
+    Не требует сети и весов модели; тексты с общими словами получают
+    близкие векторы, чего достаточно для тестов и разработки офлайн.
+    """
+
+    name = 'stub'
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+        self.model_name = f"stub-trigram-{dim}"
+
+    def _encode_one(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        padded = f"  {text.lower()}  "
+        for i in range(len(padded) - 2):
+            digest = hashlib.blake2b(padded[i:i + 3].encode('utf-8'), digest_size=8).digest()
+            bucket = int.from_bytes(digest, 'little')
+            vector[bucket % self.dim] += 1.0 if (bucket >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts):
+        return np.stack([self._encode_one(text) for text in _as_texts(texts)])
+
+
+class EmbeddingBatcher:
+    """Собирает тексты одновременных запросов в один вызов движка.
+
+    Первый запрос открывает окно в max_wait_ms миллисекунд, все пришедшие
+    за это время (но не больше max_batch текстов) уходят в движок одним
+    вызовом, и каждый вызвавший получает свои строки результата. Пока
+    идет вызов, следующие запросы копятся для следующего батча.
+    Гистограммы размеров батчей и ожидания в очереди доступны в stats().
+    Если результат не пришел за timeout секунд, encode() возвращает None.
+    """
+
+    def __init__(self, encode, max_batch=EMBEDDING_BATCH_MAX, max_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+                 timeout=EMBEDDING_BATCH_TIMEOUT):
+        self._encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+        self.batch_sizes = Histogram((1, 2, 4, 8, 16, 32, 64, 128))
+        self.wait_ms = Histogram((0.5, 1, 2, 5, 10, 20, 50, 100, 500))
+
+    def _ensure_worker(self):
+        # После fork поток-обработчик родителя в дочернем процессе не существует
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                    threading.Thread(target=self._run, args=(self._queue,), daemon=True).start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def encode(self, texts):
+        """Эмбеддинги texts как их вернул бы движок, или None при ошибке"""
+        texts = _as_texts(texts)
+        future = Future()
+        self._ensure_worker().put((texts, future, time.perf_counter()))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            print(f"⚠️ Эмбеддинги не получены за {self.timeout:g} с")
+            return None
+
+    def _collect(self, requests_queue):
+        batch = [requests_queue.get()]
+        size = len(batch[0][0])
+        closes_at = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = closes_at - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = requests_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self, requests_queue):
+        while True:
+            batch = []
+            try:
+                batch = self._collect(requests_queue)
+                self._process(batch)
+            except Exception as e:
+                # Обработчик один на процесс: ошибка не должна его останавливать и оставлять запросы без ответа
+                print(f"💥 Ошибка обработчика эмбеддингов: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_result(None)
+
+    def _process(self, batch):
+        started = time.perf_counter()
+        # Одинаковые тексты разных запросов считаются один раз
+        unique = list(dict.fromkeys(text for texts, _, _ in batch for text in texts))
+        try:
+            vectors = self._encode(unique)
+        except Exception as e:
+            print(f"💥 Ошибка батча эмбеддингов: {e}")
+            vectors = None
+        if vectors is not None and len(vectors) != len(unique):
+            vectors = None
+
+        self.batch_sizes.observe(len(unique))
+        row_of = {text: i for i, text in enumerate(unique)}
+        for texts, future, queued_at in batch:
+            self.wait_ms.observe((started - queued_at) * 1000)
+            future.set_result(None if vectors is None else vectors[[row_of[text] for text in texts]])
+
+    def stats(self):
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'batch_size': self.batch_sizes.snapshot(),
+            'wait_ms': self.wait_ms.snapshot(),
+        }
+
+
+_BACKENDS = {
+    'remote': RemoteEmbeddingBackend,
+    'local': LocalEmbeddingBackend,
+    'stub': StubEmbeddingBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+query_cache = TTLCache(maxsize=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL)
+
+# Движок берется в момент вызова, поэтому set_backend действует и на батчер
+batcher = EmbeddingBatcher(lambda texts: get_backend().encode(texts))
+
+
+def create_backend(name=EMBEDDING_BACKEND):
+    if name not in _BACKENDS:
+        raise ValueError(f"Неизвестный EMBEDDING_BACKEND: {name!r}, допустимо: {', '.join(_BACKENDS)}")
+    return _BACKENDS[name]()
+
+
+def get_backend():
+    """Общий для процесса движок эмбеддингов, выбранный через EMBEDDING_BACKEND"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+                print(f"🧠 Движок эмбеддингов: {_backend.name}")
+    return _backend
+
+
+def set_backend(backend):
+    """Подменяет движок эмбеддингов (например, заглушкой в тестах)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+    # Векторы другой модели несовместимы с закэшированными
+    query_cache.clear()
+
+
+def normalize_query(text):
+    """Ключ кэша запроса: регистр, лишние пробелы и ё/е не различаются"""
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+def embed(texts):
+    """Эмбеддинги текстов как float32-массив (n, dim) или None при ошибке.
+
+    Уже встречавшиеся запросы берутся из query_cache, остальные считаются
+    движком одним вызовом, общим с одновременными запросами других потоков
+    (если EMBEDDING_BATCH_WAIT_MS > 0).
+    """
+    texts = _as_texts(texts)
+    keys = [normalize_query(text) for text in texts]
+    vectors = [query_cache.get(key) for key in keys]
+
+    missing = {}
+    for text, key, vector in zip(texts, keys, vectors):
+        if vector is None:
+            missing.setdefault(key, text)
+
+    if missing:
+        texts_to_encode = list(missing.values())
+        if EMBEDDING_BATCH_WAIT_MS > 0:
+            computed = batcher.encode(texts_to_encode)
+        else:
+            computed = get_backend().encode(texts_to_encode)
+        if computed is None or len(computed) != len(missing):
+            return None
+        fresh = {}
+        for key, vector in zip(missing, computed):
+            vector = np.array(vector, dtype=np.float32)
+            vector.flags.writeable = False
+            query_cache.set(key, vector)
+            fresh[key] = vector
+        vectors = [vector if vector is not None else fresh[key] for key, vector in zip(keys, vectors)]
+
+    return np.stack(vectors)
+
+
+def text_key(text):
+    """Ключ строки кэша эмбеддингов: хэш самого текста"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+def embeddings_cache_key(backend=None):
+    """Ключ файлов кэша: зависит от модели, тексты различаются построчно по text_key"""
+    backend = backend or get_backend()
+    return hashlib.sha256(backend.model_name.encode('utf-8')).hexdigest()[:16]
+
+
+def _load_rows(path, model_name):
+    """Словарь {text_key: вектор} из файла кэша; пустой, если файла нет или он от другой модели"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path, allow_pickle=False) as cached:
+            if int(cached['version']) == EMBEDDINGS_CACHE_VERSION and str(cached['model']) == model_name:
+                return dict(zip(cached['keys'].tolist(), cached['embeddings']))
+        print(f"⚠️ Файл {path} не соответствует модели или формату, пересчитываем")
+    except Exception as e:
+        print(f"⚠️ Не удалось прочитать {path}: {e}")
+    return {}
+
+
+def _save_rows(path, rows, model_name):
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                version=np.array(EMBEDDINGS_CACHE_VERSION),
+                model=np.array(model_name),
+                keys=np.array(list(rows), dtype='<U32'),
+                embeddings=np.asarray(list(rows.values()), dtype=np.float32),
+            )
+        os.replace(tmp_path, path)
+        print(f"💾 Эмбеддинги сохранены в {path}: {len(rows)} строк")
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить {path}: {e}")
+
+
+def cached_embeddings(texts, name, backend=None, cache_dir=None, chunk_size=EMBEDDING_BATCH_SIZE):
+    """Эмбеддинги фиксированного набора текстов с кэшем на диске.
+
+    Файл называется по name и хэшу модели, векторы в нем хранятся
+    построчно под text_key текста. Поэтому смена модели дает новый файл, а
+    при изменении набора движок считает только новые тексты, вызовами по
+    chunk_size текстов; посчитанное сохраняется, даже если следующий вызов
+    не удался. Если все тексты есть в файле, сеть и модель не используются.
+    Возвращает None, если часть эмбеддингов посчитать не удалось.
+    """
+    backend = backend or get_backend()
+    cache_dir = cache_dir or EMBEDDINGS_CACHE_DIR
+    texts = list(texts)
+    keys = [text_key(text) for text in texts]
+    path = os.path.join(cache_dir, f"{name}-{embeddings_cache_key(backend)}.npz")
+
+    rows = _load_rows(path, backend.model_name)
+    missing = list({key: text for key, text in zip(keys, texts) if key not in rows}.items())
+    if not missing:
+        print(f"✅ Эмбеддинги '{name}' загружены из {path}")
+    else:
+        if rows:
+            print(f"🔄 Эмбеддинги '{name}': {len(texts) - len(missing)} из {path}, считаем {len(missing)} новых")
+        computed = 0
+        for begin in range(0, len(missing), chunk_size):
+            chunk = missing[begin:begin + chunk_size]
+            vectors = backend.encode([text for _, text in chunk])
+            if vectors is None or len(vectors) != len(chunk):
+                break
+            for (key, _), vector in zip(chunk, vectors):
+                rows[key] = np.asarray(vector, dtype=np.float32)
+            computed += len(chunk)
+        if computed:
+            # Строки текстов, которых больше нет в наборе, не переносим
+            _save_rows(path, {key: rows[key] for key in dict.fromkeys(keys) if key in rows}, backend.model_name)
+        if computed < len(missing):
+            return None
+
+    return np.stack([rows[key] for key in keys])
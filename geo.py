@@ -0,0 +1,133 @@
+import math
+import re
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+# Длина одного градуса широты в метрах
+M_PER_DEG = math.pi * EARTH_RADIUS_M / 180
+
+_LAT_LON_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*[,;\s]\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Расстояние по поверхности Земли в метрах, работает поэлементно над массивами"""
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_matrix(lat, lon):
+    """Матрица попарных расстояний в метрах между точками (lat[i], lon[i])"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    return haversine_m(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+
+def parse_lat_lon(value):
+    """Приводит [lat, lon] или строку 'lat, lon' к паре float, иначе None"""
+    if isinstance(value, str):
+        match = _LAT_LON_PATTERN.match(value)
+        if not match:
+            return None
+        value = match.groups()
+    try:
+        lat, lon = (float(v) for v in value)
+    except (TypeError, ValueError):
+        return None
+    if not (math.isfinite(lat) and math.isfinite(lon) and abs(lat) <= 90 and abs(lon) <= 180):
+        return None
+    return lat, lon
+
+
+def grid_cell(lat, lon, cell_m):
+    """Ячейка сетки примерно cell_m x cell_m метров, в которую попадает точка"""
+    cell_lat = cell_m / M_PER_DEG
+    row = math.floor(lat / cell_lat)
+    # Ширина по долготе берется по середине ряда, чтобы все точки ряда делили одну сетку
+    cell_lon = cell_lat / max(math.cos(math.radians((row + 0.5) * cell_lat)), 0.01)
+    return row, math.floor(lon / cell_lon)
+
+
+class GridIndex:
+    """Пространственный индекс мест на равномерной сетке.
+
+    Точки раскладываются по ячейкам размером примерно cell_m x cell_m метров;
+    запрос просматривает только ячейки, пересекающие круг поиска, а точные
+    расстояния до кандидатов считаются одним векторным вызовом haversine.
+    """
+
+    def __init__(self, lat, lon, labels=None, valid=None, cell_m=500):
+        self.lat = lat
+        self.lon = lon
+        self.labels = labels
+        if valid is None:
+            valid = np.isfinite(lat) & np.isfinite(lon)
+        points = np.flatnonzero(valid)
+
+        ref_lat = float(np.median(lat[points])) if len(points) else 0.0
+        self.cell_lat = cell_m / M_PER_DEG
+        self.cell_lon = self.cell_lat / max(math.cos(math.radians(ref_lat)), 0.01)
+
+        rows = np.floor(lat[points] / self.cell_lat).astype(np.int64)
+        cols = np.floor(lon[points] / self.cell_lon).astype(np.int64)
+        keys = self._key(rows, cols)
+        order = np.argsort(keys, kind='stable')
+        self._points = points[order]
+        self._points.flags.writeable = False
+
+        sorted_keys = keys[order]
+        unique_keys, starts = np.unique(sorted_keys, return_index=True)
+        ends = np.append(starts[1:], len(sorted_keys))
+        self._cells = {int(k): (int(s), int(e)) for k, s, e in zip(unique_keys, starts, ends)}
+
+    @staticmethod
+    def _key(row, col):
+        return (row << 32) + (col & 0xFFFFFFFF)
+
+    def _cells_in_radius(self, lat, lon, radius_m):
+        lat_span = radius_m / M_PER_DEG
+        max_lat = min(abs(lat) + lat_span, 89.9)
+        lon_span = lat_span / max(math.cos(math.radians(max_lat)), 0.01)
+
+        row_lo = math.floor((lat - lat_span) / self.cell_lat)
+        row_hi = math.floor((lat + lat_span) / self.cell_lat)
+        col_lo = math.floor((lon - lon_span) / self.cell_lon)
+        col_hi = math.floor((lon + lon_span) / self.cell_lon)
+
+        chunks = []
+        for row in range(row_lo, row_hi + 1):
+            for col in range(col_lo, col_hi + 1):
+                cell = self._cells.get(self._key(row, col))
+                if cell is not None:
+                    chunks.append(self._points[cell[0]:cell[1]])
+        if not chunks:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(chunks)
+
+    def nearest(self, lat, lon, k=10, radius_m=None, labels=None):
+        """Возвращает до k ближайших точек (индексы и расстояния в метрах).
+
+        radius_m ограничивает поиск кругом, labels оставляет только точки
+        с указанными метками (например, категориями мест).
+        """
+        if radius_m is None:
+            candidates = self._points
+        else:
+            candidates = self._cells_in_radius(lat, lon, radius_m)
+        if labels is not None and len(candidates):
+            allowed = np.asarray(list(labels), dtype=self.labels.dtype)
+            candidates = candidates[np.isin(self.labels[candidates], allowed)]
+
+        distances = haversine_m(lat, lon, self.lat[candidates], self.lon[candidates])
+        if radius_m is not None:
+            inside = distances <= radius_m
+            candidates, distances = candidates[inside], distances[inside]
+
+        if k is not None and len(candidates) > k:
+            top = np.argpartition(distances, k - 1)[:k]
+            candidates, distances = candidates[top], distances[top]
+
+        order = np.argsort(distances, kind='stable')
+        return candidates[order], distances[order]
@@ -0,0 +1,60 @@
+"""Настройки gunicorn для API маршрутов: gunicorn -c gunicorn.conf.py wsgi:app
+
+Процессов GUNICORN_WORKERS (по умолчанию WEB_CONCURRENCY или 2), в каждом
+GUNICORN_THREADS потоков: запрос большую часть времени ждет модель, поэтому
+потоков нужно больше, чем ядер. При SIGTERM процесс перестает принимать
+запросы и задания /routes и дожидается текущих запросов и уже принятых
+заданий; все это укладывается в GUNICORN_GRACEFUL_TIMEOUT секунд, после
+которых мастер убивает процесс.
+
+Процессы делят ответы модели и статусы заданий /routes через общее
+хранилище: при нескольких процессах ROUTE_CACHE_BACKEND по умолчанию
+sqlite, а memory считается ошибкой конфигурации (можно задать redis).
+"""
+import os
+import signal
+import time
+
+bind = f"0.0.0.0:{os.getenv('PORT', 10000)}"
+workers = int(os.getenv('GUNICORN_WORKERS', os.getenv('WEB_CONCURRENCY', 2)))
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+
+if workers > 1:
+    # Кэш и задания в памяти процесса другие процессы не видят: опрос /routes получил бы 404
+    if os.environ.setdefault('ROUTE_CACHE_BACKEND', 'sqlite') == 'memory':
+        raise SystemExit(f"ROUTE_CACHE_BACKEND=memory не работает при {workers} процессах gunicorn: "
+                         "задайте sqlite или redis либо GUNICORN_WORKERS=1")
+worker_class = 'gthread'
+preload_app = True
+
+# Запрос к модели вместе с повторами может занять до LLM_DEADLINE секунд
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# Запас до конца graceful_timeout на запись результатов и выход процесса
+JOB_DRAIN_MARGIN = 2
+keepalive = 5
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    # Отсчет graceful_timeout начинается с SIGTERM: тогда же перестаем принимать задания
+    handle_exit = worker.handle_exit
+
+    def on_sigterm(sig, frame):
+        from route_explainer import get_route_jobs
+        worker.exit_started = time.monotonic()
+        get_route_jobs().close()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+
+def worker_exit(server, worker):
+    # Задания /routes, уже принятые этим процессом, стоит закончить: клиент ждет их результат.
+    # Они выполнялись, пока процесс дожидался текущих запросов, ждем только остаток окна
+    from route_explainer import get_route_jobs
+    elapsed = time.monotonic() - getattr(worker, 'exit_started', time.monotonic())
+    if not get_route_jobs().drain(max(graceful_timeout - elapsed - JOB_DRAIN_MARGIN, 0)):
+        server.log.warning("Не все задания маршрутов закончены к остановке процесса %s", worker.pid)
@@ -0,0 +1,180 @@
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+from caching import ROUTE_CACHE_BACKEND, ROUTE_CACHE_PATH, ROUTE_CACHE_URL, RedisCache, SQLiteCache, TTLCache
+
+# Сколько заданий выполняется одновременно и сколько может ждать в очереди
+ROUTE_JOB_WORKERS = int(os.getenv('ROUTE_JOB_WORKERS', 8))
+ROUTE_JOB_QUEUE = int(os.getenv('ROUTE_JOB_QUEUE', 256))
+# Сколько секунд хранится запись задания и сколько записей держит хранилище
+ROUTE_JOB_TTL = float(os.getenv('ROUTE_JOB_TTL', 3600))
+ROUTE_JOB_STORE_SIZE = int(os.getenv('ROUTE_JOB_STORE_SIZE', 10000))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    """В очереди нет места для нового задания"""
+
+
+def _server_workers():
+    return int(os.getenv('GUNICORN_WORKERS', os.getenv('WEB_CONCURRENCY', 1)))
+
+
+def create_job_store(backend=ROUTE_CACHE_BACKEND):
+    """Хранилище записей заданий, выбранное через ROUTE_CACHE_BACKEND.
+
+    Оно отдельно от кэша маршрутов и не держит локальную копию записей:
+    статус задания меняется в другом процессе, и каждое чтение должно идти
+    в общее хранилище. С memory статус виден только процессу, принявшему
+    задание, поэтому при нескольких процессах нужен sqlite или redis.
+    """
+    if backend == 'memory':
+        if _server_workers() > 1:
+            print("⚠️ Задания /routes хранятся в памяти процесса, а процессов несколько: "
+                  "опрос статуса попадет в другой процесс и получит 404. Задайте ROUTE_CACHE_BACKEND=sqlite или redis")
+        return TTLCache(maxsize=ROUTE_JOB_STORE_SIZE, ttl=ROUTE_JOB_TTL)
+    if backend == 'sqlite':
+        return SQLiteCache(ROUTE_CACHE_PATH, maxsize=ROUTE_JOB_STORE_SIZE, ttl=ROUTE_JOB_TTL, table='jobs')
+    if backend == 'redis':
+        return RedisCache(ROUTE_CACHE_URL, ttl=ROUTE_JOB_TTL, prefix='route-job:')
+    raise ValueError(f"Неизвестный ROUTE_CACHE_BACKEND: {backend!r}, допустимо: memory, sqlite, redis")
+
+
+class JobQueue:
+    """Фоновое выполнение заданий пулом потоков с ограниченной очередью.
+
+    submit() кладет задание в очередь и сразу возвращает его запись с id,
+    workers потоков по очереди выполняют run(payload). Запись задания
+    ({id, status, result | error, code}) хранится в store под ключом
+    prefix + id, поэтому при общем store (create_job_store() с SQLite или
+    Redis) узнать статус можно в любом процессе. Сообщения исключений из
+    public_errors отдаются клиенту вместе с их атрибутом status, остальные
+    заменяются на 'Internal server error'. Если в очереди уже max_pending
+    заданий, submit() бросает JobQueueFull.
+    """
+
+    def __init__(self, run, store, workers=ROUTE_JOB_WORKERS, max_pending=ROUTE_JOB_QUEUE, prefix='job:',
+                 public_errors=()):
+        self._run_job = run
+        self._store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.prefix = prefix
+        self.public_errors = public_errors
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+        self._closed = False
+        self._stats = {'submitted': 0, 'rejected': 0, 'running': 0, 'done': 0, 'failed': 0, 'store_errors': 0}
+
+    def _ensure_workers(self):
+        # После fork потоки родителя в дочернем процессе не существуют
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(self.max_pending)
+                    for _ in range(self.workers):
+                        threading.Thread(target=self._work, args=(self._queue,), daemon=True).start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self._stats[name] += delta
+
+    def _save(self, job):
+        self._store.set(self.prefix + job['id'], job)
+        return job
+
+    def submit(self, payload):
+        if self._closed:
+            return self._reject("очередь остановлена")
+        job_queue = self._ensure_workers()
+        if job_queue.full():
+            return self._reject()
+        # Запись сохраняется до постановки в очередь, иначе обработчик мог бы обновить ее раньше
+        job = self._save({'id': uuid.uuid4().hex, 'status': QUEUED, 'created': time.time()})
+        try:
+            job_queue.put_nowait((job, payload))
+        except queue.Full:
+            # Очередь заполнилась между проверкой и постановкой: запись истечет по TTL хранилища
+            return self._reject()
+        self._count('submitted')
+        return job
+
+    def _reject(self, reason=None):
+        self._count('rejected')
+        raise JobQueueFull(reason or f"в очереди уже {self.max_pending} заданий")
+
+    def get(self, job_id):
+        return self._store.get(self.prefix + job_id)
+
+    def _work(self, job_queue):
+        while True:
+            job, payload = job_queue.get()
+            try:
+                job = self._execute(job, payload)
+                self._save({**job, 'finished': time.time()})
+            except Exception as e:
+                # Сбой хранилища не должен останавливать обработчик: за ним в очереди другие задания
+                self._count('store_errors')
+                print(f"💥 Не удалось сохранить итог задания {job['id']}: {e}")
+                traceback.print_exc()
+            finally:
+                job_queue.task_done()
+
+    def _execute(self, job, payload):
+        """Выполняет задание и возвращает его запись с итогом (еще не сохраненную)"""
+        try:
+            self._save({**job, 'status': RUNNING, 'started': time.time()})
+        except Exception as e:
+            # Статус running только для наблюдения, из-за него задание не отменяем
+            self._count('store_errors')
+            print(f"⚠️ Не удалось отметить задание {job['id']} выполняющимся: {e}")
+        self._count('running')
+        try:
+            result = self._run_job(payload)
+        except self.public_errors as e:
+            job = {**job, 'status': FAILED, 'error': str(e), 'code': getattr(e, 'status', 500)}
+        except Exception as e:
+            print(f"💥 Ошибка задания {job['id']}: {e}")
+            traceback.print_exc()
+            job = {**job, 'status': FAILED, 'error': 'Internal server error', 'code': 500}
+        else:
+            job = {**job, 'status': DONE, 'result': result}
+        finally:
+            self._count('running', -1)
+        self._count(job['status'])
+        return job
+
+    def close(self):
+        """Перестает принимать задания: submit() бросает JobQueueFull, принятые выполняются"""
+        self._closed = True
+
+    def drain(self, timeout):
+        """Ждет до timeout секунд, пока задания из очереди не будут выполнены; True, если дождался"""
+        job_queue = self._queue
+        if job_queue is None or self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        with job_queue.all_tasks_done:
+            while job_queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                job_queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queued'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
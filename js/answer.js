@@ -70,12 +70,15 @@ function init() {
             .then(async function (start) {
                 const start_coords = start.geoObjects.get(0).geometry.getCoordinates();
                 
-                // Сортируем места по расстоянию от стартовой точки
-                routeData.places.sort((a, b) => {
-                    const distA = calculateDistance(start_coords, [a.coord[0], a.coord[1]]);
-                    const distB = calculateDistance(start_coords, [b.coord[0], b.coord[1]]);
-                    return distA - distB;
-                });
+                // Сервер отдает места уже в порядке обхода (у каждого есть номер order);
+                // старые ответы без него сортируем по расстоянию от стартовой точки
+                if (!routeData.places.every(place => Number.isInteger(place.order))) {
+                    routeData.places.sort((a, b) => {
+                        const distA = calculateDistance(start_coords, [a.coord[0], a.coord[1]]);
+                        const distB = calculateDistance(start_coords, [b.coord[0], b.coord[1]]);
+                        return distA - distB;
+                    });
+                }
 
                 // Рассчитываем время для каждого отрезка маршрута
                 for (let index = 0; index < routeData.places.length; index++) {
@@ -84,6 +84,67 @@ document.addEventListener('click', (e) => {
     }
 });
 
+// Координаты начальной точки нужны серверу, чтобы подбирать места поблизости
+async function geocodeStartPoint(address) {
+  if (!address || typeof ymaps === 'undefined') {
+    return null;
+  }
+  try {
+    await ymaps.ready();
+    const result = await ymaps.geocode(address, {results: 1});
+    const first = result.geoObjects.get(0);
+    return first ? first.geometry.getCoordinates() : null;
+  } catch (error) {
+    console.error('Ошибка геокодирования:', error);
+    return null;
+  }
+}
+
+const API_URL = 'https://map-bot-3rhu.onrender.com';
+const POLL_INTERVAL_MS = 1500;
+const POLL_TIMEOUT_MS = 5 * 60 * 1000;
+// Запись задания может еще не дойти до процесса, ответившего на опрос:
+// задание считается потерянным только после нескольких 404 подряд
+const POLL_MAX_NOT_FOUND = 5;
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+// Маршрут строится в фоне: сервер сразу отдает id задания, а мы опрашиваем его статус.
+// Короткие запросы не обрываются прокси и мобильной сетью, сбой одного опроса не страшен
+async function waitForRoute(jobUrl) {
+  const startedAt = Date.now();
+  let notFound = 0;
+  while (Date.now() - startedAt < POLL_TIMEOUT_MS) {
+    await sleep(POLL_INTERVAL_MS);
+    let response;
+    try {
+      response = await fetch(jobUrl, {headers: {'Accept': 'application/json'}});
+    } catch (error) {
+      console.warn('Ошибка опроса статуса маршрута:', error);
+      continue;
+    }
+    if (response.status === 404) {
+      notFound += 1;
+      if (notFound >= POLL_MAX_NOT_FOUND) {
+        throw new Error('Задание не найдено');
+      }
+      continue;
+    }
+    notFound = 0;
+    if (!response.ok) {
+      continue;
+    }
+    const job = await response.json();
+    if (job.status === 'done') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error);
+    }
+  }
+  throw new Error('Превышено время ожидания маршрута');
+}
+
 document.getElementById('routeForm').addEventListener('submit', async (e) => {
   e.preventDefault();
   console.log("Кнопка нажата");
@@ -104,11 +165,12 @@ document.getElementById('routeForm').addEventListener('submit', async (e) => {
     query: firstTextarea.value,
     hours: selectedHours,
     minutes: selectedMinutes,
-    startPoint: thirdTextarea.value
+    startPoint: thirdTextarea.value,
+    startCoord: await geocodeStartPoint(thirdTextarea.value)
   };
   
   try {
-    const response = await fetch('https://map-bot-3rhu.onrender.com/generate_route', {
+    const response = await fetch(`${API_URL}/routes`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -130,7 +192,8 @@ document.getElementById('routeForm').addEventListener('submit', async (e) => {
       throw new Error('Server returned non-JSON response');
     }
 
-    const result = await response.json();
+    const job = await response.json();
+    const result = await waitForRoute(`${API_URL}/routes/${job.id}`);
     localStorage.setItem('routeData', JSON.stringify(result));
     window.location.href = 'answer.html';
     
@@ -0,0 +1,72 @@
+import json
+
+
+class PlacesStreamParser:
+    """Инкрементальный разбор JSON маршрута, который модель выдает по частям.
+
+    feed() принимает очередной фрагмент текста и возвращает объекты из
+    массива "places" верхнего уровня, которые закрылись в этом фрагменте,
+    не дожидаясь конца ответа. Текст до первой '{' (пояснения, ```json)
+    пропускается. Объекты, которые не разбираются как JSON, пропускаются:
+    полный ответ все равно разбирается после окончания генерации.
+    """
+
+    def __init__(self, key='places'):
+        self.key = key
+        self._text = ''
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._array_depth = None
+        self._object_start = None
+
+    def text(self):
+        return self._text
+
+    def feed(self, chunk):
+        offset = len(self._text)
+        self._text += chunk
+        text = self._text
+        closed = []
+
+        for i, char in enumerate(chunk, offset):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        # Строки на верхнем уровне объекта: ключи и простые значения
+                        self._last_string = text[self._string_start + 1:i]
+                continue
+
+            if not self._stack and char != '{':
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in '{[':
+                self._stack.append(char)
+                depth = len(self._stack)
+                if char == '[' and depth == 2 and self._last_string == self.key:
+                    self._array_depth = depth
+                elif char == '{' and self._array_depth is not None and depth == self._array_depth + 1:
+                    self._object_start = i
+            elif char in '}]':
+                if not self._stack:
+                    continue
+                depth = len(self._stack)
+                self._stack.pop()
+                if char == '}' and self._object_start is not None and depth == self._array_depth + 1:
+                    try:
+                        closed.append(json.loads(text[self._object_start:i + 1]))
+                    except ValueError:
+                        pass
+                    self._object_start = None
+                elif char == ']' and depth == self._array_depth:
+                    self._array_depth = None
+        return closed
@@ -0,0 +1,353 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import httpx
+
+from circuit_breaker import CircuitBreaker
+from metrics import Histogram
+
+LLM_API_URL = os.getenv('LLM_API_URL', 'https://router.huggingface.co/v1/chat/completions')
+# Таймаут одной попытки и общий срок на запрос со всеми повторами, секунды
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 60))
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', 90))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 4))
+# Сколько запросов к модели процесс держит одновременно; остальные ждут слота до своего срока
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+# Паузы между повторами: случайные в [0, min(max, base * 2^попытка)] секунд
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 1))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', 20))
+# Подстраховка: если ответа нет дольше этого квантиля времени ответа, отправляется второй запрос.
+# 0 — без подстраховки; второй запрос идет к LLM_ALT_MODEL, если она задана
+LLM_HEDGE_QUANTILE = float(os.getenv('LLM_HEDGE_QUANTILE', 0))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20))
+LLM_ALT_MODEL = os.getenv('LLM_ALT_MODEL', '')
+
+# Корзины гистограммы времени ответа, секунды
+_LATENCY_BOUNDS = (0.25, 0.5, 0.75, 1, 1.5, 2, 3, 4, 5, 6, 8, 10, 13, 16, 20, 25, 30, 40, 50, 60, 90)
+# Как часто ожидание подстраховки проверяет отмену, секунды
+_CANCEL_POLL = 0.05
+
+# Ответы, после которых имеет смысл повторить запрос (модель загружается, перегрузка)
+_RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+# Что бросает разбор JSON другой структуры, чем у chat completions (нет полей, не те типы)
+_MALFORMED = (KeyError, IndexError, TypeError, AttributeError)
+
+
+class LLMError(Exception):
+    """Модель не дала ответа"""
+
+
+class LLMDeadlineExceeded(LLMError):
+    """Истек общий срок на запрос"""
+
+
+class LLMCancelled(LLMError):
+    """Запрос отменен вызывающим кодом (например, клиент ушел)"""
+
+
+class LLMCircuitOpen(LLMError):
+    """Автомат разомкнут: модель деградировала, запрос не отправлялся"""
+
+
+class LLMClient:
+    """Клиент chat completions с пулом соединений и ограничением параллельности.
+
+    Соединения переиспользуются (keep-alive) одним httpx.Client на процесс.
+    Повторы идут с экспоненциальной паузой со случайным разбросом и
+    укладываются в общий срок; пауза прерывается событием cancel, так что
+    поток не спит, когда ответ уже никому не нужен. Число одновременных
+    запросов ограничено семафором: при деградации модели нагрузка на нее
+    не растет с числом ожидающих потоков.
+
+    Исходы запросов считает CircuitBreaker: пока модель деградировала,
+    запросы сразу завершаются LLMCircuitOpen. Если задан hedge_quantile,
+    chat() после этого квантиля времени ответа отправляет второй запрос (к
+    alt_model, если она задана) и возвращает первый успешный ответ.
+    """
+
+    def __init__(self, api_token, model_name, api_url=LLM_API_URL, timeout=LLM_TIMEOUT,
+                 deadline=LLM_DEADLINE, max_retries=LLM_MAX_RETRIES, max_concurrency=LLM_MAX_CONCURRENCY,
+                 backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX, transport=None, breaker=None,
+                 hedge_quantile=LLM_HEDGE_QUANTILE, hedge_min_samples=LLM_HEDGE_MIN_SAMPLES, alt_model=LLM_ALT_MODEL):
+        self.model_name = model_name
+        self.api_token = api_token
+        self.api_url = api_url
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.alt_model = alt_model or model_name
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.latency = Histogram(_LATENCY_BOUNDS)
+        self._client = httpx.Client(
+            headers={"Authorization": f"Bearer {api_token}", "Content-Type": "application/json"},
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=timeout,
+            transport=transport,
+        )
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Оба запроса с подстраховкой выполняются здесь, вызывающий поток только ждет первый ответ
+        self._hedge_pool = (ThreadPoolExecutor(max_workers=2 * max_concurrency, thread_name_prefix='llm-hedge')
+                            if hedge_quantile > 0 else None)
+        self._stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'attempts': 0, 'retries': 0, 'failures': 0,
+                       'rejected': 0, 'cancelled': 0, 'short_circuited': 0, 'in_flight': 0,
+                       'hedged': 0, 'hedge_wins': 0}
+
+    def _count(self, name, delta=1):
+        with self._stats_lock:
+            self._stats[name] += delta
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['hedge_win_rate'] = round(stats['hedge_wins'] / stats['hedged'], 4) if stats['hedged'] else 0.0
+        stats['hedge_delay'] = self._hedge_delay()
+        stats['latency'] = self.latency.snapshot()
+        stats['breaker'] = self.breaker.stats()
+        return stats
+
+    def close(self):
+        self._client.close()
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+
+    def payload(self, messages, **params):
+        return {"model": self.model_name, "messages": messages, **params}
+
+    def _deadline(self, deadline):
+        if not self.api_token:
+            raise LLMError("HF_API_TOKEN не установлен")
+        return deadline if deadline is not None else time.monotonic() + self.deadline
+
+    @contextmanager
+    def _slot(self, deadline, wait=True):
+        self._count('requests')
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise LLMCircuitOpen("модель деградировала, запросы к ней временно не отправляются")
+        if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0) if wait else 0):
+            # Очередь на слот — перегрузка этого процесса, а не модели
+            self.breaker.release()
+            self._count('rejected')
+            raise LLMDeadlineExceeded("нет свободного слота для запроса к модели")
+        self._count('in_flight')
+        started = time.monotonic()
+        try:
+            yield
+        except LLMCancelled:
+            self._count('cancelled')
+            self.breaker.release()
+            raise
+        except LLMError:
+            self._count('failures')
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Поток закрыт вызывающим до конца ответа или ошибка не связана с моделью
+            self.breaker.release()
+            raise
+        else:
+            self.breaker.record_success(time.monotonic() - started)
+        finally:
+            self._count('in_flight', -1)
+            self._slots.release()
+
+    def _remaining(self, deadline, cancel, last_error):
+        if cancel is not None and cancel.is_set():
+            raise LLMCancelled("запрос отменен")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded(f"истек срок запроса к модели: {last_error}")
+        self._count('attempts')
+        return remaining
+
+    def _wait_retry(self, attempt, retry_after, deadline, cancel, last_error):
+        delay = self._backoff(attempt, retry_after)
+        if time.monotonic() + delay >= deadline:
+            raise LLMDeadlineExceeded(f"истек срок запроса к модели: {last_error}")
+        self._count('retries')
+        if cancel is not None:
+            if cancel.wait(delay):
+                raise LLMCancelled("запрос отменен")
+        else:
+            time.sleep(delay)
+
+    def chat(self, messages, deadline=None, cancel=None, max_retries=None, **params):
+        """Текст ответа модели на messages.
+
+        deadline — момент time.monotonic(), к которому нужно уложиться (по
+        умолчанию через self.deadline секунд), cancel — threading.Event для
+        отмены. Бросает LLMError, если ответа нет.
+        """
+        deadline = self._deadline(deadline)
+        max_retries = max(self.max_retries if max_retries is None else max_retries, 1)
+        payload = self.payload(messages, **params)
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None:
+            return self._timed_chat(payload, deadline, cancel, max_retries)
+        return self._hedged_chat(payload, hedge_delay, deadline, cancel, max_retries)
+
+    def _hedge_delay(self):
+        if self._hedge_pool is None or self.latency.count < self.hedge_min_samples:
+            return None
+        return self.latency.quantile(self.hedge_quantile)
+
+    def _timed_chat(self, payload, deadline, cancel, max_retries, hedge=False):
+        # Дубль уходит только в свободный слот, иначе подстраховка отнимала бы слоты у основных запросов
+        with self._slot(deadline, wait=not hedge):
+            if hedge:
+                self._count('hedged')
+            started = time.monotonic()
+            text = self._chat(payload, deadline, cancel, max_retries)
+        self.latency.observe(time.monotonic() - started)
+        return text
+
+    def _hedged_chat(self, payload, hedge_delay, deadline, cancel, max_retries):
+        # Проигравший запрос останавливается перед следующей попыткой; уже отправленный дорабатывает в пуле
+        stop = threading.Event()
+        primary = self._hedge_pool.submit(self._timed_chat, payload, deadline, stop, max_retries)
+        pending = {primary}
+        hedge_at = time.monotonic() + hedge_delay
+        hedged = False
+        error = None
+        try:
+            while pending:
+                if cancel is not None and cancel.is_set():
+                    raise LLMCancelled("запрос отменен")
+                timeout = None if hedged else max(hedge_at - time.monotonic(), 0)
+                if cancel is not None:
+                    timeout = _CANCEL_POLL if timeout is None else min(timeout, _CANCEL_POLL)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        text = future.result()
+                    except LLMError as e:
+                        error = e
+                        continue
+                    if future is not primary:
+                        self._count('hedge_wins')
+                    return text
+
+                if not hedged and pending and time.monotonic() >= hedge_at:
+                    hedged = True
+                    print(f"🐢 Модель не ответила за {hedge_delay:g} с, дублируем запрос в {self.alt_model}")
+                    pending.add(self._hedge_pool.submit(
+                        self._timed_chat, {**payload, 'model': self.alt_model}, deadline, stop, max_retries, True
+                    ))
+            raise error
+        finally:
+            stop.set()
+
+    def _chat(self, payload, deadline, cancel, max_retries):
+        last_error = "нет попыток"
+        for attempt in range(max_retries):
+            remaining = self._remaining(deadline, cancel, last_error)
+            retry_after = None
+            try:
+                response = self._client.post(self.api_url, json=payload, timeout=min(self.timeout, remaining))
+                if response.status_code == 200:
+                    result = response.json()
+                    if result.get("choices"):
+                        return result["choices"][0]["message"]["content"]
+                    last_error = "ответ без choices"
+                elif response.status_code in _RETRY_STATUSES:
+                    last_error = f"HTTP {response.status_code}"
+                    retry_after = self._retry_after(response)
+                    print(f"⏳ Модель недоступна ({last_error}), попытка {attempt + 1}")
+                else:
+                    raise LLMError(f"ошибка API: {response.status_code} - {response.text[:200]}")
+            except httpx.TimeoutException:
+                last_error = "таймаут"
+                print(f"⏰ Таймаут запроса (попытка {attempt + 1})")
+            except httpx.TransportError as e:
+                last_error = f"сетевая ошибка: {e}"
+                print(f"💥 Ошибка при запросе к API: {e}")
+            except ValueError as e:
+                last_error = f"некорректный ответ: {e}"
+            except _MALFORMED as e:
+                last_error = f"некорректный ответ: {type(e).__name__}: {e}"
+                print(f"💥 Некорректный ответ модели (попытка {attempt + 1}): {last_error}")
+
+            if attempt + 1 < max_retries:
+                self._wait_retry(attempt, retry_after, deadline, cancel, last_error)
+
+        raise LLMError(f"модель не ответила после {max_retries} попыток: {last_error}")
+
+    def stream_chat(self, messages, deadline=None, cancel=None, max_retries=None, **params):
+        """Генератор фрагментов ответа модели по мере генерации (stream=True, SSE).
+
+        Повторы возможны только до первого фрагмента, после него ошибка
+        передается вызывающему как LLMError. Закрытие генератора (например,
+        клиент отключился) закрывает соединение с моделью.
+        """
+        deadline = self._deadline(deadline)
+        max_retries = max(self.max_retries if max_retries is None else max_retries, 1)
+        payload = self.payload(messages, stream=True, **params)
+        with self._slot(deadline):
+            yield from self._stream(payload, deadline, cancel, max_retries)
+
+    def _stream(self, payload, deadline, cancel, max_retries):
+        last_error = "нет попыток"
+        for attempt in range(max_retries):
+            remaining = self._remaining(deadline, cancel, last_error)
+            retry_after = None
+            started = False
+            try:
+                with self._client.stream('POST', self.api_url, json=payload,
+                                         timeout=min(self.timeout, remaining)) as response:
+                    if response.status_code == 200:
+                        for line in response.iter_lines():
+                            if cancel is not None and cancel.is_set():
+                                raise LLMCancelled("запрос отменен")
+                            if time.monotonic() > deadline:
+                                raise LLMDeadlineExceeded("истек срок запроса к модели во время генерации")
+                            if not line.startswith('data:'):
+                                continue
+                            data = line[5:].strip()
+                            if data == '[DONE]':
+                                return
+                            choices = json.loads(data).get('choices') or [{}]
+                            delta = (choices[0].get('delta') or {}).get('content')
+                            if delta:
+                                started = True
+                                yield delta
+                        return
+                    response.read()
+                    if response.status_code in _RETRY_STATUSES:
+                        last_error = f"HTTP {response.status_code}"
+                        retry_after = self._retry_after(response)
+                        print(f"⏳ Модель недоступна ({last_error}), попытка {attempt + 1}")
+                    else:
+                        raise LLMError(f"ошибка API: {response.status_code} - {response.text[:200]}")
+            except (httpx.TimeoutException, httpx.TransportError, ValueError, *_MALFORMED) as e:
+                last_error = f"{type(e).__name__}: {e}"
+                if started:
+                    raise LLMError(f"поток ответа модели оборвался: {last_error}")
+                print(f"💥 Ошибка потока от модели (попытка {attempt + 1}): {last_error}")
+
+            if attempt + 1 < max_retries:
+                self._wait_retry(attempt, retry_after, deadline, cancel, last_error)
+
+        raise LLMError(f"модель не ответила после {max_retries} попыток: {last_error}")
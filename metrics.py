@@ -0,0 +1,50 @@
+import bisect
+import threading
+
+
+class Histogram:
+    """Потокобезопасная гистограмма с фиксированными верхними границами корзин.
+
+    Значение попадает в первую корзину с границей >= значения, все, что
+    больше последней границы, — в корзину '+Inf'. Хранит также сумму,
+    число наблюдений и максимум.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = tuple(sorted(bounds))
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Оценка квантиля q сверху: граница корзины, в которую он попадает"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.bounds, self._counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+            return self.max
+
+    def snapshot(self):
+        with self._lock:
+            buckets = {f"le_{bound:g}": count for bound, count in zip(self.bounds, self._counts)}
+            buckets['le_inf'] = self._counts[-1]
+            return {
+                'count': self.count,
+                'mean': round(self.total / self.count, 3) if self.count else 0.0,
+                'max': round(self.max, 3),
+                'buckets': buckets,
+            }
@@ -0,0 +1,303 @@
+import os
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+from geo import GridIndex, haversine_m
+
+DATASET_PATH = 'dataset.xlsx'
+SNAPSHOT_PATH = 'dataset.npz'
+
+# Увеличивается при любом изменении формата снимка, старые снимки пересобираются
+SNAPSHOT_VERSION = 2
+
+# Места дальше этого расстояния от медианной точки датасета считаются ошибкой разметки
+MAX_SPREAD_M = 100_000
+
+_NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def _parse_point(value):
+    """Разбирает строку вида 'POINT(lat lon)' в пару float или (nan, nan)"""
+    numbers = _NUMBER_PATTERN.findall(str(value))
+    if len(numbers) != 2:
+        return np.nan, np.nan
+    return float(numbers[0]), float(numbers[1])
+
+
+def parse_coordinates(values, ids=None, max_spread_m=MAX_SPREAD_M):
+    """Разбирает и проверяет колонку координат один раз при загрузке.
+
+    Возвращает непрерывные массивы float64 lat и lon. Координаты в датасете
+    записаны в порядке (широта долгота); строки с переставленными осями
+    исправляются, а неразборчивые и выпадающие строки получают nan и
+    попадают в отчет.
+    """
+    values = list(values)
+    ids = list(ids) if ids is not None else list(range(len(values)))
+    coords = np.array([_parse_point(value) for value in values], dtype=np.float64).reshape(-1, 2)
+    lat = np.ascontiguousarray(coords[:, 0])
+    lon = np.ascontiguousarray(coords[:, 1])
+
+    problems = []
+    parsed = np.isfinite(lat) & np.isfinite(lon)
+    for i in np.flatnonzero(~parsed):
+        problems.append((ids[i], values[i], "не удалось разобрать"))
+
+    if parsed.any():
+        center_lat = np.median(lat[parsed])
+        center_lon = np.median(lon[parsed])
+        distance = haversine_m(center_lat, center_lon, lat, lon)
+        swapped_distance = haversine_m(center_lat, center_lon, lon, lat)
+        for i in np.flatnonzero(parsed & (distance > max_spread_m)):
+            if swapped_distance[i] <= max_spread_m:
+                lat[i], lon[i] = lon[i], lat[i]
+                problems.append((ids[i], values[i], "переставлены широта и долгота, исправлено"))
+            else:
+                lat[i] = lon[i] = np.nan
+                problems.append((ids[i], values[i], f"дальше {max_spread_m / 1000:.0f} км от центра датасета"))
+
+    for place_id, value, reason in problems:
+        print(f"⚠️ Координаты места id={place_id} {value!r}: {reason}")
+    if problems:
+        invalid = int(np.count_nonzero(~np.isfinite(lat)))
+        print(f"⚠️ Мест без координат: {invalid}, они исключены из маршрутов")
+
+    return lat, lon
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+class PlaceStore:
+    """Неизменяемое колоночное хранилище мест.
+
+    Строится один раз на процесс и разделяется всеми обработчиками запросов
+    только для чтения, без копирования.
+    """
+
+    def __init__(self, ids, titles, category_ids, addresses, descriptions, lat, lon):
+        self.ids = _readonly(np.asarray(ids, dtype=np.int64))
+        self.titles = tuple(titles)
+        self.category_ids = _readonly(np.asarray(category_ids, dtype=np.int64))
+        self.addresses = tuple(addresses)
+        self.descriptions = tuple(descriptions)
+        self.lat = _readonly(np.ascontiguousarray(lat, dtype=np.float64))
+        self.lon = _readonly(np.ascontiguousarray(lon, dtype=np.float64))
+        # Места без корректных координат не участвуют в подборе
+        self.valid = _readonly(np.isfinite(self.lat) & np.isfinite(self.lon))
+        self.valid_indices = _readonly(np.flatnonzero(self.valid))
+        # Медианная точка мест: от нее parse_coordinates отсчитывает MAX_SPREAD_M
+        self.center = (
+            (float(np.median(self.lat[self.valid])), float(np.median(self.lon[self.valid])))
+            if len(self.valid_indices) else None
+        )
+        self.grid = GridIndex(self.lat, self.lon, self.category_ids, self.valid)
+        self._titles_lower = tuple(title.lower() for title in self.titles)
+
+    @classmethod
+    def from_frame(cls, ds):
+        lat, lon = parse_coordinates(ds['coordinate'], ds['id'])
+        return cls(
+            ids=ds['id'].to_numpy(),
+            titles=ds['title'].fillna('').astype(str),
+            category_ids=ds['category_id'].to_numpy(),
+            addresses=ds['address'].fillna('').astype(str),
+            descriptions=ds['description'].fillna('').astype(str),
+            lat=lat,
+            lon=lon,
+        )
+
+    def __len__(self):
+        return len(self.titles)
+
+    def in_categories(self, category_ids):
+        """Индексы мест с координатами, принадлежащих указанным категориям"""
+        mask = np.isin(self.category_ids, np.asarray(list(category_ids), dtype=np.int64)) & self.valid
+        return np.flatnonzero(mask)
+
+    def category_scores(self, scores_by_category, indices=None):
+        """Оценка категории для каждого места (или для indices), 0 для остальных категорий"""
+        table = np.zeros(int(self.category_ids.max(initial=0)) + 1, dtype=np.float32)
+        for category_id, score in scores_by_category.items():
+            if 0 <= category_id < len(table):
+                table[category_id] = score
+        category_ids = self.category_ids if indices is None else self.category_ids[indices]
+        return table[np.clip(category_ids, 0, None)]
+
+    def nearest(self, lat, lon, k=10, radius_m=None, category_ids=None):
+        """k ближайших мест выбранных категорий в радиусе radius_m от точки"""
+        return self.grid.nearest(lat, lon, k=k, radius_m=radius_m, labels=category_ids)
+
+    def coord(self, idx):
+        return [float(self.lat[idx]), float(self.lon[idx])]
+
+    def find(self, place_name, indices=None):
+        """Находит индекс места по названию с учетом нечеткого соответствия"""
+        place_name_clean = place_name.lower().strip()
+        if indices is None:
+            indices = range(len(self))
+
+        # 1. Точное совпадение
+        for idx in indices:
+            if self._titles_lower[idx] == place_name_clean:
+                return int(idx)
+
+        # 2. Частичное совпадение (содержит)
+        for idx in indices:
+            if place_name_clean in self._titles_lower[idx]:
+                return int(idx)
+
+        # 3. Похожее название (по ключевым словам)
+        place_keywords = set(place_name_clean.split())
+        best_match = None
+        best_score = 0
+
+        for idx in indices:
+            candidate_words = set(self._titles_lower[idx].split())
+            common_words = place_keywords.intersection(candidate_words)
+            score = len(common_words) / max(len(place_keywords), 1)
+
+            if score > best_score and score > 0.3:  # Порог схожести
+                best_score = score
+                best_match = int(idx)
+
+        return best_match
+
+
+def _intern_strings(columns):
+    """Упаковывает строковые колонки в общую таблицу уникальных строк.
+
+    Возвращает байты таблицы в UTF-8, смещения строк и по массиву индексов
+    в таблице для каждой колонки.
+    """
+    table = {}
+    column_indices = []
+    for column in columns:
+        column_indices.append(np.array(
+            [table.setdefault(value, len(table)) for value in column], dtype=np.int32
+        ))
+
+    encoded = [value.encode('utf-8') for value in table]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(item) for item in encoded])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return data, offsets, column_indices
+
+
+def _unpack_strings(data, offsets):
+    raw = data.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+
+def save_snapshot(store, snapshot_path=SNAPSHOT_PATH):
+    """Сохраняет хранилище в бинарный колоночный снимок (.npz)"""
+    data, offsets, (titles, addresses, descriptions) = _intern_strings(
+        [store.titles, store.addresses, store.descriptions]
+    )
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(
+            f,
+            version=np.array(SNAPSHOT_VERSION),
+            ids=store.ids,
+            category_ids=store.category_ids,
+            lat=store.lat,
+            lon=store.lon,
+            string_data=data,
+            string_offsets=offsets,
+            titles=titles,
+            addresses=addresses,
+            descriptions=descriptions,
+        )
+    # Атомарная замена, чтобы параллельно стартующие воркеры не прочитали половину файла
+    os.replace(tmp_path, snapshot_path)
+
+
+def load_snapshot(snapshot_path=SNAPSHOT_PATH):
+    with np.load(snapshot_path, allow_pickle=False) as snapshot:
+        if int(snapshot['version']) != SNAPSHOT_VERSION:
+            raise ValueError(f"устаревшая версия снимка: {int(snapshot['version'])}")
+        strings = _unpack_strings(snapshot['string_data'], snapshot['string_offsets'])
+        return PlaceStore(
+            ids=snapshot['ids'],
+            titles=[strings[i] for i in snapshot['titles']],
+            category_ids=snapshot['category_ids'],
+            addresses=[strings[i] for i in snapshot['addresses']],
+            descriptions=[strings[i] for i in snapshot['descriptions']],
+            lat=snapshot['lat'],
+            lon=snapshot['lon'],
+        )
+
+
+def _snapshot_is_fresh(path, snapshot_path):
+    if not os.path.exists(snapshot_path):
+        return False
+    if not os.path.exists(path):
+        return True
+    return os.path.getmtime(snapshot_path) >= os.path.getmtime(path)
+
+
+def compile_snapshot(path=DATASET_PATH, snapshot_path=SNAPSHOT_PATH):
+    """Читает таблицу Excel и пересобирает бинарный снимок"""
+    # pandas и openpyxl нужны только для пересборки, при чтении снимка не импортируются
+    import pandas as pd
+
+    ds = pd.read_excel(path)
+    store = PlaceStore.from_frame(ds)
+    try:
+        save_snapshot(store, snapshot_path)
+        print(f"💾 Снимок датасета сохранен: {snapshot_path}")
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить снимок датасета: {e}")
+    return store
+
+
+def load_place_store(path=DATASET_PATH, snapshot_path=SNAPSHOT_PATH):
+    """Загружает хранилище из снимка, пересобирая его, если таблица новее"""
+    store = None
+    if _snapshot_is_fresh(path, snapshot_path):
+        try:
+            store = load_snapshot(snapshot_path)
+        except Exception as e:
+            print(f"⚠️ Снимок датасета поврежден, пересобираем: {e}")
+
+    if store is None:
+        store = compile_snapshot(path, snapshot_path)
+
+    print(f"✅ Датасет загружен: {len(store)} записей")
+    return store
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_place_store(path=DATASET_PATH):
+    """Возвращает общее для процесса хранилище мест, загружая его при первом обращении"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = load_place_store(path)
+    return _store
+
+
+if __name__ == "__main__":
+    # Шаг сборки: python place_store.py [dataset.xlsx] [dataset.npz]. Снимок не хранится в
+    # репозитории, поэтому команда входит в buildCommand в render.yaml
+    path = sys.argv[1] if len(sys.argv) > 1 else DATASET_PATH
+    snapshot_path = sys.argv[2] if len(sys.argv) > 2 else SNAPSHOT_PATH
+
+    started = time.perf_counter()
+    compile_snapshot(path, snapshot_path)
+    print(f"⏱ Чтение {path}: {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    started = time.perf_counter()
+    load_snapshot(snapshot_path)
+    print(f"⏱ Чтение {snapshot_path}: {(time.perf_counter() - started) * 1000:.1f} мс")
@@ -1,23 +1,28 @@
 import os
 import logging
-import pandas as pd
 import json
 from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Response, request, jsonify, make_response
 from flask_cors import CORS
-from threading import Thread
+from threading import Thread, Lock
 import random
-from sentence_transformers import SentenceTransformer, util
 import requests
-import torch
 import numpy as np
 import hashlib
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from typing import List, Dict, Any
 from collections import Counter
+from place_store import MAX_SPREAD_M, get_place_store
+from geo import grid_cell, haversine_m, parse_lat_lon
+from route_planner import MAX_STOPS, select_places
+from embeddings import batcher, cached_embeddings, embed, normalize_query, query_cache
+from caching import ROUTE_CACHE_CELL_M, SingleFlight, create_route_cache
+from llm_client import LLM_API_URL, LLM_MAX_CONCURRENCY, LLMCancelled, LLMClient, LLMError
+from json_stream import PlacesStreamParser
+from jobs import JobQueue, JobQueueFull, create_job_store
+from vector_index import build_place_index, normalize_rows
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,10 +30,11 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 HF_API_TOKEN = os.getenv('HF_API_TOKEN')
-HF_API_URL = "https://router.huggingface.co/hf-inference/models/sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-headers = {
-    "Authorization": f"Bearer {HF_API_TOKEN}",
-}
+
+# Бюджет ответа /generate_route по умолчанию, если клиент не передал deadline_ms; 0 — без ограничения
+ROUTE_DEADLINE_MS = float(os.getenv('ROUTE_DEADLINE_MS', 0))
+# Сколько генераций, не уложившихся в бюджет, может досчитываться в фоне; сверх этого фон не запускается
+ROUTE_BACKGROUND_MAX = int(os.getenv('ROUTE_BACKGROUND_MAX', 2 * LLM_MAX_CONCURRENCY))
 
 flask_app = Flask(__name__)
 CORS(flask_app)
@@ -56,15 +62,21 @@ def check_hf_token():
         print(f"❌ Ошибка проверки HF_API_TOKEN: {e}")
         return False
 
-# Проверяем токен при запуске
-check_hf_token()
-
 class RouteExplainer:
-    def __init__(self, api_token=None, model_name="IlyaGusev/saiga_llama3_8b:featherless-ai"):
+    def __init__(self, api_token=None, model_name="IlyaGusev/saiga_llama3_8b:featherless-ai", cache=None):
         self.model_name = model_name
         self.api_token = api_token
-        self.api_url = "https://router.huggingface.co/v1/chat/completions"
-        self._cache = {}
+        self.api_url = LLM_API_URL
+        self._llm = LLMClient(api_token, model_name, api_url=self.api_url)
+        # Кэш маршрутов: по умолчанию выбирается через ROUTE_CACHE_BACKEND
+        self._cache = cache if cache is not None else create_route_cache()
+        # Одинаковые одновременные запросы ждут одного обращения к модели
+        self._inflight = SingleFlight()
+        # Генерации, не уложившиеся в бюджет запроса, досчитываются здесь и попадают в кэш
+        self._background = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix='route-llm')
+        self._budget_lock = Lock()
+        self._budget_counts = {'requests': 0, 'expired': 0, 'dropped': 0}
+        self._background_pending = 0
         self._cached_prompts = self._precompile_prompts()
         self._category_mapping = {
             '1': 'Памятники и скульптуры',
@@ -102,47 +114,21 @@ class RouteExplainer:
         
         self._russian_pattern = re.compile(r'^[а-яА-ЯёЁ0-9\s\.,!?;-]+$')
     
-    def _query_huggingface(self, prompt, max_retries=3):
-        headers = {
-            "Authorization": f"Bearer {self.api_token}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "model": self.model_name,
-            "messages": [
-                {"role": "system", "content": "Ты — умный русскоязычный помощник по созданию туристических маршрутов."},
-                {"role": "user", "content": prompt}
-            ],
-            "max_tokens": 800,
-            "temperature": 0.7,
-            "top_p": 0.9,
-        }
-
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(self.api_url, headers=headers, json=payload, timeout=120)
-                if response.status_code == 200:
-                    result = response.json()
-                    if "choices" in result and len(result["choices"]) > 0:
-                        return result["choices"][0]["message"]["content"]
-                elif response.status_code == 503:
-                    wait_time = (attempt + 1) * 30
-                    print(f"⏳ Модель загружается, ждем {wait_time} секунд...")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    print(f"❌ Ошибка API: {response.status_code} - {response.text}")
-                    if response.status_code in [400, 401, 404]:
-                        break
-            except requests.exceptions.Timeout:
-                print(f"⏰ Таймаут запроса (попытка {attempt + 1})")
-                continue
-            except Exception as e:
-                print(f"💥 Ошибка при запросе к API: {e}")
-                continue
+    def _messages(self, prompt):
+        return [
+            {"role": "system", "content": "Ты — умный русскоязычный помощник по созданию туристических маршрутов."},
+            {"role": "user", "content": prompt}
+        ]
 
-        return ""
+    def _query_huggingface(self, prompt, max_retries=3, deadline=None):
+        try:
+            return self._llm.chat(
+                self._messages(prompt), deadline=deadline, max_retries=max_retries,
+                max_tokens=800, temperature=0.7, top_p=0.9
+            )
+        except LLMError as e:
+            print(f"❌ Модель не ответила: {e}")
+            return ""
     
     def _precompile_prompts(self):
         base_prompt = """Ты - помощник для создания туристических маршрутов. Создай связный маршрут по Нижнему Новгороду. ОБЯЗАТЕЛЬНО ИСПОЛЬЗУЙ ТОЛЬКО РУССКИЙ ЯЗЫК.
@@ -154,14 +140,10 @@ class RouteExplainer:
 Общее время маршрута: {duration} минут
 Начальная точка: {location}
 
-Создай маршрут, который логически соединяет эти места. Для каждого места дай КРАТКОЕ объяснение на РУССКОМ языке - почему именно оно было выбрано с учетом интересов пользователя и категории места.
+Места уже выбраны и перечислены в порядке посещения, в скобках указано время на каждое. Не меняй состав и порядок мест. Для каждого места дай КРАТКОЕ объяснение на РУССКОМ языке - почему именно оно было выбрано с учетом интересов пользователя и категории места.
 
-Верни ответ ТОЛЬКО в формате JSON без каких-либо дополнительных пояснений:
+Верни ответ ТОЛЬКО в формате JSON без каких-либо дополнительных пояснений, поля в указанном порядке:
 {{
-"route_name": "креативное название маршрута на русском",
-"total_duration": общее_время,
-"timeline": "краткое описание временного плана",
-"explanation": "общее объяснение выбора маршрута",
 "places": [
   {{
     "name": "название места",
@@ -169,7 +151,11 @@ class RouteExplainer:
     "duration": 30,
     "reason": "объяснение почему выбрано это место с учетом интересов пользователя"
   }}
-]
+],
+"route_name": "креативное название маршрута на русском",
+"total_duration": общее_время,
+"timeline": "краткое описание временного плана",
+"explanation": "общее объяснение выбора маршрута"
 }}"""
         return {'base': base_prompt}
     
@@ -229,11 +215,85 @@ class RouteExplainer:
         
         return json_str
 
-    def create_route(self, places, user_interests, total_duration, current_location):
-        cache_key = self._generate_cache_key(places, user_interests, total_duration, current_location)
+    def create_route(self, places, user_interests, total_duration, current_location, start=None, budget=None):
+        """Маршрут с текстами модели.
+
+        budget — сколько секунд можно ждать модель. Если она не успела,
+        возвращается запасной маршрут с pending=True, а генерация
+        продолжается в фоне и кладет ответ в кэш для следующего такого же
+        запроса. Обращение к модели здесь не отменяется: его результат нужен
+        кэшу; прервать генерацию можно только у stream_route.
+        """
+        cache_key = self._generate_cache_key(places, user_interests, total_duration, current_location, start)
         
-        if cache_key in self._cache:
-            return self._cache[cache_key]
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        if budget is not None:
+            return self._create_route_within(budget, cache_key, places, user_interests, total_duration, current_location)
+
+        return self._inflight.do(
+            cache_key,
+            lambda: self._generate_route(cache_key, places, user_interests, total_duration, current_location)
+        )
+
+    def _create_route_within(self, budget, cache_key, places, user_interests, total_duration, current_location):
+        # Место в фоне занимаем заранее: если его нет, новую генерацию не начинаем
+        with self._budget_lock:
+            self._budget_counts['requests'] += 1
+            reserved = self._background_pending < ROUTE_BACKGROUND_MAX
+            if reserved:
+                self._background_pending += 1
+
+        if reserved:
+            future, leader = self._inflight.begin(cache_key)
+        else:
+            future, leader = self._inflight.get(cache_key), False
+        if leader:
+            # Клиент может уйти, но ответ модели все равно нужен кэшу
+            self._background.submit(
+                self._run_background, cache_key, future,
+                lambda: self._generate_route(cache_key, places, user_interests, total_duration, current_location)
+            )
+        elif reserved:
+            # Такой же маршрут уже генерируется: ждем его, место в фоне не нужно
+            self._release_background()
+
+        if future is not None:
+            try:
+                return future.result(timeout=max(budget, 0))
+            except FutureTimeout:
+                pass
+
+        route = self._get_optimized_fallback_route(places, user_interests, total_duration)
+        with self._budget_lock:
+            self._budget_counts['expired' if future is not None else 'dropped'] += 1
+        if future is None:
+            print(f"⚠️ Фоновых генераций уже {ROUTE_BACKGROUND_MAX}, отдаем запасной маршрут")
+            return route
+        print(f"⏱ Модель не уложилась в бюджет {budget * 1000:.0f} мс, ответ модели дождемся в фоне")
+        route['pending'] = True
+        return route
+
+    def _run_background(self, cache_key, future, generate):
+        try:
+            self._inflight.run(cache_key, future, generate)
+        except Exception as e:
+            # Ошибку уже получили ожидающие через future
+            print(f"💥 Фоновая генерация маршрута не удалась: {e}")
+        finally:
+            self._release_background()
+
+    def _release_background(self):
+        with self._budget_lock:
+            self._background_pending -= 1
+
+    def _generate_route(self, cache_key, places, user_interests, total_duration, current_location):
+        # Пока этот запрос ждал своей очереди, маршрут мог построить предыдущий
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         places_text = self._format_places_optimized(places)
         
@@ -253,33 +313,115 @@ class RouteExplainer:
             
         except Exception as e:
             print(f"💥 Ошибка при создании маршрута: {e}")
+            response_text = ""
             result = self._get_optimized_fallback_route(places, user_interests, total_duration)
         
-        self._cache[cache_key] = result
+        # Запасной маршрут не кэшируем: следующий запрос может получить ответ модели
+        if response_text:
+            self._cache.set(cache_key, result)
         return result
 
-    def _generate_cache_key(self, places, user_interests, total_duration, current_location):
+    def stream_route(self, places, user_interests, total_duration, current_location, start=None, cancel=None):
+        """Как create_route, но отдает результат по мере генерации.
+
+        Генератор событий ('place', место) для каждого места, как только
+        модель закончила его описывать, и в конце ('route', маршрут) — тот же
+        словарь, что вернул бы create_route. Генерацию прерывает закрытие
+        генератора (так делает /generate_route/stream, когда клиент ушел) или
+        установленный cancel (threading.Event), тогда бросается LLMCancelled.
+        """
+        cache_key = self._generate_cache_key(places, user_interests, total_duration, current_location, start)
+        
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            for place in cached['places']:
+                yield 'place', place
+            yield 'route', cached
+            return
+
+        places_text = self._format_places_optimized(places)
+        prompt = self._create_optimized_prompt(places_text, user_interests, total_duration, current_location)
+        parser = PlacesStreamParser()
+        streamed = 0
+        
+        print(f"📝 Отправляем промпт в модель (потоково)...")
+        
+        try:
+            for delta in self._llm.stream_chat(
+                self._messages(prompt), cancel=cancel, max_retries=3,
+                max_tokens=800, temperature=0.7, top_p=0.9
+            ):
+                for place in parser.feed(delta):
+                    if streamed >= max(len(places), 4):
+                        continue
+                    place = self._validate_place(place, streamed + 1, places, user_interests)
+                    if place is not None:
+                        streamed += 1
+                        yield 'place', place
+            response_text = parser.text()
+        except LLMCancelled:
+            raise
+        except LLMError as e:
+            print(f"❌ Модель не ответила: {e}")
+            response_text = ""
+
+        if response_text:
+            print(f"✅ Получен ответ от модели: {response_text[:200]}...")
+            result = self._parse_and_validate_response(response_text, places, user_interests)
+            self._cache.set(cache_key, result)
+        else:
+            print("⚠️  Пустой ответ от модели, используем запасной вариант")
+            result = self._get_optimized_fallback_route(places, user_interests, total_duration)
+        yield 'route', result
+
+    def cache_stats(self):
+        return self._cache.stats()
+
+    def llm_stats(self):
+        return self._llm.stats()
+
+    def coalescing_stats(self):
+        return self._inflight.stats()
+
+    def budget_stats(self):
+        with self._budget_lock:
+            counts = dict(self._budget_counts, background=self._background_pending)
+        counts['expired_rate'] = round(counts['expired'] / counts['requests'], 4) if counts['requests'] else 0.0
+        return counts
+
+    def _generate_cache_key(self, places, user_interests, total_duration, current_location, start=None):
         places_hash = hashlib.md5(
             ''.join(sorted([p.get('name', '') + str(p.get('category_id', '')) for p in places])).encode()
         ).hexdigest()[:8]
         
         interests_hash = hashlib.md5(
-            str(sorted(user_interests)).encode()
+            str(sorted(normalize_query(interest) for interest in user_interests)).encode()
         ).hexdigest()[:6]
+
+        # Соседние пользователи (в пределах одной ячейки сетки) делят маршрут, далекие — нет
+        location = start or parse_lat_lon(current_location)
+        if location is not None:
+            location_key = "%d:%d" % grid_cell(*location, ROUTE_CACHE_CELL_M)
+        else:
+            location_key = normalize_query(str(current_location or ''))
+        location_hash = hashlib.md5(location_key.encode()).hexdigest()[:6]
         
-        return f"{places_hash}_{interests_hash}_{total_duration}"
+        return f"{places_hash}_{interests_hash}_{location_hash}_{total_duration}"
 
     def _format_places_optimized(self, places):
         if not places:
             return "Нет доступных мест"
             
         formatted_places = []
-        for i, p in enumerate(places[:5], 1):
+        for i, p in enumerate(places, 1):
             place_name = p.get('name', f'Место {i}')
             category_id = str(p.get('category_id', ''))
             category_name = self._map_category(category_id)
             
-            place_str = f"{i}. {place_name} ({category_name})"
+            if 'visit_duration' in p:
+                place_str = f"{i}. {place_name} ({category_name}, {p['visit_duration']} мин)"
+            else:
+                place_str = f"{i}. {place_name} ({category_name})"
             formatted_places.append(place_str)
         
         return "\n".join(formatted_places)
@@ -294,6 +436,23 @@ class RouteExplainer:
             location=current_location
         )
 
+    def _validate_place(self, place, i, places, user_interests):
+        """Чистит место из ответа модели; None, если у него нет названия"""
+        if not isinstance(place, dict) or 'name' not in place:
+            return None
+            
+        place['name'] = self._clean_russian_text(place.get('name', f'Место {i}'))
+        
+        if 'reason' not in place or not self._is_russian_text(place['reason']):
+            original_place = next((p for p in places if p.get('name') == place['name']), None)
+            place['reason'] = self._get_fallback_reason(original_place, user_interests) if original_place else "выбрано как интересное место для посещения"
+        else:
+            place['reason'] = self._clean_russian_text(place['reason'])
+        
+        place['order'] = i
+        place['duration'] = place.get('duration', 30)
+        return place
+
     def _parse_and_validate_response(self, response_text, places, user_interests):
         print(f"🔍 Парсим ответ модели...")
         
@@ -341,22 +500,10 @@ class RouteExplainer:
                     result['route_name'] = self._clean_russian_text(result['route_name'])
             
             valid_places = []
-            for i, place in enumerate(result['places'][:4], 1):
-                if 'name' not in place:
-                    continue
-                    
-                place['name'] = self._clean_russian_text(place.get('name', f'Место {i}'))
-                
-                if 'reason' not in place or not self._is_russian_text(place['reason']):
-                    original_place = next((p for p in places if p.get('name') == place['name']), None)
-                    place['reason'] = self._get_fallback_reason(original_place, user_interests) if original_place else "выбрано как интересное место для посещения"
-                else:
-                    place['reason'] = self._clean_russian_text(place['reason'])
-                
-                place['order'] = i
-                place['duration'] = place.get('duration', 30)
-                
-                valid_places.append(place)
+            for i, place in enumerate(result['places'][:max(len(places), 4)], 1):
+                place = self._validate_place(place, i, places, user_interests)
+                if place is not None:
+                    valid_places.append(place)
             
             if not valid_places:
                 print("❌ Нет валидных мест в маршруте")
@@ -392,11 +539,12 @@ class RouteExplainer:
         if not places:
             return self._get_minimal_fallback_route()
         
-        selected_places = places[:4]
+        selected_places = places if any('visit_duration' in p for p in places) else places[:4]
         
         if len(selected_places) == 0:
             return self._get_minimal_fallback_route()
             
+        # Места без заданного времени посещения делят бюджет поровну
         place_duration = max(25, total_duration // len(selected_places))
         
         route_places = []
@@ -404,7 +552,7 @@ class RouteExplainer:
             route_places.append({
                 "name": self._clean_russian_text(place.get('name', f'Место {i}')),
                 "order": i,
-                "duration": place_duration,
+                "duration": place.get('visit_duration', place_duration),
                 "reason": self._get_fallback_reason(place, user_interests)
             })
         
@@ -412,7 +560,7 @@ class RouteExplainer:
         
         return {
             "route_name": route_name,
-            "total_duration": min(place_duration * len(route_places), 1440),
+            "total_duration": min(sum(p['duration'] for p in route_places), 1440),
             "places": route_places,
             "timeline": f"Посещение {len(route_places)} мест",
             "explanation": f"Маршрут составлен автоматически с учетом ваших интересов: {', '.join(user_interests) if user_interests else 'основные достопримечательности'}"
@@ -470,87 +618,37 @@ class RouteExplainer:
             "explanation": "Рекомендуется уточнить интересующие места для детального маршрута"
         }
 
-# Инициализация RouteExplainer
-route_explainer = RouteExplainer(api_token=HF_API_TOKEN)
-
-def get_bot_token():
-    token = os.getenv('TELEGRAM_BOT_TOKEN')
-    if not token:
-        load_dotenv()
-        token = os.getenv('TELEGRAM_BOT_TOKEN')
-    if not token:
-        raise ValueError("TELEGRAM_BOT_TOKEN was not found!")
-    return token
+# RouteExplainer и очередь заданий создаются в процессе при первом обращении, а не при
+# импорте: им нужны пул соединений, потоки и хранилище, а gunicorn импортирует модуль
+# в мастер-процессе (preload_app), и после fork все это осталось бы в нем
+_process_objects = {}
+_process_objects_lock = Lock()
+
+def _per_process(name, create):
+    """Объект name этого процесса: создается create() при первом обращении и заново после fork"""
+    with _process_objects_lock:
+        pid, obj = _process_objects.get(name, (None, None))
+        if pid != os.getpid():
+            obj = create()
+            _process_objects[name] = (os.getpid(), obj)
+        return obj
+
+def get_route_explainer():
+    """Общий для запросов процесса RouteExplainer"""
+    return _per_process('route_explainer', lambda: RouteExplainer(api_token=HF_API_TOKEN))
 
 def load_dataset():
+    """Возвращает общее для процесса хранилище мест (датасет читается один раз)"""
     try:
-        ds = pd.read_excel('dataset.xlsx')
-        print(f"✅ Датасет загружен: {len(ds)} записей")
-        print(f"📊 Столбцы датасета: {ds.columns.tolist()}")
-        print(f"🎯 Уникальные category_id: {ds['category_id'].unique()}")
-        return ds
+        store = get_place_store()
+        return store
     except Exception as e:
         print(f"❌ Ошибка загрузки датасета - {e}")
         return None
 
-async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [
-        [InlineKeyboardButton("Открыть приложение", web_app={"url": "https://anansypineapple.github.io/miniApp-maps/"})]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("Привет, друг! Нажми кнопку ниже чтобы запустить приложение!",
-                                    reply_markup=reply_markup)
-
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [
-        [InlineKeyboardButton("Открыть приложение", web_app={"url": "https://anansypineapple.github.io/miniApp-maps/"})]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("Чтобы начать работу необходимо запустить приложение!", reply_markup=reply_markup)
-
 def get_embeddings(texts):
-    if not HF_API_TOKEN:
-        print("❌ Ошибка: HF_API_TOKEN не установлен")
-        return None
-        
-    if isinstance(texts, str):
-        texts = [texts]
-    
-    try:
-        print(f"🔄 Отправляем запрос к Sentence Transformer API для {len(texts)} текстов")
-        response = requests.post(
-            HF_API_URL,
-            headers=headers,
-            json={"inputs": texts, "options": {"wait_for_model": True}},
-            timeout=60  # Увеличиваем таймаут
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Успешно получены эмбеддинги")
-            
-            # Улучшенная обработка разных форматов ответа
-            if isinstance(data, list):
-                if all(isinstance(item, list) for item in data):
-                    return data  # Стандартный формат: [[emb1], [emb2], ...]
-                elif all(isinstance(item, (int, float)) for item in data):
-                    return [data]  # Один эмбеддинг как плоский список
-                elif isinstance(data[0], dict) and "embedding" in data[0]:
-                    return [item["embedding"] for item in data]  # Формат с ключом "embedding"
-            
-            # Если формат не распознан, логируем для отладки
-            print(f"⚠️ Неизвестный формат ответа: {type(data)}")
-            if isinstance(data, dict):
-                print(f"📊 Ключи в ответе: {data.keys()}")
-            return None
-            
-        else:
-            print(f"❌ Ошибка API: {response.status_code} - {response.text}")
-            return None
-            
-    except Exception as e:
-        print(f"💥 Исключение при запросе эмбеддингов: {e}")
-        return None
+    """Эмбеддинги текстов движком из EMBEDDING_BACKEND: float32-массив (n, dim) или None"""
+    return embed(texts)
 
 category_names = [
     "Памятники и скульптуры",
@@ -570,55 +668,92 @@ category_names = [
     "Места для развлечения"
 ]
 
+# Если эмбеддинги категорий получить не удалось, пробуем снова не чаще раза в минуту
+CATEGORY_EMBEDDINGS_RETRY_SECONDS = 60
+_category_embeddings_lock = Lock()
+_category_embeddings_failed_at = 0.0
+
 def load_category_embeddings():
+    """Нормированные эмбеддинги категорий из файла в embeddings_cache, при его отсутствии — от модели"""
     print("🔄 Загружаем эмбеддинги категорий...")
-    embeddings = get_embeddings(category_names)
+    embeddings = cached_embeddings(category_names, 'categories')
     
-    if not embeddings:
-        print("❌ Не удалось получить эмбеддинги категорий")
-        # Создаем случайные эмбеддинги как fallback
-        import numpy as np
-        random_embeddings = np.random.randn(len(category_names), 384).tolist()
-        print("🔄 Используем случайные эмбеддинги как запасной вариант")
-        return torch.tensor(random_embeddings)
+    if embeddings is None:
+        # Случайные векторы здесь недопустимы: классификация стала бы случайной
+        print("❌ Не удалось получить эмбеддинги категорий, классификация запросов недоступна")
+        return None
     
     print(f"✅ Эмбеддинги категорий загружены, размер: {len(embeddings)}")
-    
-    # Проверяем и преобразуем в тензор
-    try:
-        if isinstance(embeddings, list) and len(embeddings) > 0:
-            return torch.tensor(embeddings)
-        else:
-            raise ValueError("Неверный формат эмбеддингов")
-    except Exception as e:
-        print(f"❌ Ошибка создания тензора: {e}")
-        # Fallback: случайные эмбеддинги
-        import numpy as np
-        return torch.tensor(np.random.randn(len(category_names), 384).tolist())
+    return normalize_rows(embeddings)
+
+# Загружаются при первой классификации или в warm_up(), но не при импорте модуля
+category_embeddings = None
+
+def get_category_embeddings():
+    """Эмбеддинги категорий; если получить их не удалось, периодически пробует снова"""
+    global category_embeddings, _category_embeddings_failed_at
+    if category_embeddings is None:
+        with _category_embeddings_lock:
+            retry_due = time.time() - _category_embeddings_failed_at >= CATEGORY_EMBEDDINGS_RETRY_SECONDS
+            if category_embeddings is None and retry_due:
+                category_embeddings = load_category_embeddings()
+                if category_embeddings is None:
+                    _category_embeddings_failed_at = time.time()
+    return category_embeddings
+
+_place_index = None
+# Держится все время сборки индекса; запросы его не берут
+_place_index_lock = Lock()
+_place_index_failed_at = 0.0
+
+def load_place_index(store):
+    """Строит индекс эмбеддингов мест в текущем потоке (warm_up() или фоновая сборка)"""
+    global _place_index, _place_index_failed_at
+    with _place_index_lock:
+        retry_due = time.time() - _place_index_failed_at >= CATEGORY_EMBEDDINGS_RETRY_SECONDS
+        if _place_index is None and retry_due:
+            print("🔄 Загружаем эмбеддинги мест...")
+            index = build_place_index(store)
+            if index is None:
+                print("❌ Не удалось получить эмбеддинги мест, ищем только по категориям")
+                _place_index_failed_at = time.time()
+            else:
+                print(f"✅ Индекс мест готов: {len(index)} векторов")
+                _place_index = index
+    return _place_index
+
+def get_place_index(store):
+    """Индекс эмбеддингов мест, если он уже готов, иначе None — тогда поиск идет только по категориям.
 
-category_embeddings = load_category_embeddings()
+    Запрос не ждет сборки индекса: если индекса нет и он не строится,
+    сборка запускается в фоновом потоке и пригодится следующим запросам.
+    """
+    if _place_index is None and not _place_index_lock.locked():
+        if time.time() - _place_index_failed_at >= CATEGORY_EMBEDDINGS_RETRY_SECONDS:
+            Thread(target=load_place_index, args=(store,), name='place-index', daemon=True).start()
+    return _place_index
 
 def define_categories(text, similarity_threshold=0.3, min_categories=2, max_categories=5):
     print(f"🎯 Определяем категории для запроса: '{text}'")
     
-    if category_embeddings is None:
-        print("❌ Эмбеддинги категорий не загружены")
-        return []
-    
     query_emb = get_embeddings(text)
-    if not query_emb:
+    if query_emb is None or len(query_emb) == 0:
         print("❌ Не удалось получить эмбеддинг запроса")
         return []
     
-    # ИСПРАВЛЕНИЕ: Проверка формата эмбеддинга запроса
+    return classify_query(query_emb, text, similarity_threshold, min_categories, max_categories)
+
+def classify_query(query_emb, text='', similarity_threshold=0.3, min_categories=2, max_categories=5):
+    """Категории для уже посчитанного эмбеддинга запроса: список (id категории, схожесть)"""
+    categories_emb = get_category_embeddings()
+    if categories_emb is None:
+        print("❌ Эмбеддинги категорий не загружены")
+        return []
+    
     try:
-        if isinstance(query_emb[0], list):
-            query_emb_tensor = torch.tensor(query_emb[0]).unsqueeze(0)
-        else:
-            query_emb_tensor = torch.tensor(query_emb).unsqueeze(0)
-            
-        similarities = util.cos_sim(query_emb_tensor, category_embeddings)[0]
-        sorted_indices = torch.argsort(similarities, descending=True).tolist()
+        # Косинусная схожесть: эмбеддинги категорий уже нормированы
+        similarities = categories_emb @ normalize_rows(query_emb[:1])[0]
+        sorted_indices = np.argsort(-similarities, kind='stable').tolist()
         sorted_scores = similarities[sorted_indices].tolist()
 
         found = []
@@ -642,75 +777,380 @@ def define_categories(text, similarity_threshold=0.3, min_categories=2, max_cate
         print(f"❌ Ошибка при вычислении схожести: {e}")
         return []
 
-def get_candidate_places(query, ds):
+# Радиус поиска мест вокруг начальной точки, метры
+CANDIDATE_RADIUS_M = int(os.getenv('CANDIDATE_RADIUS_M', 5000))
+# Сколько мест отбирает семантический поиск и с каким весом к близости места добавляется оценка его категории
+SEMANTIC_TOP_K = int(os.getenv('SEMANTIC_TOP_K', 100))
+CATEGORY_SCORE_WEIGHT = float(os.getenv('CATEGORY_SCORE_WEIGHT', 0.5))
+
+def _semantic_candidates(index, query_emb, store, score_dict, start, radius_m):
+    bias = CATEGORY_SCORE_WEIGHT * store.category_scores(score_dict)
+    bias[~store.valid] = -np.inf
+
+    nearby = None
+    if start is not None:
+        nearby, _ = store.nearest(*start, k=None, radius_m=radius_m)
+        if len(nearby) == 0:
+            print(f"⚠️ В радиусе {radius_m} м нет мест, ищем по всему датасету")
+            nearby = None
+
+    indices, scores = index.search(query_emb[0], k=SEMANTIC_TOP_K, indices=nearby, bias=bias)
+    if start is not None:
+        by_distance = np.argsort(haversine_m(*start, store.lat[indices], store.lon[indices]), kind='stable')
+        indices, scores = indices[by_distance], scores[by_distance]
+    return indices, np.maximum(scores, 0.0)
+
+def get_candidate_places(query, store, start=None, radius_m=CANDIDATE_RADIUS_M, categories=None,
+                         query_embedding=None):
+    """Возвращает индексы мест-кандидатов в хранилище и их оценки.
+
+    Если есть индекс эмбеддингов мест, кандидаты — лучшие по близости к
+    запросу с добавкой оценки категории, иначе все места найденных категорий.
+    Если известна начальная точка (lat, lon), кандидаты ограничены радиусом
+    radius_m и отсортированы по расстоянию от нее. categories и
+    query_embedding — уже посчитанные для запроса, иначе считаются заново.
+    """
     print(f"🔍 Ищем кандидаты для запроса: '{query}'")
-    top_categories_with_score = define_categories(query)
-    top_categories_ids = [cid for cid, score in top_categories_with_score]
-    
-    # ИСПРАВЛЕНИЕ: Приведение типов к строке для сравнения
-    if not top_categories_ids:
+    if query_embedding is None:
+        query_embedding = get_embeddings(query)
+    if categories is None:
+        categories = classify_query(query_embedding, query) if query_embedding is not None else []
+    top_categories_with_score = categories
+
+    index = get_place_index(store) if query_embedding is not None else None
+    if index is not None:
+        score_dict = {int(cid): score for cid, score in top_categories_with_score}
+        indices, scores = _semantic_candidates(index, query_embedding, store, score_dict, start, radius_m)
+        print(f"📍 Найдено кандидатов по эмбеддингам мест: {len(indices)}")
+        if len(indices) > 0:
+            print(f"📋 Примеры найденных мест: {[store.titles[i] for i in indices[:3]]}")
+            return indices, scores
+
+    if not top_categories_with_score:
         print("⚠️ Не найдено подходящих категорий, используем случайные места")
-        if ds is not None and len(ds) > 0:
-            return ds.sample(min(5, len(ds))).copy()
-        else:
-            return pd.DataFrame()
-    
-    # Приводим оба типа к строке для сравнения
-    ds_category_str = ds['category_id'].astype(str)
-    top_categories_str = [str(cid) for cid in top_categories_ids]
-    
-    candidate_places = ds[ds_category_str.isin(top_categories_str)].copy()
-    score_dict = {cid: score for cid, score in top_categories_with_score}
-    candidate_places['score'] = candidate_places['category_id'].astype(str).apply(lambda x: score_dict.get(int(x), 0))
-    
-    print(f"📍 Найдено кандидатов: {len(candidate_places)}")
-    if len(candidate_places) > 0:
-        print(f"📋 Примеры найденных мест: {candidate_places['title'].head(3).tolist()}")
-    
-    return candidate_places
-
-def find_place_in_dataset(place_name, candidate_places):
+        if store is not None and len(store.valid_indices) > 0:
+            indices = np.random.choice(store.valid_indices, min(5, len(store.valid_indices)), replace=False)
+            return indices, np.zeros(len(indices))
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    score_dict = {int(cid): score for cid, score in top_categories_with_score}
+    if start is not None:
+        indices, _ = store.nearest(*start, k=None, radius_m=radius_m, category_ids=score_dict)
+        if len(indices) == 0:
+            print(f"⚠️ В радиусе {radius_m} м нет подходящих мест, берем ближайшие")
+            indices, _ = store.nearest(*start, k=None, category_ids=score_dict)
+    else:
+        indices = store.in_categories(score_dict)
+    scores = np.array([score_dict.get(int(cid), 0) for cid in store.category_ids[indices]])
+
+    print(f"📍 Найдено кандидатов: {len(indices)}")
+    if len(indices) > 0:
+        print(f"📋 Примеры найденных мест: {[store.titles[i] for i in indices[:3]]}")
+
+    return indices, scores
+
+def find_place_in_dataset(place_name, store, indices):
     """Находит место в датасете по названию с учетом нечеткого соответствия"""
-    place_name_clean = place_name.lower().strip()
-    
-    # 1. Точное совпадение
-    exact_match = candidate_places[
-        candidate_places['title'].str.lower() == place_name_clean
-    ]
-    if not exact_match.empty:
-        return exact_match.iloc[0]
-    
-    # 2. Частичное совпадение (содержит)
-    partial_match = candidate_places[
-        candidate_places['title'].str.lower().str.contains(place_name_clean, na=False)
-    ]
-    if not partial_match.empty:
-        return partial_match.iloc[0]
-    
-    # 3. Похожее название (по ключевым словам)
-    place_keywords = set(place_name_clean.split())
-    best_match = None
-    best_score = 0
-    
-    for _, candidate in candidate_places.iterrows():
-        candidate_title = candidate['title'].lower()
-        candidate_words = set(candidate_title.split())
-        
-        # Вычисляем схожесть по пересечению слов
-        common_words = place_keywords.intersection(candidate_words)
-        score = len(common_words) / max(len(place_keywords), 1)
-        
-        if score > best_score and score > 0.3:  # Порог схожести
-            best_score = score
-            best_match = candidate
-    
-    return best_match
+    return store.find(place_name, indices)
 
 categories_time = {
     1: 15, 2: 40, 3: 15, 4: 40, 5: 30, 6: 40, 7: 40, 8: 120, 
     9: 10, 10: 15, 11: 40, 12: 30, 13: 15, 14: 40, 15: 60
 }
 
+# Сколько ближайших/лучших кандидатов рассматривает выбор мест
+MAX_CANDIDATES = 30
+
+def format_timeline(result_places):
+    """Текстовый план по времени прибытия: '0:07 Место (15 мин) → ...'"""
+    steps = []
+    for place in result_places:
+        hours, minutes = divmod(place['arrival'], 60)
+        steps.append(f"{hours}:{minutes:02d} {place['title']} ({place['time']} мин)")
+    return " → ".join(steps)
+
+class RouteRequestError(Exception):
+    """Ошибка во входных данных или окружении запроса, отдается клиенту с кодом status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+class RouteContext:
+    """Состояние одного запроса на маршрут.
+
+    Каждая стадия конвейера выполняется ровно один раз и кладет результат
+    сюда, следующие стадии берут его отсюда; timings хранит время стадий в мс.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.query = None
+        self.hours = None
+        self.minutes = None
+        self.start_point = None
+        self.start = None
+        self.total_minutes = None
+        self.user_time = None
+        self.store = None
+        self.query_embedding = None
+        self.categories = []
+        self.candidate_indices = None
+        self.candidate_scores = None
+        self.selection = None
+        self.selected = None
+        self.places_for_explainer = None
+        self.route = None
+        self.result = None
+        self.timings = {}
+        # Момент, к которому ответ должен быть готов (time.monotonic()), None — без ограничения
+        self.received = time.monotonic()
+        self.deadline = None
+
+def _parse_stage(ctx):
+    data = ctx.data
+    if not data:
+        print("❌ Нет JSON данных в запросе")
+        raise RouteRequestError('No JSON data provided')
+
+    ctx.query = data.get('query')
+    ctx.start_point = data.get('startPoint')
+    # Координаты начальной точки, если фронтенд смог ее геокодировать
+    ctx.start = parse_lat_lon(data.get('startCoord')) or parse_lat_lon(ctx.start_point)
+
+    print(f"📨 Получен запрос: query='{ctx.query}', hours={data.get('hours')}, minutes={data.get('minutes')}, startPoint='{ctx.start_point}', start={ctx.start}")
+
+    if not ctx.query:
+        print("❌ Отсутствует query в запросе")
+        raise RouteRequestError('Query is required')
+
+    try:
+        ctx.hours = int(data.get('hours')) if data.get('hours') is not None else 0
+        ctx.minutes = int(data.get('minutes')) if data.get('minutes') is not None else 0
+        total_minutes = ctx.hours * 60 + ctx.minutes
+        if total_minutes <= 0:
+            total_minutes = 180
+    except (ValueError, TypeError) as e:
+        print(f"⚠️ Ошибка преобразования времени: {e}, используем значение по умолчанию")
+        total_minutes = 180
+    ctx.total_minutes = ctx.user_time = total_minutes
+
+    print(f"⏱ Рассчитано общее время: {total_minutes} минут")
+
+    deadline_ms = data.get('deadline_ms')
+    try:
+        deadline_ms = float(deadline_ms) if deadline_ms is not None else ROUTE_DEADLINE_MS
+    except (ValueError, TypeError):
+        print(f"⚠️ Некорректный deadline_ms={deadline_ms!r}, используем значение по умолчанию")
+        deadline_ms = ROUTE_DEADLINE_MS
+    if deadline_ms > 0:
+        ctx.deadline = ctx.received + deadline_ms / 1000
+
+    ctx.store = load_dataset()
+    if ctx.store is None:
+        print("❌ Не удалось загрузить датасет")
+        raise RouteRequestError('Failed to load dataset', 500)
+
+    if len(ctx.store) == 0:
+        print("❌ Датасет пустой")
+        raise RouteRequestError('Dataset is empty', 500)
+
+    if ctx.start is not None and ctx.store.center is not None:
+        # Точка далеко от всех мест (например, [0, 0] от неудачного геокодирования) дала бы
+        # маршрут с переходом в тысячи километров: строим его без начальной точки
+        distance = haversine_m(*ctx.store.center, *ctx.start)
+        if distance > MAX_SPREAD_M:
+            print(f"⚠️ Начальная точка {ctx.start} в {distance / 1000:.0f} км от мест датасета, не учитываем ее")
+            ctx.start = None
+
+def _embed_stage(ctx):
+    query_emb = get_embeddings(ctx.query)
+    if query_emb is None or len(query_emb) == 0:
+        print("❌ Не удалось получить эмбеддинг запроса")
+        return
+    ctx.query_embedding = query_emb
+
+def _classify_stage(ctx):
+    if ctx.query_embedding is not None:
+        ctx.categories = classify_query(ctx.query_embedding, ctx.query)
+
+def _retrieve_stage(ctx):
+    store = ctx.store
+    candidate_indices, candidate_scores = get_candidate_places(
+        ctx.query, store, ctx.start, categories=ctx.categories, query_embedding=ctx.query_embedding
+    )
+    
+    if len(candidate_indices) == 0:
+        print("⚠️ Нет подходящих мест, используем случайные из датасета")
+        candidate_indices = np.random.choice(store.valid_indices, min(5, len(store.valid_indices)), replace=False)
+        candidate_scores = np.zeros(len(candidate_indices))
+
+    if ctx.start is None:
+        # Без начальной точки сначала рассматриваем самые подходящие места
+        by_score = np.argsort(-candidate_scores, kind='stable')
+        candidate_indices, candidate_scores = candidate_indices[by_score], candidate_scores[by_score]
+    ctx.candidate_indices = candidate_indices[:MAX_CANDIDATES]
+    ctx.candidate_scores = candidate_scores[:MAX_CANDIDATES]
+    
+    print(f"📍 Отобрано кандидатов для маршрута: {len(ctx.candidate_indices)}")
+
+def _select_stage(ctx):
+    # Выбираем места под бюджет времени
+    store, candidates = ctx.store, ctx.candidate_indices
+    durations = [categories_time.get(int(cid), 30) for cid in store.category_ids[candidates]]
+    selection = select_places(
+        store.lat[candidates], store.lon[candidates],
+        ctx.candidate_scores, durations, ctx.total_minutes, ctx.start
+    )
+    if len(selection['order']) == 0:
+        print("⚠️ Ни одно место не укладывается во время, берем одно лучшее")
+        selection = select_places(
+            store.lat[candidates], store.lon[candidates],
+            ctx.candidate_scores, durations, np.inf, ctx.start, max_stops=1
+        )
+    elif len(selection['order']) == MAX_STOPS:
+        print(f"ℹ️ В маршруте предельное число мест ROUTE_MAX_STOPS={MAX_STOPS}, остаток времени: "
+              f"{ctx.total_minutes - selection['total_minutes']:.0f} мин")
+    ctx.selection = selection
+
+def _order_stage(ctx):
+    # Порядок обхода уже оптимизирован при выборе, переводим его в индексы датасета
+    store = ctx.store
+    ctx.selected = ctx.candidate_indices[ctx.selection['order']]
+    ctx.places_for_explainer = []
+    for idx in ctx.selected:
+        category_id = int(store.category_ids[idx])
+        ctx.places_for_explainer.append({
+            'name': store.titles[idx],
+            'description': store.descriptions[idx],
+            'category_id': category_id,
+            'visit_duration': categories_time.get(category_id, 30)
+        })
+
+    print(f"🔄 Подготовлено мест для RouteExplainer: {len(ctx.places_for_explainer)}")
+
+def _explain_stage(ctx):
+    # RouteExplainer нужен только для текстов: места, порядок и время уже выбраны
+    ctx.route = get_route_explainer().create_route(
+        places=ctx.places_for_explainer,
+        user_interests=[ctx.query],
+        total_duration=ctx.total_minutes,
+        current_location=ctx.start_point,
+        start=ctx.start,
+        budget=None if ctx.deadline is None else ctx.deadline - time.monotonic()
+    )
+
+    print(f"🗺 RouteExplainer вернул маршрут: {ctx.route['route_name']}")
+
+def _build_result(ctx, route):
+    """Ответ API по выбранным местам; без route — только детерминированная часть"""
+    store, selection = ctx.store, ctx.selection
+    route = route or {}
+    explainer = get_route_explainer()
+
+    reasons = {}
+    for place in route.get('places', []):
+        idx = find_place_in_dataset(place['name'], store, ctx.selected)
+        if idx is not None and place.get('reason'):
+            reasons.setdefault(idx, place['reason'])
+    
+    # Формируем ответ в нужном формате
+    result_places = []
+    for i, idx in enumerate(ctx.selected):
+        place = ctx.places_for_explainer[i]
+        result_places.append({
+            "title": store.titles[idx],
+            "address": store.addresses[idx],
+            "coord": store.coord(idx),
+            "description": store.descriptions[idx],
+            "reason": reasons.get(idx) or explainer._get_fallback_reason(place, [ctx.query]),
+            "time": place['visit_duration'],
+            "order": i + 1,
+            "arrival": round(float(selection['arrivals'][i])),
+            "walk": round(float(selection['walks'][i]))
+        })
+
+    leg_distances = [round(float(leg)) for leg in selection['legs']]
+    if ctx.start is None and leg_distances:
+        # Без координат старта расстояние до первого места неизвестно
+        leg_distances[0] = None
+
+    route_minutes = round(selection['total_minutes'])
+    total_h = route_minutes // 60
+    total_m = route_minutes % 60
+    totalTime = f"{total_h} ч {total_m} мин"
+
+    return {
+        "startPoint": ctx.start_point,
+        "places": result_places,
+        "totalTime": totalTime,
+        "route_name": route.get('route_name', 'Маршрут по Нижнему Новгороду'),
+        "explanation": route.get('explanation', ''),
+        "timeline": format_timeline(result_places),
+        "userTime": ctx.user_time,
+        # places уже идут в порядке обхода, placeIds — id этих мест в датасете в том же порядке
+        "placeIds": [int(store.ids[idx]) for idx in ctx.selected],
+        "legDistances": leg_distances,
+        # Тексты запасные: ответ модели еще генерируется и будет в кэше для повторного запроса
+        "pending": bool(route.get('pending'))
+    }
+
+def _serialize_stage(ctx):
+    ctx.result = _build_result(ctx, ctx.route)
+    print(f"✅ Успешно сформирован ответ: {len(ctx.result['places'])} мест, время: {ctx.result['totalTime']}")
+
+ROUTE_STAGES = (
+    ('parse', _parse_stage),
+    ('embed', _embed_stage),
+    ('classify', _classify_stage),
+    ('retrieve', _retrieve_stage),
+    ('select', _select_stage),
+    ('order', _order_stage),
+    ('explain', _explain_stage),
+    ('serialize', _serialize_stage),
+)
+
+# Стадии до обращения к модели: их результат не зависит от ответа LLM
+PREPARE_STAGES = tuple(stage for stage in ROUTE_STAGES if stage[0] not in ('explain', 'serialize'))
+
+_stage_stats = {}
+_stage_stats_lock = Lock()
+
+def _record_stage_timings(timings):
+    with _stage_stats_lock:
+        for name, ms in timings.items():
+            stat = _stage_stats.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stat['count'] += 1
+            stat['total_ms'] += ms
+            stat['max_ms'] = max(stat['max_ms'], ms)
+
+def stage_stats():
+    """Среднее и максимальное время стадий конвейера по всем запросам"""
+    with _stage_stats_lock:
+        return {
+            name: {
+                'count': stat['count'],
+                'avg_ms': round(stat['total_ms'] / stat['count'], 2),
+                'max_ms': round(stat['max_ms'], 2),
+            }
+            for name, stat in _stage_stats.items()
+        }
+
+def run_route_pipeline(ctx, stages=ROUTE_STAGES):
+    """Прогоняет запрос через стадии конвейера, замеряя время каждой"""
+    try:
+        for name, stage in stages:
+            started = time.perf_counter()
+            try:
+                stage(ctx)
+            finally:
+                ctx.timings[name] = round((time.perf_counter() - started) * 1000, 2)
+    finally:
+        _record_stage_timings(ctx.timings)
+        print(f"⏱ Время стадий, мс: {ctx.timings}")
+    return ctx.result
+
 @flask_app.route('/generate_route', methods=['POST', 'OPTIONS'])
 def generate_route():
     logger.info("🚀 generate_route called")
@@ -720,149 +1160,144 @@ def generate_route():
         return response
 
     try:
-        data = request.get_json()
-        if not data:
-            print("❌ Нет JSON данных в запросе")
-            return jsonify({'error': 'No JSON data provided'}), 400
-
-        query = data.get('query')
-        hours = data.get('hours')
-        minutes = data.get('minutes')
-        startPoint = data.get('startPoint')
-
-        print(f"📨 Получен запрос: query='{query}', hours={hours}, minutes={minutes}, startPoint='{startPoint}'")
+        ctx = RouteContext(request.get_json())
+        result = run_route_pipeline(ctx)
+        response = jsonify(result)
+        return response
 
-        if not query:
-            print("❌ Отсутствует query в запросе")
-            return jsonify({'error': 'Query is required'}), 400
+    except RouteRequestError as e:
+        return jsonify({'error': e.message}), e.status
 
-        try:
-            hours = int(hours) if hours is not None else 0
-            minutes = int(minutes) if minutes is not None else 0
-            total_minutes = hours * 60 + minutes
-            if total_minutes <= 0:
-                total_minutes = 180
-            userTime = total_minutes
-        except (ValueError, TypeError) as e:
-            print(f"⚠️ Ошибка преобразования времени: {e}, используем значение по умолчанию")
-            total_minutes = 180
-            userTime = total_minutes
-
-        print(f"⏱ Рассчитано общее время: {total_minutes} минут")
+    except Exception as e:
+        logger.error(f"💥 Критическая ошибка в generate_route: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': 'Internal server error'}), 500
 
-        ds = load_dataset()
-        if ds is None:
-            print("❌ Не удалось загрузить датасет")
-            return jsonify({'error': 'Failed to load dataset'}), 500
+def _run_route_job(data):
+    return run_route_pipeline(RouteContext(data))
 
-        if len(ds) == 0:
-            print("❌ Датасет пустой")
-            return jsonify({'error': 'Dataset is empty'}), 500
+def get_route_jobs():
+    """Очередь заданий /routes этого процесса.
 
-        # Получаем кандидатов для маршрута
-        candidate_places = get_candidate_places(query, ds)
-        
-        if candidate_places.empty:
-            print("⚠️ Нет подходящих мест, используем случайные из датасета")
-            candidate_places = ds.sample(min(5, len(ds))).copy()
-        
-        print(f"📍 Отобрано кандидатов для маршрута: {len(candidate_places)}")
-        
-        # Преобразуем в формат для RouteExplainer
-        places_for_explainer = []
-        for _, place in candidate_places.head(10).iterrows():
-            places_for_explainer.append({
-                'name': place['title'],
-                'description': place.get('description', ''),
-                'category_id': place['category_id'],
-                'visit_duration': categories_time.get(place['category_id'], 30)
-            })
+    Задания хранятся отдельно от кэша маршрутов: при общем хранилище статус виден любому процессу.
+    """
+    return _per_process(
+        'route_jobs', lambda: JobQueue(_run_route_job, create_job_store(), public_errors=(RouteRequestError,))
+    )
 
-        print(f"🔄 Подготовлено мест для RouteExplainer: {len(places_for_explainer)}")
-        
-        # Используем RouteExplainer для создания маршрута
-        route = route_explainer.create_route(
-            places=places_for_explainer,
-            user_interests=[query],
-            total_duration=total_minutes,
-            current_location=startPoint
-        )
+@flask_app.route('/routes', methods=['POST'])
+def submit_route_job():
+    """Ставит маршрут в очередь и сразу отдает id задания, результат — в GET /routes/<id>"""
+    logger.info("🚀 submit_route_job called")
 
-        print(f"🗺 RouteExplainer вернул маршрут: {route['route_name']}")
-        
-        # Формируем ответ в нужном формате
-        result_places = []
-        for place in route['places']:
-            # ИСПРАВЛЕНИЕ: Используем улучшенный поиск мест
-            original_place = find_place_in_dataset(place['name'], candidate_places)
-            
-            if original_place is not None:
-                try:
-                    # ИСПРАВЛЕНИЕ: Более надежное извлечение координат
-                    coord_str = original_place['coordinate']
-                    if 'POINT' in str(coord_str):
-                        coords = str(coord_str).replace("POINT(", "").replace(")", "").split()
-                    else:
-                        coords = str(coord_str).split()
-                    
-                    if len(coords) >= 2:
-                        lat, lon = float(coords[0]), float(coords[1])
-                    else:
-                        lat, lon = 56.326887, 44.005986  # Центр НН по умолчанию
-                        
-                    result_places.append({
-                        "title": place['name'],
-                        "address": original_place.get('address', ''),
-                        "coord": [lat, lon],
-                        "description": original_place.get('description', ''),
-                        "reason": place['reason'],
-                        "time": place['duration']
-                    })
-                except Exception as e:
-                    print(f"⚠️ Ошибка обработки координат для {place['name']}: {e}")
-                    result_places.append({
-                        "title": place['name'],
-                        "address": original_place.get('address', ''),
-                        "coord": [56.326887, 44.005986],
-                        "description": original_place.get('description', ''),
-                        "reason": place['reason'],
-                        "time": place['duration']
-                    })
-            else:
-                # Добавляем место даже если не нашли в датасете
-                result_places.append({
-                    "title": place['name'],
-                    "address": "",
-                    "coord": [56.326887, 44.005986],
-                    "description": "",
-                    "reason": place['reason'],
-                    "time": place['duration']
-                })
-
-        total_h = route['total_duration'] // 60
-        total_m = route['total_duration'] % 60
-        totalTime = f"{total_h} ч {total_m} мин"
-
-        result = {
-            "startPoint": startPoint,
-            "places": result_places,
-            "totalTime": totalTime,
-            "route_name": route.get('route_name', 'Маршрут по Нижнему Новгороду'),
-            "explanation": route.get('explanation', ''),
-            "timeline": route.get('timeline', ''),
-            "userTime": userTime
-        }
+    data = request.get_json(silent=True)
+    if not data or not data.get('query'):
+        return jsonify({'error': 'Query is required'}), 400
 
-        print(f"✅ Успешно сформирован ответ: {len(result_places)} мест, время: {totalTime}")
-        response = jsonify(result)
-        return response
+    try:
+        job = get_route_jobs().submit(data)
+    except JobQueueFull as e:
+        print(f"⚠️ Очередь маршрутов переполнена: {e}")
+        response = jsonify({'error': 'Too many route requests, try again later'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    response = jsonify(job)
+    response.headers['Location'] = f"/routes/{job['id']}"
+    return response, 202
+
+@flask_app.route('/routes/<job_id>', methods=['GET'])
+def get_route_job(job_id):
+    """Статус задания: queued, running, done (с result) или failed (с error и code)"""
+    job = get_route_jobs().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _route_event_stream(ctx):
+    """События SSE маршрута: сначала детерминированная часть, затем места по мере генерации.
+
+    route — места, координаты, порядок и время без текстов модели;
+    place — {order, title, reason} для каждого места, как только модель его
+    описала; done — полный ответ, как у /generate_route; error — если
+    маршрут не удалось закончить.
+    """
+    store = ctx.store
+    order_of = {int(idx): i + 1 for i, idx in enumerate(ctx.selected)}
+    timings = {}
+    started = time.perf_counter()
+    yield _sse('route', _build_result(ctx, None))
+
+    events = get_route_explainer().stream_route(
+        places=ctx.places_for_explainer,
+        user_interests=[ctx.query],
+        total_duration=ctx.total_minutes,
+        current_location=ctx.start_point,
+        start=ctx.start
+    )
+    try:
+        for kind, payload in events:
+            if kind == 'route':
+                ctx.route = payload
+                continue
+            idx = find_place_in_dataset(payload['name'], store, ctx.selected)
+            if idx is None:
+                continue
+            timings.setdefault('first_place', round((time.perf_counter() - started) * 1000, 2))
+            yield _sse('place', {'order': order_of[idx], 'title': store.titles[idx], 'reason': payload['reason']})
+        timings['explain'] = round((time.perf_counter() - started) * 1000, 2)
+
+        serialize_started = time.perf_counter()
+        _serialize_stage(ctx)
+        timings['serialize'] = round((time.perf_counter() - serialize_started) * 1000, 2)
+        yield _sse('done', ctx.result)
+    except Exception as e:
+        logger.error(f"💥 Ошибка в потоке маршрута: {str(e)}")
+        yield _sse('error', {'error': 'Internal server error'})
+    finally:
+        # Клиент отключился или поток закончился: закрываем генерацию и соединение с моделью
+        events.close()
+        _record_stage_timings(timings)
+        print(f"⏱ Время потоковых стадий, мс: {timings}")
+
+@flask_app.route('/generate_route/stream', methods=['POST'])
+def generate_route_stream():
+    logger.info("🚀 generate_route_stream called")
 
+    try:
+        ctx = RouteContext(request.get_json())
+        run_route_pipeline(ctx, PREPARE_STAGES)
+    except RouteRequestError as e:
+        return jsonify({'error': e.message}), e.status
     except Exception as e:
-        logger.error(f"💥 Критическая ошибка в generate_route: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"💥 Критическая ошибка в generate_route_stream: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+    return Response(
+        _route_event_stream(ctx),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@flask_app.route('/stats', methods=['GET'])
+def stats():
+    """Счетчики кэшей для настройки размеров и TTL"""
+    explainer = get_route_explainer()
+    return jsonify({
+        'embedding_cache': query_cache.stats(),
+        'embedding_batches': batcher.stats(),
+        'route_cache': explainer.cache_stats(),
+        'llm': explainer.llm_stats(),
+        'route_coalescing': explainer.coalescing_stats(),
+        'route_budget': explainer.budget_stats(),
+        'route_jobs': get_route_jobs().stats(),
+        'stages': stage_stats()
+    })
+
 def test1():
     test_queries = [
         "Хочу прогуляться по парку и посмотреть памятники",
@@ -883,20 +1318,37 @@ def test1():
         print("-" * 40)
 
 def test2():
-    ds = load_dataset()
+    store = load_dataset()
     query="Хочу прогуляться по парку и посмотреть памятники"
-    candidates = get_candidate_places(query, ds)
+    indices, scores = get_candidate_places(query, store)
     print("Все кандидаты для маршрута:")
-    print(candidates[['title', 'category_id', 'score']].sort_values(by='score', ascending=False))
+    for i in np.argsort(-scores, kind='stable'):
+        idx = indices[i]
+        print(f"  {store.titles[idx]} (категория {store.category_ids[idx]}), score = {scores[i]:.3f}")
+
+def warm_up():
+    """Загружает датасет, индекс мест и эмбеддинги категорий до старта сервера, чтобы первый запрос не ждал.
+
+    Импорт модуля ничего не загружает и не ходит в сеть: все это делается здесь.
+    Клиент модели и очередь заданий здесь не создаются: warm_up() под gunicorn
+    выполняется до fork, а они нужны каждому процессу свои (get_route_explainer()).
+    """
+    check_hf_token()
+    store = load_dataset()
+    if store is not None:
+        load_place_index(store)
+    get_category_embeddings()
 
 def main():
-    token = get_bot_token()
-    app = Application.builder().token(token).build()
+    from telegram_bot import build_application, get_bot_token
 
-    app.add_handler(CommandHandler("start", start_command))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    # Бот и API в одном процессе — для локального запуска; в продакшене это
+    # gunicorn -c gunicorn.conf.py wsgi:app и отдельный python telegram_bot.py
+    app = build_application(get_bot_token())
     
     port = int(os.environ.get('PORT', 10000))
+
+    warm_up()
         
     logger.info("Bot is running from Render.com")
 
@@ -0,0 +1,219 @@
+import os
+
+import numpy as np
+
+from geo import haversine_matrix
+
+# Улучшение меньше этого значения (в метрах) не считается улучшением
+_EPS = 1e-6
+
+
+def _nearest_neighbour(dist):
+    """Начальный путь: из узла 0 всегда идем в ближайший непосещенный"""
+    n = len(dist)
+    path = [0]
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[path[-1]])
+        nxt = int(np.argmin(row))
+        path.append(nxt)
+        visited[nxt] = True
+    return np.array(path)
+
+
+def _two_opt(dist, path):
+    """Разворачивает отрезки пути, пока это укорачивает маршрут.
+
+    Выигрыш для всех пар ребер считается одной матрицей, на каждом шаге
+    применяется лучший разворот. Концы пути закреплены.
+    """
+    n = len(path)
+    if n < 4:
+        return False
+    # Пары ребер (k, m) с m >= k + 2, иначе разворот вырожден
+    allowed = np.triu(np.ones((n - 1, n - 1), dtype=bool), k=2)
+    improved = False
+    while True:
+        heads, tails = path[:-1], path[1:]
+        edge = dist[heads, tails]
+        delta = (dist[np.ix_(heads, heads)] + dist[np.ix_(tails, tails)]
+                 - edge[:, None] - edge[None, :])
+        delta[~allowed] = 0
+        best = int(np.argmin(delta))
+        k, m = divmod(best, n - 1)
+        if delta[k, m] >= -_EPS:
+            return improved
+        path[k + 1:m + 1] = path[k + 1:m + 1][::-1].copy()
+        improved = True
+
+
+def _best_or_move(dist, path, length):
+    """Лучший перенос отрезка длины length: (выигрыш, начало, ребро, развернуть)"""
+    n = len(path)
+    starts = np.arange(1, n - length)
+    if len(starts) == 0:
+        return 0.0, None, None, False
+    heads, tails = path[:-1], path[1:]
+    edge = dist[heads, tails]
+
+    prev, first = path[starts - 1], path[starts]
+    last, nxt = path[starts + length - 1], path[starts + length]
+    removal_gain = dist[prev, first] + dist[last, nxt] - dist[prev, nxt]
+
+    forward = dist[np.ix_(first, heads)] + dist[np.ix_(last, tails)] - edge[None, :]
+    backward = dist[np.ix_(last, heads)] + dist[np.ix_(first, tails)] - edge[None, :]
+    # Ребра, касающиеся самого отрезка, для вставки не подходят
+    offset = np.arange(n - 1)[None, :] - starts[:, None]
+    blocked = (offset >= -1) & (offset <= length - 1)
+    forward[blocked] = np.inf
+    backward[blocked] = np.inf
+
+    reverse = backward < forward
+    delta = np.where(reverse, backward, forward) - removal_gain[:, None]
+    best = int(np.argmin(delta))
+    s, e = divmod(best, n - 1)
+    return delta[s, e], int(starts[s]), e, bool(reverse[s, e])
+
+
+def _or_opt(dist, path, max_segment=3):
+    """Переносит отрезки из 1..max_segment узлов в лучшее место пути"""
+    improved = False
+    while True:
+        delta, i, e, reverse, length = 0.0, None, None, False, 0
+        for candidate_length in range(1, max_segment + 1):
+            move = _best_or_move(dist, path, candidate_length)
+            if move[0] < delta:
+                delta, i, e, reverse = move
+                length = candidate_length
+        if delta >= -_EPS:
+            return improved
+        segment = path[i:i + length].copy()
+        if reverse:
+            segment = segment[::-1]
+        if e < i:
+            moved = (path[:e + 1], segment, path[e + 1:i], path[i + length:])
+        else:
+            moved = (path[:i], path[i + length:e + 1], segment, path[e + 1:])
+        path[:] = np.concatenate(moved)
+        improved = True
+
+
+def solve_open_path(dist):
+    """Порядок обхода всех узлов матрицы dist, начиная с узла 0, без возврата.
+
+    Строит путь ближайшего соседа и улучшает его 2-opt и Or-opt.
+    """
+    n = len(dist)
+    if n <= 2:
+        return np.arange(n)
+
+    # Фиктивный конечный узел на нулевом расстоянии от всех превращает
+    # открытый путь в путь с закрепленными концами
+    padded = np.zeros((n + 1, n + 1))
+    padded[:n, :n] = dist
+    path = np.append(_nearest_neighbour(dist), n)
+
+    while _two_opt(padded, path) | _or_opt(padded, path):
+        pass
+    return path[:-1]
+
+
+# Пешеход: 4.5 км/ч, улицы длиннее прямой примерно на треть
+WALK_SPEED_M_PER_MIN = 75
+DETOUR_FACTOR = 1.3
+# Больше мест в маршруте не берется, даже если они укладываются во время: тексты для них
+# модель пишет в одном ответе (max_tokens=800), и длинный список она обрывает; 0 — без ограничения
+MAX_STOPS = int(os.getenv('ROUTE_MAX_STOPS', 8))
+
+
+def walking_minutes(distance_m):
+    return np.asarray(distance_m) * DETOUR_FACTOR / WALK_SPEED_M_PER_MIN
+
+
+def _insertion_costs(time, path, candidates):
+    """Минимальное добавочное время пути при вставке каждого кандидата и позиция вставки"""
+    heads = np.asarray(path)
+    tails = heads[1:]
+    between = (time[np.ix_(candidates, heads[:-1])] + time[np.ix_(candidates, tails)]
+               - time[heads[:-1], tails][None, :])
+    at_end = time[candidates, heads[-1]][:, None]
+    costs = np.hstack((between, at_end))
+    positions = np.argmin(costs, axis=1)
+    return costs[np.arange(len(candidates)), positions], positions + 1
+
+
+def select_places(lat, lon, scores, durations, budget_minutes, start=None, max_stops=MAX_STOPS):
+    """Детерминированный выбор мест под бюджет времени (задача ориентирования).
+
+    Максимизирует сумму оценок scores при условии, что время посещения мест
+    durations плюс пешие переходы укладываются в budget_minutes. Места
+    добавляются жадно по отношению оценки к добавочному времени с вставкой
+    в самую дешевую позицию пути; когда добавить нечего, порядок улучшается
+    2-opt/Or-opt и попытка повторяется. Мест не больше max_stops
+    (по умолчанию ROUTE_MAX_STOPS, None или 0 — без ограничения).
+
+    Возвращает словарь: order — индексы выбранных мест в порядке обхода,
+    legs — расстояния переходов в метрах, walks — минуты на переход к месту,
+    arrivals — минута прибытия от начала маршрута, total_minutes — итог.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+    durations = np.asarray(durations, dtype=np.float64)
+    n = len(lat)
+    max_stops = max_stops or n
+
+    dist = np.zeros((n + 1, n + 1))
+    if start is not None:
+        dist = haversine_matrix(np.append(start[0], lat), np.append(start[1], lon))
+    else:
+        # Без стартовой точки первый переход бесплатный
+        dist[1:, 1:] = haversine_matrix(lat, lon)
+    time = walking_minutes(dist)
+    visit = np.append(0.0, durations)
+    # Небольшая добавка, чтобы при нулевых оценках выбирались более дешевые места
+    value = np.append(0.0, scores) + 1e-3
+
+    path = [0]
+    used = 0.0
+    selected = np.zeros(n + 1, dtype=bool)
+    selected[0] = True
+    while len(path) - 1 < max_stops:
+        candidates = np.flatnonzero(~selected)
+        if len(candidates) == 0:
+            break
+        walk_costs, positions = _insertion_costs(time, path, candidates)
+        added = walk_costs + visit[candidates]
+        feasible = used + added <= budget_minutes
+        if not feasible.any():
+            # Перестраиваем порядок: сэкономленное время может вместить еще место
+            reordered = np.asarray(path)[solve_open_path(time[np.ix_(path, path)])]
+            walk = time[reordered[:-1], reordered[1:]].sum()
+            if walk < time[path[:-1], path[1:]].sum() - _EPS:
+                path = reordered.tolist()
+                used = walk + visit[path].sum()
+                continue
+            break
+        ratio = np.where(feasible, value[candidates] / np.maximum(added, 1.0), -np.inf)
+        best = int(np.argmax(ratio))
+        path.insert(int(positions[best]), int(candidates[best]))
+        selected[candidates[best]] = True
+        used += added[best]
+
+    if len(path) > 2:
+        # Финальная полировка порядка, набор мест уже не меняется
+        path = np.asarray(path)[solve_open_path(time[np.ix_(path, path)])].tolist()
+
+    path = np.asarray(path)
+    legs = dist[path[:-1], path[1:]]
+    walks = time[path[:-1], path[1:]]
+    stays = visit[path[1:]]
+    arrivals = np.cumsum(walks) + np.concatenate(([0.0], np.cumsum(stays)[:-1]))
+    return {
+        'order': path[1:] - 1,
+        'legs': legs,
+        'walks': walks,
+        'arrivals': arrivals,
+        'total_minutes': float(walks.sum() + stays.sum()),
+    }
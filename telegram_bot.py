@@ -0,0 +1,88 @@
+"""Telegram-бот мини-приложения: python telegram_bot.py
+
+Бот только открывает мини-приложение и не зависит от API маршрутов: это
+отдельный процесс, общий с API у него лишь .env. Если задан
+TELEGRAM_WEBHOOK_URL (публичный адрес этого процесса), Telegram сам
+присылает обновления на PORT; без него бот опрашивает Telegram (long
+polling), что удобно для локального запуска.
+"""
+import logging
+import os
+
+from dotenv import load_dotenv
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+WEB_APP_URL = os.getenv('WEB_APP_URL', 'https://anansypineapple.github.io/miniApp-maps/')
+# Публичный адрес процесса бота, например https://map-bot-telegram.onrender.com
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')
+TELEGRAM_WEBHOOK_PATH = os.getenv('TELEGRAM_WEBHOOK_PATH', 'telegram')
+# Telegram присылает его в заголовке X-Telegram-Bot-Api-Secret-Token, чужие запросы отклоняются
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+
+
+def get_bot_token():
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not token:
+        load_dotenv()
+        token = os.getenv('TELEGRAM_BOT_TOKEN')
+    if not token:
+        raise ValueError("TELEGRAM_BOT_TOKEN was not found!")
+    return token
+
+
+def _open_app_markup():
+    keyboard = [
+        [InlineKeyboardButton("Открыть приложение", web_app={"url": WEB_APP_URL})]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("Привет, друг! Нажми кнопку ниже чтобы запустить приложение!",
+                                    reply_markup=_open_app_markup())
+
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("Чтобы начать работу необходимо запустить приложение!",
+                                    reply_markup=_open_app_markup())
+
+
+def build_application(token):
+    app = Application.builder().token(token).build()
+
+    app.add_handler(CommandHandler("start", start_command))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return app
+
+
+def main():
+    app = build_application(get_bot_token())
+
+    if not TELEGRAM_WEBHOOK_URL:
+        logger.info("TELEGRAM_WEBHOOK_URL не задан, бот опрашивает Telegram")
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
+        return
+
+    port = int(os.environ.get('PORT', 10000))
+    webhook_url = f"{TELEGRAM_WEBHOOK_URL.rstrip('/')}/{TELEGRAM_WEBHOOK_PATH}"
+    logger.info(f"Bot is waiting for webhook updates at {webhook_url}")
+
+    # run_webhook при старте сам регистрирует адрес в Telegram (setWebhook)
+    app.run_webhook(
+        listen="0.0.0.0",
+        port=port,
+        url_path=TELEGRAM_WEBHOOK_PATH,
+        webhook_url=webhook_url,
+        secret_token=TELEGRAM_WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Общие настройки тестов: все работает офлайн.
+
+Эмбеддинги считает StubEmbeddingBackend, модель заменяет
+benchmarks/stub_llm_server.py. Модули приложения читают настройки из
+окружения при импорте, поэтому окружение задается здесь, до импорта.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from stub_llm_server import StubLLMServer  # noqa: E402
+
+_workdir = tempfile.mkdtemp(prefix='route-tests-')
+llm_server = StubLLMServer(token_delay=0, first_token_delay=0).start()
+
+os.environ.update({
+    'EMBEDDING_BACKEND': 'stub',
+    'EMBEDDINGS_CACHE_DIR': os.path.join(_workdir, 'embeddings_cache'),
+    'ROUTE_CACHE_BACKEND': 'memory',
+    'ROUTE_CACHE_PATH': os.path.join(_workdir, 'route_cache.sqlite3'),
+    'LLM_API_URL': llm_server.url,
+    'HF_API_TOKEN': 'test-token',
+    'ROUTE_DEADLINE_MS': '0',
+})
+os.chdir(ROOT)
+
+
+class FakeClock:
+    """Часы, которые идут только по команде advance()"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
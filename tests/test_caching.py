@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+
+import caching
+from caching import SQLiteCache, SingleFlight, TieredCache, TTLCache, json_size
+from conftest import FakeClock
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl_cache_expires_entries():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=60, clock=clock)
+    cache.set('a', 1)
+    clock.advance(59)
+    assert cache.get('a') == 1
+    clock.advance(1)
+    assert cache.get('a', 'нет') == 'нет'
+    assert len(cache) == 0
+    assert cache.stats()['expirations'] == 1
+
+
+def test_ttl_cache_counts_hits_and_misses():
+    cache = TTLCache()
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('b')
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+
+
+def test_ttl_cache_limits_total_bytes():
+    cache = TTLCache(maxsize=100, maxbytes=30, sizeof=json_size)
+    cache.set('a', 'x' * 10)
+    cache.set('b', 'y' * 10)
+    cache.set('c', 'z' * 10)
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] <= 30
+    # Запись больше всего кэша не сохраняется и ничего не вытесняет
+    cache.set('big', 'w' * 100)
+    assert cache.get('big') is None
+    assert cache.get('c') == 'z' * 10
+
+
+def test_ttl_cache_is_consistent_under_concurrent_writes():
+    cache = TTLCache(maxsize=50, maxbytes=400, sizeof=json_size)
+
+    def write(thread):
+        for i in range(500):
+            cache.set(f"{thread}:{i % 80}", 'x' * (i % 7))
+            cache.get(f"{thread}:{(i * 7) % 80}")
+
+    threads = [threading.Thread(target=write, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats['size'] <= 50
+    assert 0 <= stats['bytes'] <= 400
+
+
+def test_sqlite_cache_does_not_touch_the_file_until_used(tmp_path):
+    path = tmp_path / 'cache.sqlite3'
+    cache = SQLiteCache(str(path))
+    assert not path.exists()
+    cache.set('маршрут', {'places': [1, 2]})
+    assert path.exists()
+    assert SQLiteCache(str(path)).get('маршрут') == {'places': [1, 2]}
+
+
+def test_sqlite_cache_expires_and_prunes(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite3'), maxsize=3, ttl=0.05)
+    for i in range(5):
+        cache.set(str(i), i)
+    cache.prune()
+    assert len(cache) == 3
+    assert cache.get('0') is None and cache.get('4') == 4
+    time.sleep(0.1)
+    assert cache.get('4', 'нет') == 'нет'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+
+def test_sqlite_cache_opens_new_connection_after_fork(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite3'))
+    cache.set('a', 1)
+    parent_conn = cache._connect()
+    child_pid = os.getpid() + 1
+    monkeypatch.setattr(caching.os, 'getpid', lambda: child_pid)
+    assert cache._connect() is not parent_conn
+    assert cache.get('a') == 1
+
+
+def test_sqlite_cache_prunes_under_concurrent_writes(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite3'), maxsize=10)
+
+    def write(thread):
+        for i in range(64):
+            cache.set(f"{thread}:{i}", i)
+
+    threads = [threading.Thread(target=write, args=(t,)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 256 записей — ровно 4 очистки, последняя оставляет maxsize самых новых
+    assert len(cache) == 10
+
+
+class BrokenStore:
+    def get(self, key, default=None):
+        raise ConnectionError('хранилище недоступно')
+
+    set = get
+
+    def stats(self):
+        raise ConnectionError('хранилище недоступно')
+
+
+def test_tiered_cache_survives_shared_store_errors():
+    cache = TieredCache(TTLCache(), BrokenStore())
+    assert cache.get('a', 'нет') == 'нет'
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    stats = cache.stats()
+    assert stats['shared_errors'] == 2
+    assert 'error' in stats['shared']
+
+
+def test_tiered_cache_fills_local_from_shared(tmp_path):
+    shared = SQLiteCache(str(tmp_path / 'cache.sqlite3'))
+    TieredCache(TTLCache(), shared).set('a', {'route': 1})
+
+    local = TTLCache()
+    cache = TieredCache(local, shared)
+    assert cache.get('a') == {'route': 1}
+    assert local.get('a') == {'route': 1}
+    cache.get('a')
+    assert shared.stats()['hits'] == 1
+
+
+def _run_concurrently(count, target):
+    results = [None] * count
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, target())) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'маршрут'
+
+    results = _run_concurrently(5, lambda: flight.do('key', slow))
+    assert results == ['маршрут'] * 5
+    assert len(calls) == 1
+    stats = flight.stats()
+    assert (stats['leaders'], stats['coalesced'], stats['in_flight']) == (1, 4, 0)
+
+
+def test_single_flight_shares_errors_but_does_not_remember_them():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(1)
+        raise ValueError('сбой')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('key', failing)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    assert flight.do('key', lambda: 'ok') == 'ok'
+
+
+def test_single_flight_begin_makes_only_first_caller_leader():
+    flight = SingleFlight()
+    future, leader = flight.begin('key')
+    same, follower_leader = flight.begin('key')
+    assert leader and not follower_leader and same is future
+    assert flight.get('key') is future
+    assert flight.get('other') is None
+
+    assert flight.run('key', future, lambda: 42) == 42
+    assert future.result(timeout=0) == 42
+    assert flight.get('key') is None
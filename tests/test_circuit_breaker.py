@@ -0,0 +1,100 @@
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from conftest import FakeClock
+
+
+def make_breaker(clock, **params):
+    settings = dict(window=10, min_calls=4, failure_rate=0.5, slow=5, slow_rate=0.5, open_for=30, probes=1)
+    settings.update(params)
+    return CircuitBreaker(clock=clock, **settings)
+
+
+def fail(breaker, times):
+    for _ in range(times):
+        assert breaker.allow()
+        breaker.record_failure()
+
+
+def test_stays_closed_until_min_calls():
+    breaker = make_breaker(FakeClock())
+    fail(breaker, 3)
+    assert breaker.state == CLOSED
+    assert breaker.stats()['failure_rate'] == 1.0
+
+
+def test_opens_at_failure_rate_and_short_circuits():
+    breaker = make_breaker(FakeClock())
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_success(0.1)
+    fail(breaker, 2)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert not breaker.allow()
+    stats = breaker.stats()
+    assert (stats['opened'], stats['short_circuited'], stats['window_calls']) == (1, 2, 0)
+
+
+def test_opens_when_successful_calls_are_too_slow():
+    breaker = make_breaker(FakeClock())
+    for elapsed in (0.1, 0.1, 6, 7):
+        assert breaker.allow()
+        breaker.record_success(elapsed)
+    assert breaker.state == OPEN
+
+
+def test_half_open_lets_limited_probes_through():
+    clock = FakeClock()
+    breaker = make_breaker(clock, probes=2)
+    fail(breaker, 4)
+    clock.advance(29.9)
+    assert breaker.state == OPEN
+    clock.advance(0.1)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and breaker.allow()
+    assert not breaker.allow()
+
+
+def test_fast_successful_probe_closes():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    fail(breaker, 4)
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record_success(0.2)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_or_slow_probe_opens_again():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    fail(breaker, 4)
+    clock.advance(30)
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record_success(10)
+    assert breaker.state == OPEN
+    assert breaker.stats()['opened'] == 3
+
+
+def test_released_probe_frees_its_slot():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    fail(breaker, 4)
+    clock.advance(30)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_outcome_of_call_started_before_opening_is_ignored():
+    breaker = make_breaker(FakeClock())
+    assert breaker.allow()
+    fail(breaker, 4)
+    breaker.record_success(0.1)
+    assert breaker.state == OPEN
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import embeddings
+from embeddings import EmbeddingBatcher, StubEmbeddingBackend, embed, normalize_query, query_cache
+
+
+class CountingBackend(StubEmbeddingBackend):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return super().encode(texts)
+
+
+@pytest.fixture
+def counting_backend():
+    previous = embeddings.get_backend()
+    backend = CountingBackend()
+    embeddings.set_backend(backend)
+    yield backend
+    embeddings.set_backend(previous)
+
+
+def test_query_key_ignores_case_spaces_and_yo():
+    assert normalize_query('  Ёлки   и  ПАРКИ\n') == 'елки и парки'
+
+
+def test_equivalent_queries_share_one_cached_vector(counting_backend):
+    first = embed('Музеи и  театры')
+    again = embed(['музеи и театры', ' МУЗЕИ И ТЕАТРЫ '])
+    assert counting_backend.calls == [['Музеи и  театры']]
+    np.testing.assert_array_equal(again, np.vstack([first, first]))
+
+
+def test_only_missing_queries_go_to_the_backend_once(counting_backend):
+    embed('парк')
+    vectors = embed(['Парк', 'набережная', 'НАБЕРЕЖНАЯ'])
+    assert counting_backend.calls == [['парк'], ['набережная']]
+    np.testing.assert_array_equal(vectors[1], vectors[2])
+
+
+def test_cached_vectors_are_read_only(counting_backend):
+    embed('кофейни')
+    with pytest.raises(ValueError):
+        query_cache.get('кофейни')[0] = 1.0
+
+
+def test_failed_backend_call_is_not_cached(counting_backend, monkeypatch):
+    monkeypatch.setattr(counting_backend, 'encode', lambda texts: None)
+    assert embed('театр') is None
+    assert query_cache.get('театр') is None
+
+
+def test_batcher_answers_every_request_after_a_failed_batch():
+    # Движок вернул не то число строк, потом упал: ожидающие все равно получают ответ
+    batcher = EmbeddingBatcher(lambda texts: [[1.0]] * len(texts), max_wait_ms=1, timeout=1)
+    assert batcher.encode(['a']) is None
+    batcher._encode = lambda texts: 1 / 0
+    assert batcher.encode(['b']) is None
+    batcher._encode = StubEmbeddingBackend().encode
+    assert batcher.encode(['c']) is not None
+
+
+def test_batcher_gives_up_after_timeout():
+    batcher = EmbeddingBatcher(lambda texts: time.sleep(1), max_wait_ms=1, timeout=0.1)
+    started = time.perf_counter()
+    assert batcher.encode(['a']) is None
+    assert time.perf_counter() - started < 0.5
+
+
+def test_batcher_returns_rows_of_each_request():
+    backend = StubEmbeddingBackend()
+    batcher = EmbeddingBatcher(backend.encode, max_wait_ms=1)
+    np.testing.assert_allclose(batcher.encode(['музей', 'парк']), backend.encode(['музей', 'парк']))
+
+
+def test_batcher_joins_concurrent_requests():
+    backend = CountingBackend()
+    batcher = EmbeddingBatcher(backend.encode, max_wait_ms=100)
+    queries = [f"запрос {i}" for i in range(6)]
+    results = [None] * len(queries)
+
+    def encode(i):
+        results[i] = batcher.encode([queries[i]])
+
+    threads = [threading.Thread(target=encode, args=(i,)) for i in range(len(queries))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(backend.calls) < len(queries)
+    for query, result in zip(queries, results):
+        np.testing.assert_allclose(result, StubEmbeddingBackend().encode([query]))
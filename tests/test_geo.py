@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from geo import GridIndex, haversine_m
+
+CENTER = (56.3269, 44.0060)
+
+
+@pytest.fixture(scope='module')
+def points():
+    rng = np.random.default_rng(7)
+    lat = CENTER[0] + rng.normal(0, 0.05, 2000)
+    lon = CENTER[1] + rng.normal(0, 0.1, 2000)
+    lat[::97] = np.nan
+    labels = rng.integers(1, 6, 2000)
+    return lat, lon, labels
+
+
+def brute_force(lat, lon, labels, point, k=None, radius_m=None, allowed=None):
+    distances = haversine_m(*point, lat, lon)
+    mask = np.isfinite(distances)
+    if radius_m is not None:
+        mask &= distances <= radius_m
+    if allowed is not None:
+        mask &= np.isin(labels, list(allowed))
+    indices = np.flatnonzero(mask)
+    indices = indices[np.argsort(distances[indices], kind='stable')][:k]
+    return indices, distances[indices]
+
+
+@pytest.mark.parametrize('k, radius_m, allowed', [
+    (10, None, None),
+    (None, 1500, None),
+    (25, 3000, {2, 4}),
+    (None, None, {1}),
+    (5, 50, None),
+])
+def test_nearest_matches_brute_force(points, k, radius_m, allowed):
+    lat, lon, labels = points
+    index = GridIndex(lat, lon, labels)
+    rng = np.random.default_rng(1)
+    for point in [CENTER, (CENTER[0] + 0.07, CENTER[1] - 0.15)] + [
+        (CENTER[0] + dy, CENTER[1] + dx) for dy, dx in rng.normal(0, 0.05, (5, 2))
+    ]:
+        found, distances = index.nearest(*point, k=k, radius_m=radius_m, labels=allowed)
+        expected, expected_distances = brute_force(lat, lon, labels, point, k, radius_m, allowed)
+        np.testing.assert_allclose(distances, expected_distances)
+        assert set(found.tolist()) == set(expected.tolist())
+
+
+def test_radius_query_at_cell_borders_misses_nothing():
+    # Точки по кругу ровно у границы радиуса, с шагом меньше ячейки
+    angles = np.linspace(0, 2 * np.pi, 360, endpoint=False)
+    lat = CENTER[0] + 0.0089 * np.sin(angles)
+    lon = CENTER[1] + 0.0159 * np.cos(angles)
+    index = GridIndex(lat, lon, cell_m=200)
+    radius = float(haversine_m(*CENTER, lat, lon).max())
+    found, _ = index.nearest(*CENTER, k=None, radius_m=radius)
+    assert len(found) == 360
+
+
+def test_invalid_points_are_never_returned():
+    lat = np.array([CENTER[0], np.nan, CENTER[0] + 0.001])
+    lon = np.array([CENTER[1], CENTER[1], np.nan])
+    found, _ = GridIndex(lat, lon).nearest(*CENTER, k=None)
+    assert found.tolist() == [0]
@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+from caching import SQLiteCache, TTLCache
+from jobs import DONE, FAILED, JobQueue, JobQueueFull
+
+
+class PublicError(Exception):
+    status = 422
+
+
+class FlakyStore(TTLCache):
+    """Хранилище, у которого первые failures вызовов set() падают"""
+
+    def __init__(self, failures=1):
+        super().__init__()
+        self.failures = failures
+
+    def set(self, key, value):
+        if self.failures and value['status'] != 'queued':
+            self.failures -= 1
+            raise ConnectionError('хранилище недоступно')
+        super().set(key, value)
+
+
+def make_queue(run, store=None, **params):
+    params.setdefault('workers', 1)
+    return JobQueue(run, store if store is not None else TTLCache(), public_errors=(PublicError,), **params)
+
+
+def test_jobs_run_and_store_results():
+    jobs = make_queue(lambda payload: payload * 2)
+    submitted = [jobs.submit(i) for i in range(5)]
+    assert jobs.drain(5)
+    assert [jobs.get(job['id'])['result'] for job in submitted] == [0, 2, 4, 6, 8]
+    assert all(jobs.get(job['id'])['status'] == DONE for job in submitted)
+    stats = jobs.stats()
+    assert (stats['submitted'], stats['done'], stats['running'], stats['queued']) == (5, 5, 0, 0)
+
+
+def test_public_errors_are_shown_and_others_hidden():
+    def run(payload):
+        if payload == 'public':
+            raise PublicError('нет мест по запросу')
+        raise RuntimeError('секрет')
+
+    jobs = make_queue(run)
+    public, internal = jobs.submit('public'), jobs.submit('internal')
+    assert jobs.drain(5)
+    assert {key: jobs.get(public['id'])[key] for key in ('status', 'error', 'code')} == {
+        'status': FAILED, 'error': 'нет мест по запросу', 'code': 422}
+    assert {key: jobs.get(internal['id'])[key] for key in ('status', 'error', 'code')} == {
+        'status': FAILED, 'error': 'Internal server error', 'code': 500}
+    assert jobs.stats()['failed'] == 2
+
+
+@pytest.mark.parametrize('failures', [1, 2, 3])
+def test_store_errors_do_not_stop_the_worker(failures):
+    store = FlakyStore(failures)
+    jobs = make_queue(lambda payload: payload, store)
+    submitted = [jobs.submit(i) for i in range(3)]
+    assert jobs.drain(5)
+    # Каждое задание выполнено, обработчик жив и записал итоги, которые смог
+    assert jobs.stats()['done'] == 3
+    assert jobs.stats()['store_errors'] == failures
+    assert jobs.get(submitted[-1]['id'])['result'] == 2
+    later = jobs.submit('еще')
+    assert jobs.drain(5)
+    assert jobs.get(later['id'])['status'] == DONE
+
+
+def test_full_queue_rejects_new_jobs():
+    release = threading.Event()
+    jobs = make_queue(lambda payload: release.wait(5), max_pending=1)
+    jobs.submit('занимает обработчик')
+    for _ in range(100):
+        try:
+            jobs.submit('ждет в очереди')
+        except JobQueueFull:
+            break
+    with pytest.raises(JobQueueFull):
+        jobs.submit('лишнее')
+    release.set()
+    assert jobs.drain(5)
+    assert jobs.stats()['rejected'] >= 1
+
+
+def test_closed_queue_rejects_but_finishes_accepted_jobs():
+    release = threading.Event()
+    jobs = make_queue(lambda payload: release.wait(5) and payload)
+    job = jobs.submit('принято')
+    jobs.close()
+    with pytest.raises(JobQueueFull):
+        jobs.submit('после остановки')
+    assert not jobs.drain(0.05)
+    release.set()
+    assert jobs.drain(5)
+    assert jobs.get(job['id'])['result'] == 'принято'
+
+
+def test_drain_without_jobs_returns_at_once():
+    assert make_queue(lambda payload: payload).drain(0)
+
+
+def test_sqlite_caches_in_one_file_are_independent(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    routes = SQLiteCache(path)
+    jobs = SQLiteCache(path, table='jobs')
+    routes.set('k', {'route': 1})
+    jobs.set('k', {'job': 2})
+    assert SQLiteCache(path).get('k') == {'route': 1}
+    assert SQLiteCache(path, table='jobs').get('k') == {'job': 2}
+    jobs.clear()
+    assert routes.get('k') == {'route': 1}
@@ -0,0 +1,67 @@
+import json
+
+from json_stream import PlacesStreamParser
+
+ROUTE = {
+    "route_name": "Маршрут {не объект} [и не массив]",
+    "places": [
+        {"name": "Кафе \"Ёлка\"", "reason": "кавычки \\\" и обратный слеш \\", "duration": 30},
+        {"name": "Сквер {у} [реки]", "reason": "скобки } ] внутри строки", "duration": 40},
+        {"name": "Музей", "meta": {"hours": {"open": 10, "close": 18}, "tags": [{"id": 1}]}, "duration": 60},
+    ],
+    "timeline": "после places",
+}
+TEXT = "Вот маршрут:\n```json\n" + json.dumps(ROUTE, ensure_ascii=False, indent=1) + "\n```"
+
+
+def feed_all(parser, chunks):
+    places = []
+    for chunk in chunks:
+        places.extend(parser.feed(chunk))
+    return places
+
+
+def test_whole_text_gives_all_places():
+    parser = PlacesStreamParser()
+    assert parser.feed(TEXT) == ROUTE['places']
+    assert parser.text() == TEXT
+
+
+def test_escaped_quotes_and_braces_inside_strings():
+    places = PlacesStreamParser().feed(TEXT)
+    assert places[0]['name'] == 'Кафе "Ёлка"'
+    assert places[0]['reason'] == 'кавычки \\" и обратный слеш \\'
+    assert places[1]['name'] == 'Сквер {у} [реки]'
+
+
+def test_nested_objects_are_part_of_their_place():
+    places = PlacesStreamParser().feed(TEXT)
+    assert len(places) == 3
+    assert places[2]['meta'] == {"hours": {"open": 10, "close": 18}, "tags": [{"id": 1}]}
+
+
+def test_any_chunk_boundaries_give_the_same_places():
+    for size in (1, 2, 3, 7, 64):
+        chunks = [TEXT[i:i + size] for i in range(0, len(TEXT), size)]
+        assert feed_all(PlacesStreamParser(), chunks) == ROUTE['places'], size
+
+
+def test_place_is_returned_as_soon_as_it_closes():
+    parser = PlacesStreamParser()
+    first_end = TEXT.index('"duration": 30') + len('"duration": 30\n  }')
+    assert parser.feed(TEXT[:first_end - 1]) == []
+    assert parser.feed(TEXT[first_end - 1:first_end]) == [ROUTE['places'][0]]
+
+
+def test_only_top_level_places_key_is_parsed():
+    text = json.dumps({
+        "meta": {"places": [{"name": "вложенный"}]},
+        "names": ["places"],
+        "places": [{"name": "верхний"}],
+    }, ensure_ascii=False)
+    assert PlacesStreamParser().feed(text) == [{"name": "верхний"}]
+
+
+def test_broken_object_is_skipped():
+    text = '{"places": [{"name": "Парк", "duration": 40,}, {"name": "Музей"}]}'
+    assert PlacesStreamParser().feed(text) == [{"name": "Музей"}]
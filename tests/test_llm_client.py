@@ -0,0 +1,214 @@
+import json
+import time
+
+import httpx
+import pytest
+
+from circuit_breaker import CircuitBreaker
+from llm_client import LLMCircuitOpen, LLMClient, LLMDeadlineExceeded, LLMError
+
+MESSAGES = [{"role": "user", "content": "маршрут"}]
+
+
+def ok(text='ответ'):
+    return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": text}}]})
+
+
+def make_client(responses, **params):
+    """Клиент, которому сервер по очереди отдает responses (последний повторяется)"""
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        response = responses[min(len(requests), len(responses)) - 1]
+        return response() if callable(response) else response
+
+    params.setdefault('backoff_base', 0)
+    client = LLMClient('test-token', 'model', api_url='http://llm.test/v1/chat/completions',
+                       transport=httpx.MockTransport(handler), **params)
+    return client, requests
+
+
+def test_retries_unavailable_model_until_it_answers():
+    client, requests = make_client([httpx.Response(503), httpx.Response(429), ok('готово')])
+    assert client.chat(MESSAGES, max_retries=4, temperature=0.7) == 'готово'
+    assert len(requests) == 3
+    assert requests[0] == {"model": "model", "messages": MESSAGES, "temperature": 0.7}
+    stats = client.stats()
+    assert (stats['attempts'], stats['retries'], stats['failures']) == (3, 2, 0)
+
+
+def test_client_errors_are_not_retried():
+    client, requests = make_client([httpx.Response(400, text='bad request'), ok()])
+    with pytest.raises(LLMError, match='400'):
+        client.chat(MESSAGES, max_retries=4)
+    assert len(requests) == 1
+    assert client.stats()['failures'] == 1
+
+
+def test_gives_up_after_max_retries():
+    client, requests = make_client([httpx.Response(503)])
+    with pytest.raises(LLMError, match='HTTP 503'):
+        client.chat(MESSAGES, max_retries=3)
+    assert len(requests) == 3
+
+
+def test_retry_that_would_miss_the_deadline_is_not_made():
+    client, requests = make_client([httpx.Response(503, headers={'Retry-After': '5'}), ok()])
+    started = time.monotonic()
+    with pytest.raises(LLMDeadlineExceeded):
+        client.chat(MESSAGES, deadline=time.monotonic() + 1, max_retries=4)
+    assert len(requests) == 1
+    assert time.monotonic() - started < 0.5
+
+
+def test_expired_deadline_sends_nothing():
+    client, requests = make_client([ok()])
+    with pytest.raises(LLMDeadlineExceeded):
+        client.chat(MESSAGES, deadline=time.monotonic() - 1)
+    assert requests == []
+
+
+def test_slow_attempt_is_cut_by_the_deadline():
+    def slow():
+        time.sleep(0.3)
+        raise httpx.ReadTimeout('timeout')
+
+    client, requests = make_client([slow], timeout=0.3, backoff_base=0.5, backoff_max=0.5)
+    with pytest.raises(LLMError):
+        client.chat(MESSAGES, deadline=time.monotonic() + 0.5, max_retries=10)
+    assert len(requests) <= 2
+
+
+def test_missing_token_is_an_error():
+    client = LLMClient(None, 'model', transport=httpx.MockTransport(lambda request: ok()))
+    with pytest.raises(LLMError):
+        client.chat(MESSAGES)
+
+
+@pytest.mark.parametrize('body', [
+    {"choices": [{}]},
+    {"choices": ["текст"]},
+    {"choices": [{"message": None}]},
+    ["choices"],
+    {"choices": []},
+])
+def test_malformed_answer_is_retried_and_counted_as_failure(body):
+    client, requests = make_client([httpx.Response(200, json=body)])
+    with pytest.raises(LLMError, match='некорректный ответ|без choices'):
+        client.chat(MESSAGES, max_retries=2)
+    assert len(requests) == 2
+    assert client.stats()['breaker']['window_calls'] == 1
+    assert client.stats()['breaker']['failure_rate'] == 1.0
+
+
+def test_malformed_answer_is_retried_until_a_good_one():
+    client, requests = make_client([httpx.Response(200, json={"choices": [{}]}), ok('готово')])
+    assert client.chat(MESSAGES, max_retries=2) == 'готово'
+
+
+def sse(*payloads):
+    lines = [f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n" for payload in payloads]
+    return httpx.Response(200, text=''.join(lines), headers={'Content-Type': 'text/event-stream'})
+
+
+def delta(text):
+    return {"choices": [{"delta": {"content": text}}]}
+
+
+def test_stream_yields_deltas_and_retries_before_first_one():
+    client, requests = make_client([httpx.Response(503), sse(delta('Мар'), delta('шрут'), '[DONE]')])
+    assert ''.join(client.stream_chat(MESSAGES, max_retries=2)) == 'Маршрут'
+    assert len(requests) == 2
+    assert requests[1]['stream'] is True
+
+
+@pytest.mark.parametrize('payload', ['["choices"]', {"choices": ["текст"]}, {"choices": [{"delta": "текст"}]}])
+def test_malformed_stream_chunk_is_an_llm_error(payload):
+    client, requests = make_client([sse(payload, '[DONE]')])
+    with pytest.raises(LLMError):
+        list(client.stream_chat(MESSAGES, max_retries=2))
+    assert len(requests) == 2
+
+
+def test_malformed_chunk_after_text_ends_the_stream_with_llm_error():
+    client, requests = make_client([sse(delta('Мар'), '[1]', '[DONE]')])
+    with pytest.raises(LLMError, match='оборвался'):
+        list(client.stream_chat(MESSAGES, max_retries=3))
+    assert len(requests) == 1
+
+
+def test_open_breaker_short_circuits_without_requests():
+    breaker = CircuitBreaker(window=4, min_calls=2, failure_rate=0.5)
+    client, requests = make_client([httpx.Response(503)], breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            client.chat(MESSAGES, max_retries=1)
+    with pytest.raises(LLMCircuitOpen):
+        client.chat(MESSAGES)
+    assert len(requests) == 2
+    assert client.stats()['short_circuited'] == 1
+
+
+def make_hedging_client(answers, samples=5):
+    """Клиент с подстраховкой через 0.25 с; answers: модель -> (задержка, ответ)"""
+    models = []
+
+    def handler(request):
+        model = json.loads(request.content)['model']
+        models.append(model)
+        delay, response = answers[model]
+        time.sleep(delay)
+        return response
+
+    client = LLMClient('test-token', 'model', api_url='http://llm.test/v1/chat/completions',
+                       transport=httpx.MockTransport(handler), backoff_base=0,
+                       hedge_quantile=0.9, hedge_min_samples=5, alt_model='alt')
+    for _ in range(samples):
+        client.latency.observe(0.1)
+    return client, models
+
+
+def test_slow_answer_is_hedged_and_faster_one_wins():
+    client, models = make_hedging_client({'model': (1.0, ok('основная')), 'alt': (0, ok('запасная'))})
+    started = time.monotonic()
+    assert client.chat(MESSAGES, max_retries=1) == 'запасная'
+    assert time.monotonic() - started < 0.8
+    assert models == ['model', 'alt']
+    stats = client.stats()
+    assert (stats['hedged'], stats['hedge_wins'], stats['hedge_win_rate']) == (1, 1, 1.0)
+
+
+def test_fast_answer_is_not_hedged():
+    client, models = make_hedging_client({'model': (0, ok('основная')), 'alt': (0, ok('запасная'))})
+    assert client.chat(MESSAGES) == 'основная'
+    time.sleep(0.3)
+    assert models == ['model']
+    assert client.stats()['hedged'] == 0
+
+
+def test_hedge_waits_for_enough_latency_samples():
+    client, models = make_hedging_client({'model': (0.4, ok('основная')), 'alt': (0, ok('запасная'))}, samples=4)
+    assert client.stats()['hedge_delay'] is None
+    assert client.chat(MESSAGES) == 'основная'
+    assert models == ['model']
+
+
+def test_malformed_primary_answer_does_not_abort_hedge():
+    client, models = make_hedging_client({
+        'model': (0.4, httpx.Response(200, json={"choices": [{}]})),
+        'alt': (0.3, ok('запасная')),
+    })
+    assert client.chat(MESSAGES, max_retries=1) == 'запасная'
+    assert models == ['model', 'alt']
+    assert client.stats()['hedge_wins'] == 1
+
+
+def test_hedge_fails_only_when_both_requests_fail():
+    client, models = make_hedging_client({
+        'model': (0.4, httpx.Response(503)),
+        'alt': (0.1, httpx.Response(200, json=[])),
+    })
+    with pytest.raises(LLMError):
+        client.chat(MESSAGES, max_retries=1)
+    assert sorted(models) == ['alt', 'model']
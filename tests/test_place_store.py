@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from place_store import (
+    PlaceStore, SNAPSHOT_VERSION, load_place_store, load_snapshot, parse_coordinates, save_snapshot
+)
+
+ROWS = [
+    {'id': 1, 'address': 'Нижне-Волжская набережная', 'coordinate': 'POINT(56.331576 44.003277)',
+     'description': 'Памятник "Петру I"', 'title': 'Памятник Петру 1', 'category_id': 1},
+    {'id': 2, 'address': 'Суетинская улица', 'coordinate': 'POINT(56.32448 43.983546)',
+     'description': None, 'title': 'Памятник Максиму Горькому', 'category_id': 1},
+    {'id': 3, 'address': 'Окская набережная', 'coordinate': 'POINT(56.335607 43.97481)',
+     'description': 'Башни', 'title': 'Имитация Шуховских башен', 'category_id': 10},
+]
+
+
+def write_xlsx(path, rows, mtime=None):
+    pd.DataFrame(rows).to_excel(path, index=False)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def assert_same_store(store, other):
+    for column in ('ids', 'category_ids', 'lat', 'lon'):
+        np.testing.assert_array_equal(getattr(store, column), getattr(other, column))
+    assert store.titles == other.titles
+    assert store.addresses == other.addresses
+    assert store.descriptions == other.descriptions
+
+
+def test_snapshot_round_trip(tmp_path):
+    store = PlaceStore.from_frame(pd.DataFrame(ROWS))
+    path = str(tmp_path / 'dataset.npz')
+    save_snapshot(store, path)
+    loaded = load_snapshot(path)
+    assert_same_store(loaded, store)
+    assert loaded.descriptions[1] == ''
+    assert not loaded.lat.flags.writeable
+
+
+def test_snapshot_of_other_version_is_rejected(tmp_path):
+    path = str(tmp_path / 'dataset.npz')
+    save_snapshot(PlaceStore.from_frame(pd.DataFrame(ROWS)), path)
+    with np.load(path) as saved:
+        arrays = dict(saved)
+    arrays['version'] = np.array(SNAPSHOT_VERSION - 1)
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+    with pytest.raises(ValueError):
+        load_snapshot(path)
+
+
+def test_snapshot_is_built_once_and_reused(tmp_path):
+    xlsx, npz = str(tmp_path / 'dataset.xlsx'), str(tmp_path / 'dataset.npz')
+    write_xlsx(xlsx, ROWS)
+    built = load_place_store(xlsx, npz)
+    assert os.path.exists(npz)
+    # Свежий снимок читается без таблицы
+    os.remove(xlsx)
+    assert_same_store(load_place_store(xlsx, npz), built)
+
+
+def test_snapshot_is_rebuilt_when_xlsx_is_newer(tmp_path):
+    xlsx, npz = str(tmp_path / 'dataset.xlsx'), str(tmp_path / 'dataset.npz')
+    write_xlsx(xlsx, ROWS[:2])
+    assert len(load_place_store(xlsx, npz)) == 2
+
+    write_xlsx(xlsx, ROWS, mtime=os.path.getmtime(npz) + 10)
+    store = load_place_store(xlsx, npz)
+    assert len(store) == 3
+    assert len(load_snapshot(npz)) == 3
+
+
+@pytest.mark.parametrize('content', [b'not a snapshot', None])
+def test_broken_or_outdated_snapshot_is_rebuilt(tmp_path, content):
+    xlsx, npz = str(tmp_path / 'dataset.xlsx'), str(tmp_path / 'dataset.npz')
+    write_xlsx(xlsx, ROWS, mtime=1_000_000)
+    if content is None:
+        store = PlaceStore.from_frame(pd.DataFrame(ROWS))
+        save_snapshot(store, npz)
+        with np.load(npz) as saved:
+            arrays = dict(saved, version=np.array(SNAPSHOT_VERSION + 1))
+        with open(npz, 'wb') as f:
+            np.savez(f, **arrays)
+    else:
+        with open(npz, 'wb') as f:
+            f.write(content)
+
+    assert len(load_place_store(xlsx, npz)) == 3
+    with np.load(npz) as saved:
+        assert int(saved['version']) == SNAPSHOT_VERSION
+
+
+def test_coordinates_are_parsed_from_spreadsheet_formats():
+    lat, lon = parse_coordinates(['POINT(56.331576 44.003277)', 'POINT(56.32448 43.983546)',
+                                  ' POINT( 56.335607, 43.97481 ) '])
+    np.testing.assert_allclose(lat, [56.331576, 56.32448, 56.335607])
+    np.testing.assert_allclose(lon, [44.003277, 43.983546, 43.97481])
+    assert lat.dtype == np.float64 and lat.flags.c_contiguous
+
+
+def test_swapped_axes_are_fixed_and_bad_rows_become_nan(capsys):
+    values = [
+        'POINT(56.331576 44.003277)',
+        'POINT(56.32448 43.983546)',
+        'POINT(56.335607 43.97481)',
+        'POINT(43.99 56.32)',          # широта и долгота переставлены
+        'POINT(56.33 56.33)',          # долгота повторяет широту: за 100 км
+        'нет координат',
+        None,
+    ]
+    lat, lon = parse_coordinates(values, ids=[10, 11, 12, 13, 14, 15, 16])
+
+    assert (lat[3], lon[3]) == (56.32, 43.99)
+    assert np.isnan(lat[4:]).all() and np.isnan(lon[4:]).all()
+    assert np.isfinite(lat[:4]).all()
+    report = capsys.readouterr().out
+    assert 'id=13' in report and 'id=14' in report and 'id=15' in report and 'id=16' in report
+    assert 'Мест без координат: 3' in report
+
+
+def test_places_without_coordinates_are_excluded():
+    rows = ROWS + [dict(ROWS[0], id=4, coordinate='POINT(56.33 56.33)', category_id=10)]
+    store = PlaceStore.from_frame(pd.DataFrame(rows))
+    assert store.valid.tolist() == [True, True, True, False]
+    assert store.in_categories([10]).tolist() == [2]
+    assert 3 not in store.nearest(*store.center, k=None)[0]
@@ -0,0 +1,131 @@
+"""Конвейер маршрута целиком: эмбеддинги-заглушка и модель из stub_llm_server"""
+import json
+import time
+
+import pytest
+
+import bot
+import route_explainer
+from conftest import llm_server
+
+CITY = [56.3269, 44.0060]
+
+
+@pytest.fixture
+def client():
+    return route_explainer.flask_app.test_client()
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+def test_generate_route_uses_model_texts(client):
+    requests_before = llm_server.requests
+    response = client.post('/generate_route', json={'query': 'музеи и театры', 'hours': 3, 'startCoord': CITY})
+    assert response.status_code == 200
+    route = response.get_json()
+
+    places = route['places']
+    assert places
+    assert route['route_name'] == 'Прогулка по Нижнему Новгороду'
+    assert route['pending'] is False
+    assert llm_server.requests == requests_before + 1
+    assert len(route['placeIds']) == len(places)
+    assert [place['order'] for place in places] == list(range(1, len(places) + 1))
+    assert all(place['arrival'] + place['time'] <= route['userTime'] for place in places)
+    assert route['legDistances'][0] is not None
+    assert route['timeline'].startswith('0:')
+
+
+def test_missing_query_is_rejected(client):
+    response = client.post('/generate_route', json={'hours': 2})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Query is required'}
+
+
+def test_bot_generate_route_runs_the_same_pipeline():
+    client = bot.flask_app.test_client()
+    response = client.post('/generate_route', json={'query': 'набережные', 'hours': 2, 'minutes': 0,
+                                                     'startCoord': CITY})
+    assert response.status_code == 200
+    route = response.get_json()
+    # "2 ч 0 мин" — это 120 минут, а не 180 по умолчанию
+    assert route['userTime'] == 120
+    assert {'placeIds', 'legDistances', 'timeline'} <= set(route)
+    assert route['legDistances'][0] is not None
+    assert client.post('/generate_route', json={'hours': 1}).status_code == 400
+
+
+def test_same_request_is_answered_from_cache(client):
+    body = {'query': 'парки и набережные', 'hours': 2, 'startCoord': CITY}
+    first = client.post('/generate_route', json=body).get_json()
+    requests_before = llm_server.requests
+    second = client.post('/generate_route', json=body).get_json()
+    assert llm_server.requests == requests_before
+    assert second['places'] == first['places']
+    assert route_explainer.get_route_explainer().cache_stats()['hits'] >= 1
+
+
+def test_bot_shares_the_api_route_cache(client):
+    body = {'query': 'театры и филармонии', 'hours': 3, 'startCoord': CITY}
+    first = client.post('/generate_route', json=body).get_json()
+    requests_before = llm_server.requests
+    from_bot = bot.flask_app.test_client().post('/generate_route', json=body).get_json()
+    assert llm_server.requests == requests_before
+    assert from_bot['places'] == first['places']
+
+
+def test_stream_sends_route_then_places_then_done(client):
+    response = client.post('/generate_route/stream', json={'query': 'памятники и скульптуры', 'hours': 2})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = parse_sse(response.get_data(as_text=True))
+
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == 'route' and kinds[-1] == 'done'
+    assert set(kinds[1:-1]) == {'place'}
+
+    first, done = events[0][1], events[-1][1]
+    assert [place['title'] for place in first['places']] == [place['title'] for place in done['places']]
+    reasons = {data['order']: data['reason'] for kind, data in events if kind == 'place'}
+    for place in done['places']:
+        if place['order'] in reasons:
+            assert place['reason'] == reasons[place['order']]
+
+
+def test_far_start_point_is_ignored(client):
+    route = client.post('/generate_route', json={'query': 'кофейни', 'hours': 2, 'startCoord': [0, 0]}).get_json()
+    assert route['legDistances'][0] is None
+    assert all(leg is None or leg < 100_000 for leg in route['legDistances'])
+    assert route['places'][0]['arrival'] == 0
+
+
+def test_route_fits_the_time_budget(client):
+    route = client.post('/generate_route', json={'query': 'парки', 'hours': 2, 'minutes': 0, 'startCoord': CITY}).get_json()
+    assert route['userTime'] == 120
+    assert 0 < len(route['places']) <= route_explainer.MAX_STOPS
+    last = route['places'][-1]
+    assert last['arrival'] + last['time'] <= 120
+
+
+def test_route_job_is_polled_until_done(client):
+    response = client.post('/routes', json={'query': 'торговые центры', 'hours': 1, 'minutes': 30})
+    assert response.status_code == 202
+    job = response.get_json()
+    assert response.headers['Location'] == f"/routes/{job['id']}"
+
+    deadline = time.monotonic() + 10
+    while job['status'] not in ('done', 'failed') and time.monotonic() < deadline:
+        time.sleep(0.05)
+        job = client.get(f"/routes/{job['id']}").get_json()
+    assert job['status'] == 'done'
+    assert job['result']['places']
+
+
+def test_unknown_job_is_not_found(client):
+    assert client.get('/routes/нет-такого').status_code == 404
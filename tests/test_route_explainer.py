@@ -0,0 +1,177 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from caching import ROUTE_CACHE_CELL_M, TTLCache
+from geo import M_PER_DEG, grid_cell, haversine_m
+import route_explainer
+from route_explainer import RouteExplainer
+
+PLACES = [{'name': 'Кремль', 'category_id': 5}, {'name': 'Чкаловская лестница', 'category_id': 1}]
+CITY = (56.3269, 44.0060)
+
+
+@pytest.fixture
+def explainer():
+    return RouteExplainer(api_token='test-token', cache=TTLCache())
+
+
+def key(explainer, start=None, interests=('музеи',), location=None, places=PLACES, duration=120):
+    return explainer._generate_cache_key(places, list(interests), duration, location, start)
+
+
+def test_grid_cell_is_about_cell_size():
+    row, col = grid_cell(*CITY, ROUTE_CACHE_CELL_M)
+    cell_lat = ROUTE_CACHE_CELL_M / M_PER_DEG
+    border = (row + 1) * cell_lat
+    assert grid_cell(border - 1e-7, CITY[1], ROUTE_CACHE_CELL_M)[0] == row
+    assert grid_cell(border + 1e-7, CITY[1], ROUTE_CACHE_CELL_M)[0] == row + 1
+
+    # Соседние ячейки ряда примерно на cell_m друг от друга и по долготе
+    lon = CITY[1]
+    while grid_cell(CITY[0], lon, ROUTE_CACHE_CELL_M)[1] == col:
+        lon += 1e-5
+    east = lon
+    while grid_cell(CITY[0], lon, ROUTE_CACHE_CELL_M)[1] == col + 1:
+        lon += 1e-5
+    assert haversine_m(CITY[0], east, CITY[0], lon) == pytest.approx(ROUTE_CACHE_CELL_M, rel=0.01)
+
+
+def test_nearby_starts_in_one_cell_share_a_key(explainer):
+    row, col = grid_cell(*CITY, ROUTE_CACHE_CELL_M)
+    cell_lat = ROUTE_CACHE_CELL_M / M_PER_DEG
+    center = ((row + 0.5) * cell_lat, CITY[1])
+    nearby = (center[0] + 0.3 * cell_lat, center[1])
+    assert grid_cell(*nearby, ROUTE_CACHE_CELL_M)[0] == row
+    assert haversine_m(*center, *nearby) < ROUTE_CACHE_CELL_M
+    assert key(explainer, center) == key(explainer, nearby)
+
+
+def test_far_starts_get_different_keys(explainer):
+    far = (CITY[0] + 3 * ROUTE_CACHE_CELL_M / M_PER_DEG, CITY[1])
+    assert key(explainer, CITY) != key(explainer, far)
+
+
+def test_start_from_coordinate_string_matches_parsed_start(explainer):
+    assert key(explainer, location='56.3269, 44.0060') == key(explainer, CITY)
+
+
+def test_interests_and_address_are_normalized(explainer):
+    assert key(explainer, interests=['Музеи  ЁЛКИ']) == key(explainer, interests=['музеи елки'])
+    assert (key(explainer, location='ул. Большая  Покровская') ==
+            key(explainer, location='УЛ. большая покровская'))
+    assert key(explainer, location='Кремль') != key(explainer, location='Вокзал')
+
+
+def test_places_order_does_not_matter_but_duration_does(explainer):
+    assert key(explainer, CITY, places=PLACES[::-1]) == key(explainer, CITY)
+    assert key(explainer, CITY, duration=180) != key(explainer, CITY)
+
+
+@pytest.fixture
+def held_model(explainer):
+    """Модель заглушки отвечает только после release.set(); calls — число обращений"""
+    release = threading.Event()
+    calls = []
+    query = explainer._query_huggingface
+
+    def held(prompt, **params):
+        calls.append(prompt)
+        release.wait(5)
+        return query(prompt, **params)
+
+    explainer._query_huggingface = held
+    yield release, calls
+    release.set()
+
+
+def create(explainer, interests=('музеи',), budget=0.05):
+    return explainer.create_route(PLACES, list(interests), 120, None, start=CITY, budget=budget)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_route_over_budget_is_fallback_and_finished_in_background(explainer, held_model):
+    release, calls = held_model
+    started = time.perf_counter()
+    route = create(explainer)
+    assert time.perf_counter() - started < 1
+    assert route['pending'] is True
+    assert explainer.budget_stats()['expired'] == 1
+
+    # Тот же запрос, пока модель думает, ждет ту же генерацию, а не начинает новую
+    assert create(explainer)['pending'] is True
+    assert len(calls) == 1
+    assert explainer.coalescing_stats()['coalesced'] == 1
+
+    release.set()
+    assert wait_for(lambda: explainer.budget_stats()['background'] == 0)
+    cached = create(explainer)
+    assert 'pending' not in cached
+    assert len(calls) == 1
+    assert explainer.cache_stats()['hits'] >= 1
+
+
+def test_route_within_budget_is_model_answer(explainer, held_model):
+    release, calls = held_model
+    release.set()
+    route = create(explainer, budget=5)
+    assert 'pending' not in route
+    assert explainer.budget_stats()['expired'] == 0
+
+
+def test_no_new_generations_when_background_is_full(explainer, held_model, monkeypatch):
+    release, calls = held_model
+    monkeypatch.setattr(route_explainer, 'ROUTE_BACKGROUND_MAX', 1)
+    assert create(explainer)['pending'] is True
+
+    # Другой маршрут: места в фоне нет, отдаем запасной без генерации
+    dropped = create(explainer, interests=('парки',))
+    assert 'pending' not in dropped
+    assert len(calls) == 1
+    # Уже идущая генерация по-прежнему доступна тем же запросам
+    assert create(explainer)['pending'] is True
+    stats = explainer.budget_stats()
+    assert (stats['requests'], stats['expired'], stats['dropped'], stats['background']) == (3, 2, 1, 1)
+
+    release.set()
+    assert wait_for(lambda: explainer.budget_stats()['background'] == 0)
+    assert 'pending' not in create(explainer, interests=('парки',), budget=5)
+
+
+IMPORT_CHECK = """
+import os, sys, threading
+import route_explainer
+assert threading.active_count() == 1, threading.enumerate()
+assert not os.path.exists(os.environ['ROUTE_CACHE_PATH'])
+assert route_explainer._process_objects == {}
+explainer = route_explainer.get_route_explainer()
+assert route_explainer.get_route_explainer() is explainer
+assert route_explainer.get_route_jobs().stats()['submitted'] == 0
+"""
+
+
+def test_import_has_no_side_effects(tmp_path):
+    # Отдельный процесс: здесь модуль уже импортирован и объекты созданы другими тестами
+    env = dict(os.environ, ROUTE_CACHE_BACKEND='sqlite', ROUTE_CACHE_PATH=str(tmp_path / 'cache.sqlite3'))
+    result = subprocess.run([sys.executable, '-c', IMPORT_CHECK], env=env, capture_output=True, text=True,
+                            timeout=60)
+    assert result.returncode == 0, result.stderr
+
+
+def test_route_explainer_is_recreated_after_fork(monkeypatch):
+    monkeypatch.setattr(route_explainer, '_process_objects', dict(route_explainer._process_objects))
+    explainer = route_explainer.get_route_explainer()
+    assert route_explainer.get_route_explainer() is explainer
+    child_pid = os.getpid() + 1
+    monkeypatch.setattr(route_explainer.os, 'getpid', lambda: child_pid)
+    assert route_explainer.get_route_explainer() is not explainer
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from geo import haversine_m, haversine_matrix
+from route_planner import MAX_STOPS, _nearest_neighbour, select_places, solve_open_path, walking_minutes
+
+START = (56.3269, 44.0060)
+
+
+def path_length(dist, path):
+    return dist[path[:-1], path[1:]].sum()
+
+
+def random_points(seed, n):
+    rng = np.random.default_rng(seed)
+    lat = np.append(START[0], START[0] + rng.normal(0, 0.01, n))
+    lon = np.append(START[1], START[1] + rng.normal(0, 0.02, n))
+    return lat, lon
+
+
+@pytest.mark.parametrize('n', [0, 1, 2])
+def test_open_path_of_few_nodes_is_trivial(n):
+    assert solve_open_path(np.zeros((n, n))).tolist() == list(range(n))
+
+
+def test_open_path_on_a_line_goes_from_start_to_the_end():
+    rng = np.random.default_rng(0)
+    shuffled = rng.permutation(np.arange(1, 12))
+    lat = np.full(12, START[0])
+    lon = START[1] + 0.002 * np.append(0, shuffled)
+    path = solve_open_path(haversine_matrix(lat, lon))
+    assert shuffled[path[1:] - 1].tolist() == list(range(1, 12))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_open_path_of_50_stops_is_a_shorter_permutation(seed):
+    dist = haversine_matrix(*random_points(seed, 50))
+    path = solve_open_path(dist)
+    assert path[0] == 0
+    assert sorted(path.tolist()) == list(range(51))
+    assert path_length(dist, path) <= path_length(dist, _nearest_neighbour(dist)) + 1e-6
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_no_segment_reversal_shortens_the_path(seed):
+    dist = haversine_matrix(*random_points(seed, 30))
+    path = solve_open_path(dist)
+    length = path_length(dist, path)
+    for i in range(1, len(path) - 1):
+        for j in range(i + 1, len(path)):
+            reversed_path = np.concatenate([path[:i], path[i:j + 1][::-1], path[j + 1:]])
+            assert path_length(dist, reversed_path) >= length - 1e-6
+
+
+def line_of_places(n, step_deg=0.002):
+    """Места на одной широте к востоку от START, примерно через 120 м"""
+    lat = np.full(n, START[0])
+    lon = START[1] + step_deg * np.arange(1, n + 1)
+    return lat, lon
+
+
+def test_route_fits_budget_and_times_add_up():
+    rng = np.random.default_rng(1)
+    lat = START[0] + rng.normal(0, 0.01, 20)
+    lon = START[1] + rng.normal(0, 0.02, 20)
+    durations = rng.choice([15, 30, 40], 20)
+    selection = select_places(lat, lon, rng.uniform(0, 1, 20), durations, 180, START)
+
+    order = selection['order']
+    assert 0 < len(order) <= 8
+    assert len(set(order.tolist())) == len(order)
+    assert selection['total_minutes'] <= 180
+
+    walks = selection['walks']
+    stays = durations[order]
+    assert selection['total_minutes'] == pytest.approx(walks.sum() + stays.sum())
+    expected_arrivals = np.cumsum(walks) + np.concatenate(([0], np.cumsum(stays)[:-1]))
+    np.testing.assert_allclose(selection['arrivals'], expected_arrivals)
+    np.testing.assert_allclose(walks, walking_minutes(selection['legs']))
+
+
+def test_first_leg_starts_at_start_point():
+    lat, lon = line_of_places(3)
+    selection = select_places(lat, lon, [1, 1, 1], [10, 10, 10], 120, START)
+    first = selection['order'][0]
+    assert selection['legs'][0] == pytest.approx(haversine_m(*START, lat[first], lon[first]))
+
+
+def test_places_on_a_line_are_visited_in_order():
+    lat, lon = line_of_places(5)
+    selection = select_places(lat, lon, np.ones(5), np.full(5, 10), 240, START)
+    assert selection['order'].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_without_start_first_leg_is_free():
+    lat, lon = line_of_places(3)
+    selection = select_places(lat, lon, [1, 1, 1], [10, 10, 10], 120)
+    assert selection['legs'][0] == 0
+    assert selection['arrivals'][0] == 0
+
+
+def test_prefers_higher_scores_when_budget_is_tight():
+    lat, lon = line_of_places(2, step_deg=0.0001)
+    selection = select_places(lat, lon, [0.1, 0.9], [30, 30], 35, START)
+    assert selection['order'].tolist() == [1]
+
+
+def test_nothing_fits_gives_empty_route():
+    lat, lon = line_of_places(3)
+    selection = select_places(lat, lon, [1, 1, 1], [60, 60, 60], 30, START)
+    assert len(selection['order']) == 0
+    assert selection['total_minutes'] == 0
+
+
+def test_max_stops_limits_route_length():
+    lat, lon = line_of_places(10)
+    selection = select_places(lat, lon, np.ones(10), np.full(10, 5), 600, START, max_stops=3)
+    assert len(selection['order']) == 3
+
+
+def test_without_max_stops_only_budget_limits_route():
+    lat, lon = line_of_places(20)
+    assert len(select_places(lat, lon, np.ones(20), np.full(20, 5), 600, START)['order']) == MAX_STOPS
+    selection = select_places(lat, lon, np.ones(20), np.full(20, 5), 600, START, max_stops=None)
+    assert len(selection['order']) == 20
+    assert selection['total_minutes'] <= 600
@@ -0,0 +1,235 @@
+import runpy
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import embeddings
+import route_explainer
+import vector_index
+from embeddings import StubEmbeddingBackend, cached_embeddings
+from vector_index import ExactVectorIndex, IVFFlatIndex, build_place_index, normalize_rows
+
+
+class UnavailableBackend:
+    """Модель, до которой не достучаться (нет токена, сбой HF)"""
+
+    name = 'remote'
+    model_name = 'unavailable-model'
+
+    def encode(self, texts):
+        return None
+
+
+@pytest.fixture
+def backend():
+    previous = embeddings.get_backend()
+    yield
+    embeddings.set_backend(previous)
+
+
+def test_build_step_does_not_fail_when_model_is_unavailable(backend, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(embeddings, 'EMBEDDINGS_CACHE_DIR', str(tmp_path))
+    embeddings.set_backend(UnavailableBackend())
+    with pytest.raises(SystemExit) as exited:
+        runpy.run_module('vector_index', run_name='__main__')
+    assert exited.value.code == 0
+    assert 'посчитает процесс API' in capsys.readouterr().out
+
+
+def test_build_step_refuses_stub_vectors(backend):
+    embeddings.set_backend(embeddings.StubEmbeddingBackend())
+    with pytest.raises(SystemExit) as exited:
+        runpy.run_module('vector_index', run_name='__main__')
+    assert exited.value.code not in (0, None)
+
+
+def random_vectors(n, dim=32, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def brute_force(vectors, query, k):
+    scores = normalize_rows(vectors) @ normalize_rows(query)[0]
+    return np.argsort(-scores, kind='stable')[:k], scores
+
+
+def test_exact_index_matches_brute_force():
+    vectors, query = random_vectors(500), random_vectors(1, seed=1)
+    index = ExactVectorIndex(vectors)
+    rows, scores = index.search(query, k=10)
+    expected, all_scores = brute_force(vectors, query, 10)
+    assert rows.tolist() == expected.tolist()
+    np.testing.assert_allclose(scores, all_scores[expected], rtol=1e-5)
+
+
+def test_exact_index_searches_subset_with_bias():
+    vectors, query = random_vectors(100), random_vectors(1, seed=1)
+    index = ExactVectorIndex(vectors)
+    subset = np.arange(0, 100, 3)
+    bias = np.zeros(100)
+    bias[subset[:5]] = 10.0
+    bias[subset[5]] = -np.inf
+    rows, scores = index.search(query, k=None, indices=subset, bias=bias)
+    assert set(rows[:5].tolist()) == set(subset[:5].tolist())
+    assert subset[5] not in rows
+    assert set(rows.tolist()) <= set(subset.tolist())
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_exact_index_add_continues_row_numbers():
+    vectors = random_vectors(20)
+    index = ExactVectorIndex(vectors[:15])
+    index.add(vectors[15:])
+    assert len(index) == 20
+    rows, _ = index.search(vectors[17], k=1)
+    assert rows.tolist() == [17]
+
+
+def test_place_index_is_built_in_background(monkeypatch):
+    release = threading.Event()
+    built = ExactVectorIndex(random_vectors(5))
+
+    def slow_build(store):
+        release.wait(5)
+        return built
+
+    monkeypatch.setattr(route_explainer, '_place_index', None)
+    monkeypatch.setattr(route_explainer, '_place_index_failed_at', 0.0)
+    monkeypatch.setattr(route_explainer, 'build_place_index', slow_build)
+
+    started = time.perf_counter()
+    assert route_explainer.get_place_index(store=None) is None
+    assert route_explainer.get_place_index(store=None) is None
+    assert time.perf_counter() - started < 0.5
+    release.set()
+    deadline = time.monotonic() + 5
+    while route_explainer.get_place_index(store=None) is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert route_explainer.get_place_index(store=None) is built
+
+
+def clustered_vectors(n, seed=0, dim=32, clusters=40):
+    rng = np.random.default_rng(seed)
+    centers = np.random.default_rng(100).normal(size=(clusters, dim))
+    return (centers[rng.integers(0, clusters, n)] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def recall(index, exact, queries, k=10, **params):
+    found = [len(set(index.search(query, k, **params)[0]) & set(exact.search(query, k)[0])) for query in queries]
+    return sum(found) / (k * len(queries))
+
+
+@pytest.fixture(scope='module')
+def ivf():
+    vectors = clustered_vectors(3000)
+    return vectors, IVFFlatIndex.train(vectors, n_probe=16), ExactVectorIndex(vectors)
+
+
+def test_ivf_recall_grows_with_n_probe(ivf):
+    _, index, exact = ivf
+    queries = clustered_vectors(50, seed=1)
+    assert recall(index, exact, queries) >= 0.95
+    assert recall(index, exact, queries, n_probe=len(index.centroids)) == 1.0
+    assert recall(index, exact, queries, n_probe=1) < recall(index, exact, queries)
+
+
+def test_ivf_subset_search_is_exact(ivf):
+    vectors, index, exact = ivf
+    subset = np.arange(0, 3000, 7)
+    query = clustered_vectors(1, seed=2)
+    rows, scores = index.search(query, k=5, indices=subset)
+    expected_rows, expected_scores = exact.search(query, k=5, indices=subset)
+    assert rows.tolist() == expected_rows.tolist()
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+
+def test_ivf_add_keeps_centroids_and_finds_new_rows():
+    vectors = clustered_vectors(1200)
+    index = IVFFlatIndex.train(vectors[:1000], row_keys=[str(i) for i in range(1000)])
+    centroids = index.centroids.copy()
+    index.add(vectors[1000:], row_keys=[str(i) for i in range(1000, 1200)])
+
+    assert len(index) == 1200
+    assert index.row_keys == [str(i) for i in range(1200)]
+    np.testing.assert_array_equal(index.centroids, centroids)
+    np.testing.assert_allclose(index.vectors, normalize_rows(vectors), rtol=1e-6)
+    for row in (1000, 1111, 1199):
+        assert index.search(vectors[row], k=1, n_probe=len(index.centroids))[0].tolist() == [row]
+
+
+def test_ivf_save_and_load(tmp_path, ivf):
+    _, index, _ = ivf
+    path = str(tmp_path / 'index.npz')
+    index.row_keys = None
+    index.save(path)
+    loaded = IVFFlatIndex.load(path, n_probe=16)
+    query = clustered_vectors(1, seed=3)
+    assert loaded.row_keys is None
+    assert loaded.search(query, k=10)[0].tolist() == index.search(query, k=10)[0].tolist()
+
+
+class Store:
+    def __init__(self, titles):
+        self.titles = titles
+        self.descriptions = [''] * len(titles)
+
+
+class CountingBackend(StubEmbeddingBackend):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(len(texts))
+        return super().encode(texts)
+
+
+def test_cached_embeddings_encodes_only_new_texts_in_chunks(tmp_path):
+    backend = CountingBackend()
+    texts = [f"Место {i}" for i in range(10)]
+    first = cached_embeddings(texts, 'places', backend=backend, cache_dir=str(tmp_path), chunk_size=4)
+    assert backend.calls == [4, 4, 2]
+
+    backend.calls.clear()
+    again = cached_embeddings(texts, 'places', backend=backend, cache_dir=str(tmp_path), chunk_size=4)
+    assert backend.calls == []
+    np.testing.assert_array_equal(again, first)
+
+    grown = cached_embeddings(texts + ['Новое место'], 'places', backend=backend, cache_dir=str(tmp_path))
+    assert backend.calls == [1]
+    np.testing.assert_allclose(grown, backend.encode(texts + ['Новое место']))
+
+
+def test_partial_progress_is_saved_when_backend_fails(tmp_path):
+    backend = CountingBackend()
+    texts = [f"Место {i}" for i in range(6)]
+    encode = backend.encode
+    backend.encode = lambda chunk: None if backend.calls else encode(chunk)
+    assert cached_embeddings(texts, 'places', backend=backend, cache_dir=str(tmp_path), chunk_size=3) is None
+
+    backend.encode = encode
+    backend.calls.clear()
+    assert cached_embeddings(texts, 'places', backend=backend, cache_dir=str(tmp_path), chunk_size=3) is not None
+    assert backend.calls == [3]
+
+
+def test_place_index_adds_appended_places_without_retraining(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index, 'EMBEDDINGS_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(embeddings, 'EMBEDDINGS_CACHE_DIR', str(tmp_path))
+    backend = CountingBackend()
+    titles = [f"Место номер {i}" for i in range(60)]
+
+    index = build_place_index(Store(titles[:50]), backend=backend, ann_min_size=10)
+    assert isinstance(index, IVFFlatIndex) and len(index) == 50
+
+    trained = []
+    monkeypatch.setattr(IVFFlatIndex, 'train', classmethod(lambda cls, *args, **kwargs: trained.append(1)))
+    grown = build_place_index(Store(titles), backend=backend, ann_min_size=10)
+    assert trained == []
+    assert len(grown) == 60
+    np.testing.assert_allclose(grown.centroids, index.centroids, atol=1e-6)
+    assert grown.search(backend.encode([titles[55]])[0], k=1, n_probe=len(grown.centroids))[0].tolist() == [55]
+
+    reloaded = build_place_index(Store(titles), backend=backend, ann_min_size=10)
+    assert len(reloaded) == 60 and trained == []
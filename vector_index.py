@@ -0,0 +1,298 @@
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from embeddings import EMBEDDINGS_CACHE_DIR, cached_embeddings, embeddings_cache_key, get_backend, text_key
+
+# С какого числа мест вместо точного перебора используется приближенный индекс IVF
+VECTOR_INDEX_ANN_MIN_SIZE = int(os.getenv('VECTOR_INDEX_ANN_MIN_SIZE', 20000))
+# Сколько списков IVF просматривает запрос: больше — выше полнота и медленнее поиск
+VECTOR_INDEX_N_PROBE = int(os.getenv('VECTOR_INDEX_N_PROBE', 16))
+# Увеличивается при изменении формата файла индекса
+IVF_INDEX_VERSION = 2
+# Строк на одно матричное умножение при раскладке векторов по центроидам
+_ASSIGN_CHUNK = 16384
+
+
+def normalize_rows(vectors):
+    """L2-нормированная копия матрицы (n, dim) в float32; нулевые строки остаются нулевыми"""
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors
+
+
+def top_k(scores, k):
+    """Позиции k наибольших значений scores в порядке убывания"""
+    if k is None or k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+class ExactVectorIndex:
+    """Точный поиск по косинусной близости над нормированной матрицей векторов.
+
+    Запрос — одно матричное умножение и argpartition по всем строкам.
+    """
+
+    def __init__(self, vectors):
+        self.vectors = normalize_rows(vectors)
+        self.vectors.flags.writeable = False
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    def add(self, vectors):
+        """Добавляет строки в конец индекса, их номера продолжают существующие"""
+        self.vectors = np.concatenate([self.vectors, normalize_rows(vectors)])
+        self.vectors.flags.writeable = False
+
+    def search(self, query, k=10, indices=None, bias=None):
+        """До k ближайших к query строк: индексы и оценки по убыванию.
+
+        indices ограничивает поиск подмножеством строк. bias — добавка к
+        косинусной близости для каждой строки индекса (массив длины len(self)),
+        например оценка категории места; -inf исключает строку.
+        """
+        query = normalize_rows(query)[0]
+        if indices is None:
+            scores = self.vectors @ query
+            rows = None
+        else:
+            rows = np.asarray(indices, dtype=np.int64)
+            scores = self.vectors[rows] @ query
+        if bias is not None:
+            scores = scores + (bias if rows is None else bias[rows])
+
+        top = top_k(scores, k)
+        top = top[np.isfinite(scores[top])]
+        return (top if rows is None else rows[top]), scores[top]
+
+
+def _nearest_centroids(vectors, centroids):
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for begin in range(0, len(vectors), _ASSIGN_CHUNK):
+        chunk = vectors[begin:begin + _ASSIGN_CHUNK]
+        assignments[begin:begin + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(vectors, n_lists, iterations=10, sample_size=None, seed=0):
+    """Центроиды сферического k-means по случайной выборке векторов"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), sample_size or n_lists * 64)
+    sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _nearest_centroids(sample, centroids)
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=n_lists)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+        centroids[filled] = normalize_rows(sums)
+        # Пустые списки получают случайные точки выборки, чтобы не пропадать
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return centroids
+
+
+class IVFFlatIndex:
+    """Приближенный поиск по косинусной близости (IVF-flat).
+
+    Векторы разложены по спискам вокруг центроидов k-means и хранятся
+    подряд внутри списка. Запрос сравнивается с центроидами и точно
+    перебирает только n_probe ближайших списков; n_probe задает компромисс
+    между полнотой и временем запроса. Новые векторы добавляются в
+    существующие списки без переобучения центроидов.
+
+    row_keys — необязательные ключи строк (например, text_key текстов),
+    они сохраняются вместе с индексом и показывают, какие строки в нем уже есть.
+    """
+
+    def __init__(self, centroids, vectors, assignments, n_probe=VECTOR_INDEX_N_PROBE, row_keys=None):
+        self.centroids = normalize_rows(centroids)
+        self.n_probe = n_probe
+        self.row_keys = list(row_keys) if row_keys is not None else None
+        self._build(normalize_rows(vectors), np.asarray(assignments, dtype=np.int32))
+
+    @classmethod
+    def train(cls, vectors, n_lists=None, n_probe=VECTOR_INDEX_N_PROBE, iterations=10, seed=0, row_keys=None):
+        vectors = normalize_rows(vectors)
+        if n_lists is None:
+            n_lists = max(1, int(round(4 * math.sqrt(len(vectors)))))
+        n_lists = min(n_lists, len(vectors))
+        centroids = train_centroids(vectors, n_lists, iterations=iterations, seed=seed)
+        return cls(centroids, vectors, _nearest_centroids(vectors, centroids), n_probe=n_probe, row_keys=row_keys)
+
+    def _build(self, vectors, assignments):
+        # Векторы одного списка лежат подряд: запрос умножает непрерывные блоки
+        order = np.argsort(assignments, kind='stable')
+        self._assignments = assignments
+        self._vectors = vectors[order]
+        self._rows = order
+        self._positions = np.empty(len(order), dtype=np.int64)
+        self._positions[order] = np.arange(len(order))
+        counts = np.bincount(assignments, minlength=len(self.centroids))
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def __len__(self):
+        return len(self._vectors)
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    @property
+    def vectors(self):
+        """Векторы в порядке номеров строк (копия)"""
+        return self._vectors[self._positions]
+
+    def add(self, vectors, row_keys=None):
+        """Добавляет строки в конец индекса, их номера продолжают существующие"""
+        vectors = normalize_rows(vectors)
+        if self.row_keys is not None and row_keys is not None:
+            self.row_keys = self.row_keys + list(row_keys)
+        else:
+            self.row_keys = None
+        self._build(
+            np.concatenate([self.vectors, vectors]),
+            np.concatenate([self._assignments, _nearest_centroids(vectors, self.centroids)]),
+        )
+
+    def search(self, query, k=10, indices=None, bias=None, n_probe=None):
+        """Тот же интерфейс, что у ExactVectorIndex.search.
+
+        С indices перебирается точно только это подмножество строк, иначе
+        просматриваются n_probe (по умолчанию self.n_probe) ближайших списков.
+        """
+        query = normalize_rows(query)[0]
+        if indices is not None:
+            rows = np.asarray(indices, dtype=np.int64)
+            scores = self._vectors[self._positions[rows]] @ query
+        else:
+            n_probe = min(n_probe or self.n_probe, len(self.centroids))
+            lists = top_k(self.centroids @ query, n_probe)
+            blocks = [(self._offsets[i], self._offsets[i + 1]) for i in lists]
+            scores = np.concatenate([self._vectors[begin:end] @ query for begin, end in blocks])
+            rows = np.concatenate([self._rows[begin:end] for begin, end in blocks])
+        if bias is not None:
+            scores = scores + bias[rows]
+
+        top = top_k(scores, k)
+        top = top[np.isfinite(scores[top])]
+        return rows[top], scores[top]
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                version=np.array(IVF_INDEX_VERSION),
+                centroids=self.centroids,
+                vectors=self.vectors,
+                assignments=self._assignments,
+                row_keys=np.array(self.row_keys if self.row_keys is not None else [], dtype=str),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, n_probe=VECTOR_INDEX_N_PROBE):
+        with np.load(path, allow_pickle=False) as saved:
+            if int(saved['version']) != IVF_INDEX_VERSION:
+                raise ValueError(f"устаревшая версия индекса: {int(saved['version'])}")
+            row_keys = saved['row_keys'].tolist()
+            return cls(saved['centroids'], saved['vectors'], saved['assignments'], n_probe=n_probe,
+                       row_keys=row_keys if len(row_keys) == len(saved['vectors']) else None)
+
+
+def place_texts(store):
+    """Текст места для эмбеддинга: название и описание"""
+    return [
+        f"{title}. {description}" if description else title
+        for title, description in zip(store.titles, store.descriptions)
+    ]
+
+
+def build_place_index(store, backend=None, ann_min_size=VECTOR_INDEX_ANN_MIN_SIZE):
+    """Индекс эмбеддингов мест хранилища или None, если их не удалось получить.
+
+    Эмбеддинги хранятся в embeddings_cache построчно, при изменении
+    датасета движок считает только новые места. Начиная с ann_min_size мест
+    строится IVFFlatIndex, он тоже сохраняется на диск; места, дописанные
+    в конец датасета, добавляются в сохраненный индекс без переобучения.
+    """
+    texts = place_texts(store)
+    embeddings = cached_embeddings(texts, 'places', backend=backend)
+    if embeddings is None:
+        return None
+    if len(texts) < ann_min_size:
+        return ExactVectorIndex(embeddings)
+
+    backend = backend or get_backend()
+    keys = [text_key(text) for text in texts]
+    path = os.path.join(EMBEDDINGS_CACHE_DIR, f"places-ivf-{embeddings_cache_key(backend)}.npz")
+    index = None
+    if os.path.exists(path):
+        try:
+            index = IVFFlatIndex.load(path)
+        except Exception as e:
+            print(f"⚠️ Не удалось прочитать {path}: {e}")
+
+    if index is not None and index.row_keys == keys:
+        print(f"✅ Индекс IVF мест загружен из {path}")
+        return index
+    if index is not None and index.row_keys is not None and index.row_keys == keys[:len(index)]:
+        added = len(keys) - len(index)
+        index.add(embeddings[len(index):], row_keys=keys[len(index):])
+        print(f"➕ В индекс IVF из {path} добавлено мест: {added}")
+    else:
+        index = IVFFlatIndex.train(embeddings, row_keys=keys)
+    try:
+        index.save(path)
+        print(f"💾 Индекс IVF мест сохранен в {path}")
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить {path}: {e}")
+    return index
+
+
+if __name__ == "__main__":
+    # Шаг сборки: python vector_index.py [dataset.xlsx] — заранее считает эмбеддинги мест и
+    # категорий в embeddings_cache, чтобы процесс API не ходил за ними в модель при старте
+    from place_store import DATASET_PATH, load_place_store
+    from route_explainer import category_names
+
+    backend = get_backend()
+    if backend.name == 'stub':
+        sys.exit("❌ EMBEDDING_BACKEND=stub: векторы заглушки не годятся для поставки, задайте remote или local")
+
+    path = sys.argv[1] if len(sys.argv) > 1 else DATASET_PATH
+    store = load_place_store(path)
+
+    # Недоступная модель (нет токена, сбой HF) не должна срывать выпуск: чего нет в
+    # embeddings_cache, процесс API досчитает сам, пока запросы идут без индекса мест
+    started = time.perf_counter()
+    if cached_embeddings(category_names, 'categories', backend=backend) is None:
+        print("⚠️ Не удалось получить эмбеддинги категорий, их посчитает процесс API")
+        sys.exit(0)
+    print(f"⏱ Эмбеддинги категорий: {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    started = time.perf_counter()
+    index = build_place_index(store, backend=backend)
+    if index is None:
+        print("⚠️ Не удалось получить эмбеддинги мест, индекс построит процесс API")
+        sys.exit(0)
+    print(f"⏱ Индекс мест: {len(index)} x {index.dim}, {(time.perf_counter() - started) * 1000:.1f} мс")
@@ -0,0 +1,16 @@
+"""Точка входа для продакшена: gunicorn -c gunicorn.conf.py wsgi:app
+
+Модуль загружается в мастер-процессе gunicorn до fork (preload_app):
+датасет, эмбеддинги и индекс мест читаются один раз, а рабочие процессы
+делят их страницы памяти copy-on-write. Telegram-бот здесь не запускается.
+"""
+import gc
+
+from route_explainer import flask_app, warm_up
+
+warm_up()
+# Объекты, созданные при загрузке, больше не просматриваются сборщиком мусора:
+# иначе он трогал бы их заголовки в каждом процессе и страницы копировались бы
+gc.freeze()
+
+app = flask_app